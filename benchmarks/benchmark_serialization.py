@@ -0,0 +1,91 @@
+"""
+Mide filas/s de la serialización de puntos de datos (`/api/data/points` y
+`data_points` de `/api/nlp/query`): la ruta anterior (validación Pydantic de
+cada fila + encoder por defecto) frente a orjson sobre las tuplas.
+"""
+import argparse
+import json
+import random
+import time
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from src.core.serialization import DATA_POINT_FIELDS, DataPoint, data_point_rows, dumps, ndjson
+
+POINTS_ADAPTER = TypeAdapter(List[DataPoint])
+
+
+def synthetic_rows(count: int) -> List[tuple]:
+    """Tuplas como las que devuelve `select(*DATA_POINT_COLUMNS)`"""
+    rng = random.Random(0)
+    brands = [f"Marca {i}" for i in range(50)]
+    categories = ["ropa/hombre/camisetas", "ropa/mujer", "calzado/deportivo", "electro/tv"]
+    values = {
+        "desc_ga_marca_producto": lambda i: rng.choice(brands),
+        "desc_categoria_producto": lambda i: rng.choice(categories),
+        "desc_categoria_prod_principal": lambda i: rng.choice(categories).split("/")[0],
+        "desc_ga_nombre_producto_1": lambda i: f"Producto {i % 5000}",
+        "desc_ga_sku_producto_1": lambda i: f"SKU-{i % 5000:05d}",
+        "fc_ingreso_producto_monto": lambda i: round(rng.uniform(0, 500), 2),
+        "desc_ga_categoria_producto": lambda i: None,
+        "desc_ga_cod_producto": lambda i: float(i % 997),
+    }
+    return [
+        tuple(values.get(name, lambda i: rng.randint(0, 10**6))(i) for name in DATA_POINT_FIELDS)
+        for i in range(count)
+    ]
+
+
+def pydantic_json(rows: List[tuple]) -> bytes:
+    """Ruta anterior: dict -> validación de `DataPoint` -> jsonable_encoder -> json.dumps"""
+    points = POINTS_ADAPTER.validate_python(data_point_rows(rows), from_attributes=True)
+    return json.dumps(jsonable_encoder(points)).encode("utf-8")
+
+
+def pydantic_ndjson(rows: List[tuple]) -> bytes:
+    return "".join(
+        DataPoint(**row).model_dump_json() + "\n" for row in data_point_rows(rows)
+    ).encode("utf-8")
+
+
+def orjson_json(rows: List[tuple]) -> bytes:
+    return dumps(data_point_rows(rows))
+
+
+def orjson_ndjson(rows: List[tuple]) -> bytes:
+    return ndjson(data_point_rows(rows))
+
+
+def measure(name: str, fn: Callable[[List[tuple]], bytes], rows: List[tuple], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(rows)
+        best = min(best, time.perf_counter() - start)
+    rate = len(rows) / best
+    print(f"{name:<22} {rate:>12,.0f} filas/s  ({best * 1000:8.1f} ms, {len(body) / 2**20:6.1f} MiB)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="Filas por respuesta")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    assert json.loads(pydantic_json(rows)) == json.loads(orjson_json(rows))
+
+    print(f"Serialización de {args.rows} puntos de datos")
+    before = measure("JSON Pydantic", pydantic_json, rows, args.repeat)
+    after = measure("JSON orjson", orjson_json, rows, args.repeat)
+    print(f"{'':<22} x{after / before:.1f}")
+    before = measure("NDJSON Pydantic", pydantic_ndjson, rows, args.repeat)
+    after = measure("NDJSON orjson", orjson_ndjson, rows, args.repeat)
+    print(f"{'':<22} x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 import csv
+import logging
 import re
 import os
-import psycopg2
 from dotenv import load_dotenv
-import pandas as pd
 from sqlalchemy import create_engine
 
+from src.core.csv_loader import load_csv
+from src.core.dataset_version import read_dataset_version
+
 # Copiado de: https://github.com/juanluisacebal/airflow_mis_dags/blob/main/CSV_SERVER_CSV_upload_ctas_postgres.py
 
 
@@ -26,19 +28,14 @@ LOCAL_CSV = os.path.join(BASE_DIR, "files", "Data_example_-_Python_Coding_Challe
 def load_csv_and_create_table_postgres():
     """
     Carga un CSV local y lo inserta en PostgreSQL.
-    1. Crea una tabla staging.
-    2. Inserta los datos.
-    3. Crea la tabla final `challenge_graphql_nlp_api`.
+    1. Si el fichero no ha cambiado desde la última carga, no hace nada.
+    2. Inserta los datos por lotes con COPY (en una tabla de staging que
+       sustituye a `challenge_graphql_nlp_api`, o de forma incremental
+       según `CSV_LOAD_MODE`), materializa la jerarquía de categorías,
+       recalcula las tablas de rollup y publica la versión nueva de los
+       datos (invalida las cachés de la API), todo en una transacción.
     """
     print("Cargando CSV y creando tabla en PostgreSQL...")
-    connection = psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        dbname=PG_DATABASE
-    )
-    cursor = connection.cursor()
 
     print("Leyendo y parseando CSV...")
     print(f"Ruta absoluta esperada del CSV: {LOCAL_CSV}")
@@ -56,24 +53,17 @@ def load_csv_and_create_table_postgres():
     if not os.path.exists(LOCAL_CSV):
         raise FileNotFoundError(f"❌ No se encontró el archivo CSV en {LOCAL_CSV}. Verifica que esté en la ruta esperada.")
 
-    print("Cargando CSV con pandas...")
-    df = pd.read_csv(LOCAL_CSV)
-
-    print("Insertando CSV como tabla en PostgreSQL...")
+    print("Insertando CSV en PostgreSQL con COPY...")
     engine = create_engine(f"postgresql+psycopg2://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DATABASE}")
-    df.to_sql("stg_challenge_graphql_nlp_api", engine, index=False, if_exists="replace")
+    rows = load_csv(engine, LOCAL_CSV)
+    if rows is None:
+        return
 
-    # 3. Crear tabla final
-    print("Creando tabla final...")
-    cursor.execute("""
-        DROP TABLE IF EXISTS challenge_graphql_nlp_api;
-        CREATE TABLE challenge_graphql_nlp_api AS
-        SELECT * FROM stg_challenge_graphql_nlp_api;
-    """)
-    connection.commit()
-    connection.close()
+    version = read_dataset_version(engine)
+    print(f"✅ Versión de datos publicada: {version}")
 
 
 if __name__ == "__main__":
     print("Main")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     load_csv_and_create_table_postgres()
\ No newline at end of file
@@ -1,12 +1,22 @@
-from fastapi import FastAPI
+import logging
+import os
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from strawberry.fastapi import GraphQLRouter
 
 from .data_service.routes import router as data_router
 from .nlp_service.routes import router as nlp_router
+from .graphql_service.loaders import get_context
+from .graphql_service.persisted import PersistedQueryRouter
 from .graphql_service.schema import schema
+from ..core.auth import get_current_user
+from ..core.database import pool_metrics
 from ..core.init_db import init_db
 
+# Nivel de los logs de la aplicación (cargas del CSV, versiones de los datos, copia en memoria)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 app = FastAPI(
     title="Challenge GraphQL & NLP API",
     description="API con servicios GraphQL y NLP para análisis de datos",
@@ -30,9 +40,14 @@ app.include_router(data_router, prefix="/api/data", tags=["Data Service"])
 app.include_router(nlp_router, prefix="/api/nlp", tags=["NLP Service"])
 
 # GraphQL
-graphql_app = GraphQLRouter(schema)
+graphql_app = PersistedQueryRouter(schema, context_getter=get_context)
 app.include_router(graphql_app, prefix="/graphql", tags=["GraphQL"])
 
 @app.get("/")
 async def root():
-    return {"message": "Challenge GraphQL & NLP API"} 
\ No newline at end of file
+    return {"message": "Challenge GraphQL & NLP API"} 
+
+@app.get("/metrics/pool", tags=["Metrics"])
+async def database_pool_metrics(current_user: dict = Depends(get_current_user)):
+    """Conexiones del pool de la base de datos (en uso, libres y overflow)"""
+    return pool_metrics()
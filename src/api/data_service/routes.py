@@ -1,97 +1,116 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+import os
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Iterator, List, Optional
 from datetime import datetime
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
-from ...core.database import get_db
+from ...core.database import get_async_db, AsyncSessionLocal
 from ...core.models import ChallengeData
 from ...core.auth import get_current_user
+from ...core.queries import PAGE_ORDER, data_points_query, decode_page_cursor, encode_page_cursor
+from ...core.categories import CategoryMatch, load_category_tree
+from ...core.aggregation import MAX_AGGREGATE_ROWS, filter_clauses, metric_label
+from ...core.rollups import aggregate, aggregation_from_request, dimension_filters
+from ...core.snapshot import ColumnarSnapshot, active_snapshot
+from ...core.response_cache import response_cache
+from ...core.serialization import (
+    DATA_POINT_COLUMNS,
+    DATA_POINT_FIELDS,
+    DataPoint,
+    category_dicts,
+    data_point_rows,
+    dumps,
+    ndjson,
+)
+from ...core.export import (
+    export_filename,
+    export_media_type,
+    stream_columnar,
+    stream_csv,
+    validate_export,
+)
+from ..nlp_service.llm_client import LLMOverloadedError
+from ..nlp_service.nlp_processor import nlp_processor
 
 router = APIRouter()
 
-class DataPoint(BaseModel):
-    id_tie_fecha_valor: Optional[int] = None
-    id_cli_cliente: Optional[int] = None
-    #id_ga_vista: Optional[int] = None
-    #id_ga_tipo_dispositivo: Optional[int] = None
-    id_ga_fuente_medio: Optional[int] = None
-    #desc_ga_sku_producto: Optional[str] = None
-    desc_ga_categoria_producto: Optional[float] = None
-    fc_agregado_carrito_cant: Optional[int] = None
-    fc_ingreso_producto_monto: Optional[float] = None
-    #fc_retirado_carrito_cant: Optional[float] = None
-    fc_detalle_producto_cant: Optional[int] = None
-    fc_producto_cant: Optional[int] = None
-    #desc_ga_nombre_producto: Optional[float] = None
-    #fc_visualizaciones_pag_cant: Optional[float] = None
-    flag_pipol: Optional[int] = None
-    #sasasa: Optional[str] = None
-    id_ga_producto: Optional[int] = None
-    desc_ga_nombre_producto_1: Optional[str] = None
-    desc_ga_sku_producto_1: Optional[str] = None
-    desc_ga_marca_producto: Optional[str] = None
-    desc_ga_cod_producto: Optional[float] = None
-    desc_categoria_producto: Optional[str] = None
-    desc_categoria_prod_principal: Optional[str] = None
-
-    class Config:
-        orm_mode = True
+# Tamaño máximo de página y de lote al leer con cursor de servidor
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "10000"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
 
 class CategoryResponse(BaseModel):
     path: str
     name: str
     children: List['CategoryResponse'] = []
 
-    class Config:
-        orm_mode = True
+class AggregateResponse(BaseModel):
+    source: str
+    group_by: List[str]
+    metrics: List[str]
+    rows: List[dict]
 
 @router.get("/categories", response_model=List[CategoryResponse])
 async def get_categories(
-    db: Session = Depends(get_db),
+    request: Request,
+    path: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Obtiene la estructura jerárquica de categorías.
     
     Args:
+        path: Ruta de categoría para devolver solo su subárbol (ej: "ropa/hombre")
         db: Sesión de la base de datos
         current_user: Usuario autenticado
     
     Returns:
         List[CategoryResponse]: Lista de categorías con su estructura jerárquica
     """
+    cache_key = response_cache.key("data:categories", {"path": path})
+    cached = await response_cache.lookup(request, cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        # Obtener todos los productos para construir el árbol de categorías
-        products = db.query(ChallengeData).all()
-        
-        # Construir el árbol de categorías
-        root = CategoryResponse(path="", name="root", children=[])
-        category_map = {"": root}
-        
-        for product in products:
-            if product.desc_categoria_producto:
-                paths = product.desc_categoria_producto.split(",")
-                for path in paths:
-                    parts = path.strip().split('/')
-                    current_path = ""
-                    for part in parts:
-                        parent_path = current_path
-                        current_path = f"{current_path}/{part}" if current_path else part
-                        if current_path not in category_map:
-                            category = CategoryResponse(path=current_path, name=part, children=[])
-                            category_map[current_path] = category
-                            category_map[parent_path].children.append(category)        
-        return root.children
+        # La jerarquía se materializa en la carga; aquí solo se lee
+        categories = await db.run_sync(load_category_tree, path)
+        return await response_cache.store(cache_key, dumps(category_dicts(categories)), db=db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _stream_data_points(stmt: Select) -> AsyncIterator[bytes]:
+    """
+    Genera los puntos de datos como NDJSON leyendo con un cursor de servidor.
+
+    Usa su propia sesión porque la respuesta se sigue enviando después de
+    que FastAPI cierre las dependencias de la petición.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for batch in result.partitions():
+            yield ndjson(data_point_rows(batch))
+
+def _stream_snapshot_points(snapshot: ColumnarSnapshot, mask, limit: Optional[int]) -> Iterator[bytes]:
+    """Como `_stream_data_points`, leyendo de la copia en memoria por lotes"""
+    for batch in snapshot.batches(mask, STREAM_BATCH_SIZE, limit, DATA_POINT_FIELDS):
+        yield ndjson(batch)
+
 @router.get("/points", response_model=List[DataPoint])
 async def get_data_points(
+    request: Request,
     category: Optional[str] = None,
+    category_match: CategoryMatch = CategoryMatch.DESCENDANTS,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -99,58 +118,260 @@ async def get_data_points(
     
     Args:
         category: Ruta de categoría para filtrar (ej: "ropa/hombre/camisetas")
+        category_match: `exact` solo esa categoría, `descendants` también sus subcategorías
         start_date: Fecha de inicio
         end_date: Fecha de fin
+        limit: Tamaño de página; si hay más filas se devuelve la cabecera `X-Next-Cursor`
+        after: Cursor `X-Next-Cursor` de la página anterior (`<id_tie_fecha_valor>:<row_id>`)
+        stream: Si es True, devuelve NDJSON en streaming sin cargar toda la tabla
         db: Sesión de la base de datos
         current_user: Usuario autenticado
     
     Returns:
         List[DataPoint]: Lista de puntos de datos que coinciden con los filtros
     """
+    # Las páginas se cachean por versión de los datos; el streaming no
+    cache_key = None if stream else response_cache.key("data:points", {
+        "category": category,
+        "category_match": category_match.value,
+        "start_date": start_date,
+        "end_date": end_date,
+        "limit": limit,
+        "after": after,
+    })
+    cached = await response_cache.lookup(request, cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        query = db.query(ChallengeData)
-        
-        if category:
-            # Filtrar por categoría usando la nueva estructura
-            query = query.filter(
-                ChallengeData.desc_categoria_producto.like(f"%{category}%")
+        cursor = decode_page_cursor(after) if after is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Con DATA_ENGINE=memory se responde desde la copia en columnas
+        snapshot = active_snapshot()
+        if snapshot is not None:
+            mask = snapshot.points_mask(category, start_date, end_date, cursor, category_match)
+            if stream:
+                return StreamingResponse(
+                    _stream_snapshot_points(snapshot, mask, limit),
+                    media_type="application/x-ndjson"
+                )
+            data_points = snapshot.rows(mask, DATA_POINT_FIELDS, limit + 1 if limit is not None else None)
+            headers = {}
+            if limit is not None and len(data_points) > limit:
+                data_points = data_points[:limit]
+                headers["X-Next-Cursor"] = encode_page_cursor(data_points[-1])
+            return await response_cache.store(cache_key, dumps(data_points), headers, db=db)
+
+        # Se leen tuplas con las columnas de `DataPoint`, sin entidades ORM
+        if stream:
+            stmt = data_points_query(
+                category, start_date, end_date, cursor, limit, category_match,
+                columns=DATA_POINT_COLUMNS
             )
-        
-        if start_date:
-            query = query.filter(ChallengeData.id_tie_fecha_valor >= start_date)
-        
-        if end_date:
-            query = query.filter(ChallengeData.id_tie_fecha_valor <= end_date)
-        
-        return query.all()
+            if cursor is None and limit is None:
+                # Orden estable para poder reanudar el stream con `after`
+                stmt = stmt.order_by(*PAGE_ORDER)
+            return StreamingResponse(
+                _stream_data_points(stmt),
+                media_type="application/x-ndjson"
+            )
+
+        # Se pide una fila de más para saber si existe una página siguiente
+        stmt = data_points_query(
+            category, start_date, end_date, cursor,
+            limit + 1 if limit is not None else None,
+            category_match,
+            columns=DATA_POINT_COLUMNS
+        )
+        data_points = data_point_rows(await db.execute(stmt))
+
+        headers = {}
+        if limit is not None and len(data_points) > limit:
+            data_points = data_points[:limit]
+            headers["X-Next-Cursor"] = encode_page_cursor(data_points[-1])
+
+        return await response_cache.store(cache_key, dumps(data_points), headers, db=db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/points/{point_id}", response_model=DataPoint)
+@router.get("/points/{row_id}", response_model=DataPoint)
 async def get_data_point(
-    point_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    row_id: int,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Obtiene un punto de datos específico por ID.
+    Obtiene un punto de datos específico por su `row_id`.
     
     Args:
-        point_id: ID del punto de datos
+        row_id: Identificador de la fila (`row_id` de `DataPoint`)
         db: Sesión de la base de datos
         current_user: Usuario autenticado
     
     Returns:
         DataPoint: El punto de datos solicitado
     """
+    cache_key = response_cache.key("data:point", {"row_id": row_id})
+    cached = await response_cache.lookup(request, cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        data_point = db.query(ChallengeData).filter(
-            ChallengeData.id_tie_fecha_valor == point_id
-        ).first()
+        snapshot = active_snapshot()
+        if snapshot is not None:
+            data_point = snapshot.get(row_id, DATA_POINT_FIELDS)
+        else:
+            rows = data_point_rows(await db.execute(
+                select(*DATA_POINT_COLUMNS).where(ChallengeData.row_id == row_id)
+            ))
+            data_point = rows[0] if rows else None
         
         if not data_point:
             raise HTTPException(status_code=404, detail="Punto de datos no encontrado")
         
-        return data_point
+        return await response_cache.store(cache_key, dumps(data_point), db=db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/aggregate", response_model=AggregateResponse)
+async def get_aggregate(
+    request: Request,
+    group_by: List[str] = Query([]),
+    metrics: List[str] = Query([]),
+    brand: Optional[str] = None,
+    main_category: Optional[str] = None,
+    source: Optional[int] = None,
+    start_date: Optional[int] = None,
+    end_date: Optional[int] = None,
+    order: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_AGGREGATE_ROWS),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Totales agrupados, calculados a partir de los rollups de la carga.
+    
+    Si ningún rollup cubre la agrupación, los filtros y las métricas, se
+    agrega en vivo sobre la tabla de datos (o sobre la copia en memoria con
+    `DATA_ENGINE=memory`).
+    
+    Args:
+        group_by: Columnas de agrupación (ej: `desc_ga_marca_producto`)
+        metrics: Métricas como `sum(fc_ingreso_producto_monto)` o `count(*)`;
+            por defecto ingresos, agregados al carrito y vistas de producto
+        brand: Marca (`desc_ga_marca_producto`)
+        main_category: Categoría principal (`desc_categoria_prod_principal`)
+        source: Fuente/medio (`id_ga_fuente_medio`)
+        start_date: `id_tie_fecha_valor` mínimo
+        end_date: `id_tie_fecha_valor` máximo
+        order: `asc` o `desc` según la primera métrica
+        limit: Número máximo de grupos
+        db: Sesión de la base de datos
+        current_user: Usuario autenticado
+    
+    Returns:
+        AggregateResponse: Grupos con sus métricas y la tabla de la que salen
+    """
+    try:
+        aggregation = aggregation_from_request(group_by, metrics, order, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = dimension_filters(brand, main_category, source, start_date, end_date)
+
+    cache_key = response_cache.key("data:aggregate", {"aggregation": aggregation, "filters": filters})
+    cached = await response_cache.lookup(request, cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        snapshot = active_snapshot()
+        if snapshot is not None:
+            rows, table = snapshot.aggregate(aggregation, filters), "memory"
+        else:
+            rows, table = await db.run_sync(aggregate, aggregation, filters)
+        return await response_cache.store(cache_key, dumps({
+            "source": table,
+            "group_by": aggregation["group_by"],
+            "metrics": [metric_label(m) for m in aggregation["metrics"]],
+            "rows": rows,
+        }), db=db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export")
+async def export_data_points(
+    format: str = "csv",
+    category: Optional[str] = None,
+    category_match: CategoryMatch = CategoryMatch.DESCENDANTS,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    nlp_query: Optional[str] = None,
+    columns: List[str] = Query([]),
+    limit: Optional[int] = Query(None, ge=1),
+    compression: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Exporta puntos de datos en bloque, en streaming desde PostgreSQL.
+    
+    El CSV se genera con `COPY ... TO STDOUT`; Arrow IPC y Parquet (con
+    pyarrow) se construyen por lotes leídos con un cursor de servidor. La
+    memoria no depende del número de filas exportadas.
+    
+    Args:
+        format: `csv`, `arrow` (Arrow IPC stream) o `parquet`
+        category: Ruta de categoría para filtrar (ej: "ropa/hombre/camisetas")
+        category_match: `exact` solo esa categoría, `descendants` también sus subcategorías
+        start_date: Fecha de inicio
+        end_date: Fecha de fin
+        nlp_query: Consulta en lenguaje natural cuyos filtros se aplican también
+        columns: Columnas a exportar (por defecto las de `DataPoint`)
+        limit: Número máximo de filas
+        compression: `gzip` para CSV, `lz4`/`zstd` para Arrow y
+            `snappy`/`zstd`/`gzip` para Parquet
+        db: Sesión de la base de datos
+        current_user: Usuario autenticado
+    
+    Returns:
+        StreamingResponse: Fichero descargable con las filas, ordenadas por id
+    """
+    unknown = [name for name in columns if name not in DATA_POINT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Columnas desconocidas: {', '.join(unknown)}")
+    try:
+        validate_export(format, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        selected = [getattr(ChallengeData, name) for name in columns] or DATA_POINT_COLUMNS
+        stmt = data_points_query(
+            category, start_date, end_date,
+            limit=limit, category_match=category_match, columns=selected
+        ).order_by(None).order_by(*PAGE_ORDER)
+        if nlp_query:
+            filters = await nlp_processor.translate_filters(nlp_query, db)
+            stmt = stmt.where(and_(*filter_clauses(filters)))
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if format == "csv":
+        content = stream_csv(stmt, compression)
+    else:
+        content = stream_columnar(stmt, selected, format, compression)
+    return StreamingResponse(
+        content,
+        media_type=export_media_type(format, compression),
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format, compression)}"'}
+    )
@@ -0,0 +1,332 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from graphql import (
+    ExecutionResult,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLNonNull,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    VariableNode,
+    is_composite_type,
+    value_from_ast_untyped,
+)
+from strawberry.extensions import SchemaExtension
+
+from ...core.auth import get_current_user_from_request
+
+# Límites por petición y por usuario
+MAX_QUERY_DEPTH = int(os.getenv("GRAPHQL_MAX_DEPTH", "10"))
+MAX_QUERY_COST = int(os.getenv("GRAPHQL_MAX_COST", "10000"))
+MAX_USER_COST = int(os.getenv("GRAPHQL_MAX_USER_COST", "100000"))
+USER_COST_WINDOW = float(os.getenv("GRAPHQL_USER_COST_WINDOW", "60"))
+# Usuarios con coste en la ventana que se recuerdan como máximo
+MAX_TRACKED_USERS = int(os.getenv("GRAPHQL_MAX_TRACKED_USERS", "10000"))
+
+# Clave del contexto con el coste calculado de la operación
+QUERY_COST = "query_cost"
+
+# Coste propio de los campos que acceden a la base de datos ("Tipo.campo")
+FIELD_COSTS: Dict[str, int] = {
+    "Query.categories": 5,
+    "Query.getDataPoints": 10,
+    "Query.dataPointsConnection": 5,
+    "Query.getDataPoint": 1,
+    "Query.getDataPointsByBrand": 5,
+    "Query.aggregate": 10,
+    "DataPointConnection.totalCount": 10,
+    "DataPointConnection.estimatedCount": 1,
+}
+
+# Tamaño supuesto de las listas sin argumento de paginación
+LIST_SIZES: Dict[str, int] = {
+    "Query.categories": 50,
+    "Query.getDataPoints": 1000,
+    "Query.getDataPointsByBrand": 1000,
+    "Category.children": 10,
+}
+DEFAULT_LIST_SIZE = 10
+
+# Argumentos que fijan el tamaño de una página
+PAGE_SIZE_ARGUMENTS = ("first", "limit")
+
+# Coste de cada objeto devuelto (los escalares no suman)
+OBJECT_COST = 1
+
+
+def _unwrap(graphql_type) -> Tuple[object, bool]:
+    """Devuelve el tipo con nombre y si es una lista"""
+    is_list = False
+    while isinstance(graphql_type, (GraphQLNonNull, GraphQLList)):
+        if isinstance(graphql_type, GraphQLList):
+            is_list = True
+        graphql_type = graphql_type.of_type
+    return graphql_type, is_list
+
+
+class _CostCalculator:
+    """Calcula coste y profundidad de una operación recorriendo su AST"""
+
+    def __init__(self, schema, document, variables: Optional[dict]):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+
+    def operation_cost(self, operation: OperationDefinitionNode) -> Tuple[int, int]:
+        root_type = self.schema.get_root_type(operation.operation)
+        return self._selection_cost(root_type, operation.selection_set, 0, None, set())
+
+    def _selection_cost(self, parent_type, selection_set, depth, page_size, visited) -> Tuple[int, int]:
+        cost, max_depth = 0, depth
+        if selection_set is None:
+            return cost, max_depth
+
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self._field_cost(parent_type, selection, depth + 1, page_size, visited)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                field_cost, field_depth = self._selection_cost(
+                    fragment_type, selection.selection_set, depth, page_size, visited
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in visited:
+                    continue
+                field_cost, field_depth = self._selection_cost(
+                    self.schema.get_type(fragment.type_condition.name.value),
+                    fragment.selection_set, depth, page_size, visited | {name}
+                )
+            else:
+                continue
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+
+        return cost, max_depth
+
+    def _field_cost(self, parent_type, node: FieldNode, depth, page_size, visited) -> Tuple[int, int]:
+        name = node.name.value
+        if name.startswith("__") or not hasattr(parent_type, "fields"):
+            return 0, depth
+        field = parent_type.fields.get(name)
+        if field is None:
+            return 0, depth
+
+        coordinate = f"{parent_type.name}.{name}"
+        field_type, is_list = _unwrap(field.type)
+        own_page_size = self._page_size(field, node)
+
+        children_cost, children_depth = self._selection_cost(
+            field_type, node.selection_set, depth, own_page_size, visited
+        )
+        if is_composite_type(field_type):
+            children_cost += OBJECT_COST
+
+        multiplier = 1
+        if is_list:
+            multiplier = own_page_size or page_size or LIST_SIZES.get(coordinate, DEFAULT_LIST_SIZE)
+
+        return FIELD_COSTS.get(coordinate, 0) + multiplier * children_cost, children_depth
+
+    def _page_size(self, field, node: FieldNode) -> Optional[int]:
+        values = {}
+        for argument in node.arguments or ():
+            if isinstance(argument.value, VariableNode):
+                values[argument.name.value] = self.variables.get(argument.value.name.value)
+            else:
+                values[argument.name.value] = value_from_ast_untyped(argument.value)
+
+        for name in PAGE_SIZE_ARGUMENTS:
+            if name not in field.args:
+                continue
+            value = values.get(name, field.args[name].default_value)
+            if isinstance(value, int) and value > 0:
+                return value
+        return None
+
+
+class UserCostLedger:
+    """
+    Coste gastado por cada usuario en una ventana deslizante.
+
+    Los usuarios se guardan por orden de su último cargo: al registrar un
+    cargo se eliminan los que ya no tienen ninguno dentro de la ventana y,
+    si aun así quedan más de `max_users`, los de cargo más antiguo.
+    Consultar el gasto de un usuario no crea su entrada.
+    """
+
+    def __init__(self, max_users: int = MAX_TRACKED_USERS):
+        self.max_users = max_users
+        self._costs: "OrderedDict[str, Deque[Tuple[float, int]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._costs)
+
+    def spent(self, subject: str, window: float) -> int:
+        """Coste del usuario dentro de la ventana"""
+        costs = self._costs.get(subject)
+        if costs is None:
+            return 0
+        limit = time.monotonic() - window
+        while costs and costs[0][0] < limit:
+            costs.popleft()
+        if not costs:
+            del self._costs[subject]
+            return 0
+        return sum(cost for _, cost in costs)
+
+    def charge(self, subject: str, cost: int, window: float):
+        """Registra el coste de una operación del usuario"""
+        now = time.monotonic()
+        costs = self._costs.pop(subject, None) or deque()
+        costs.append((now, cost))
+        self._costs[subject] = costs
+
+        limit = now - window
+        while self._costs:
+            _, oldest = next(iter(self._costs.items()))
+            if oldest[-1][0] >= limit:
+                break
+            self._costs.popitem(last=False)
+        while len(self._costs) > self.max_users:
+            self._costs.popitem(last=False)
+
+
+user_costs = UserCostLedger()
+
+
+def charge_user(
+    subject: str,
+    cost: int,
+    max_user_cost: int = MAX_USER_COST,
+    window: float = USER_COST_WINDOW,
+    ledger: UserCostLedger = user_costs,
+) -> Tuple[int, Optional[str]]:
+    """
+    Carga el coste de una operación al presupuesto del usuario.
+
+    Returns:
+        Tuple[int, Optional[str]]: Coste del usuario en la ventana y, si la
+        operación lo supera, el mensaje de error (entonces no se carga)
+    """
+    spent = ledger.spent(subject, window)
+    if spent + cost > max_user_cost:
+        return spent, (
+            f"Se ha superado el coste máximo por usuario en {int(window)}s "
+            f"({spent + cost} > {max_user_cost})"
+        )
+    ledger.charge(subject, cost, window)
+    return spent + cost, None
+
+
+class QueryCostLimiter(SchemaExtension):
+    """
+    Análisis estático de coste y profundidad de las consultas GraphQL.
+
+    Antes de ejecutar ningún resolver calcula el coste de la operación
+    (coste propio de cada campo más el de sus hijos multiplicado por el
+    tamaño de las listas) y su profundidad. Rechaza la operación si supera
+    `max_depth` o `max_cost`, o si el usuario (el `sub` del token) supera
+    `max_user_cost` en la ventana de `user_window` segundos. El coste
+    calculado se devuelve en `extensions.cost` de la respuesta y se deja en
+    el contexto (`QUERY_COST`) para cobrarlo también cuando la respuesta se
+    sirve desde la caché.
+    """
+
+    def __init__(
+        self,
+        *,
+        execution_context=None,
+        max_depth: int = MAX_QUERY_DEPTH,
+        max_cost: int = MAX_QUERY_COST,
+        max_user_cost: int = MAX_USER_COST,
+        user_window: float = USER_COST_WINDOW,
+        ledger: UserCostLedger = user_costs,
+    ):
+        if execution_context is not None:
+            self.execution_context = execution_context
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.max_user_cost = max_user_cost
+        self.user_window = user_window
+        self.ledger = ledger
+        self._report: Optional[dict] = None
+
+    async def on_execute(self):
+        context = self.execution_context
+        document = context.graphql_document
+        operation = self._operation(document, context.operation_name)
+
+        if operation is not None:
+            calculator = _CostCalculator(context.schema._schema, document, context.variables)
+            cost, depth = calculator.operation_cost(operation)
+            subject = await self._subject(context.context)
+            self._report = {
+                "requestedQueryCost": cost,
+                "maximumAvailable": self.max_cost,
+                "depth": depth,
+                "maximumDepth": self.max_depth,
+                "userCostInWindow": self.ledger.spent(subject, self.user_window),
+                "maximumUserCost": self.max_user_cost,
+            }
+
+            error = None
+            if depth > self.max_depth:
+                error = f"La consulta supera la profundidad máxima ({depth} > {self.max_depth})"
+            elif cost > self.max_cost:
+                error = f"La consulta supera el coste máximo ({cost} > {self.max_cost})"
+            else:
+                user_cost, error = charge_user(
+                    subject, cost, self.max_user_cost, self.user_window, self.ledger
+                )
+                self._report["userCostInWindow"] = user_cost
+
+            if error:
+                # Con el resultado ya fijado Strawberry no ejecuta los resolvers
+                context.result = ExecutionResult(data=None, errors=[GraphQLError(error)])
+            elif isinstance(context.context, dict):
+                context.context[QUERY_COST] = cost
+
+        yield
+
+    def get_results(self):
+        if self._report is None:
+            return {}
+        return {"cost": self._report}
+
+    @staticmethod
+    def _operation(document, operation_name: Optional[str]) -> Optional[OperationDefinitionNode]:
+        operations = [
+            definition for definition in document.definitions
+            if isinstance(definition, OperationDefinitionNode)
+        ]
+        if operation_name:
+            for operation in operations:
+                if operation.name and operation.name.value == operation_name:
+                    return operation
+            return None
+        return operations[0] if len(operations) == 1 else None
+
+    @staticmethod
+    async def _subject(context) -> str:
+        request = context.get("request") if isinstance(context, dict) else getattr(context, "request", None)
+        if request is None:
+            return "anonymous"
+        try:
+            user = await get_current_user_from_request(request)
+        except Exception:
+            return "anonymous"
+        return user.get("sub") or "anonymous"
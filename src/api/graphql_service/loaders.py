@@ -0,0 +1,159 @@
+import asyncio
+from collections import defaultdict
+from functools import partial
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from strawberry.dataloader import DataLoader
+
+from ...core.categories import load_category_trees
+from ...core.database import get_async_db
+from ...core.models import CategoryNode, ChallengeData
+from ...core.queries import PAGE_ORDER
+from ...core.snapshot import active_snapshot
+
+# Clave de los loaders de puntos: (valor buscado, columnas proyectadas)
+ProjectedKey = Tuple[object, Tuple[str, ...]]
+
+
+class RequestSession:
+    """
+    Sesión asíncrona compartida por los resolvers de una petición GraphQL.
+
+    `AsyncSession` no admite operaciones concurrentes y graphql-core
+    ejecuta a la vez los resolvers de un mismo nivel, así que un lock
+    serializa el acceso. Los resultados de `execute` vienen ya leídos.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self._lock = asyncio.Lock()
+
+    async def execute(self, stmt):
+        async with self._lock:
+            return await self.session.execute(stmt)
+
+    async def run_sync(self, fn, *args):
+        """Ejecuta `fn(session_sincrona, *args)` sobre la conexión asíncrona"""
+        async with self._lock:
+            return await self.session.run_sync(fn, *args)
+
+
+def column_names(columns: Sequence) -> Tuple[str, ...]:
+    """Nombres de las columnas proyectadas, para usarlos como parte de la clave"""
+    return tuple(column.key for column in columns)
+
+
+def _group_by_columns(keys: List[ProjectedKey]) -> Dict[Tuple[str, ...], List[object]]:
+    """Agrupa las claves por proyección: una consulta por cada conjunto de columnas"""
+    groups: Dict[Tuple[str, ...], List[object]] = defaultdict(list)
+    for value, columns in keys:
+        if value not in groups[columns]:
+            groups[columns].append(value)
+    return groups
+
+
+async def load_data_points(db: RequestSession, keys: List[ProjectedKey]) -> List[Optional[dict]]:
+    """
+    Carga puntos de datos por `row_id` con `WHERE row_id IN (...)`.
+
+    Returns:
+        List[Optional[dict]]: Fila de cada clave (o None si no existe)
+    """
+    snapshot = active_snapshot()
+    if snapshot is not None:
+        return [snapshot.get(row_id, columns) for row_id, columns in keys]
+
+    found: Dict[ProjectedKey, dict] = {}
+    for columns, ids in _group_by_columns(keys).items():
+        stmt = select(*[getattr(ChallengeData, c) for c in columns]).where(
+            ChallengeData.row_id.in_(ids)
+        )
+        for row in await db.execute(stmt):
+            values = dict(row._mapping)
+            found[(values["row_id"], columns)] = values
+    return [found.get(key) for key in keys]
+
+
+async def first_data_point_of_date(db: RequestSession, date_id: int, columns: Sequence) -> Optional[dict]:
+    """
+    Primera fila (por `row_id`) con ese `id_tie_fecha_valor`.
+
+    Solo para el argumento obsoleto `idTieFechaValor` de `getDataPoint`,
+    que antes de `row_id` identificaba así un punto.
+    """
+    snapshot = active_snapshot()
+    if snapshot is not None:
+        mask = snapshot.filters_mask({"id_tie_fecha_valor": {"op": "=", "value": date_id}})
+        rows = snapshot.rows(mask, column_names(columns), 1)
+    else:
+        stmt = (
+            select(*columns)
+            .where(ChallengeData.id_tie_fecha_valor == date_id)
+            .order_by(*PAGE_ORDER)
+            .limit(1)
+        )
+        rows = [dict(row._mapping) for row in await db.execute(stmt)]
+    return rows[0] if rows else None
+
+
+async def load_data_points_by_brand(db: RequestSession, keys: List[ProjectedKey]) -> List[List[dict]]:
+    """
+    Carga los puntos de datos de varias marcas con `WHERE marca IN (...)`.
+
+    Returns:
+        List[List[dict]]: Filas de cada marca, ordenadas por `(id_tie_fecha_valor, row_id)`
+    """
+    snapshot = active_snapshot()
+    if snapshot is not None:
+        return [
+            snapshot.rows(snapshot.filters_mask({"desc_ga_marca_producto": {"op": "=", "value": brand}}), columns)
+            for brand, columns in keys
+        ]
+
+    found: Dict[ProjectedKey, List[dict]] = defaultdict(list)
+    brand_column = ChallengeData.desc_ga_marca_producto
+    for columns, brands in _group_by_columns(keys).items():
+        stmt = (
+            select(brand_column.label("_brand"), *[getattr(ChallengeData, c) for c in columns])
+            .where(brand_column.in_(brands))
+            .order_by(*PAGE_ORDER)
+        )
+        for row in await db.execute(stmt):
+            values = dict(row._mapping)
+            found[(values.pop("_brand"), columns)].append(values)
+    return [found.get(key, []) for key in keys]
+
+
+async def load_categories(db: RequestSession, paths: List[Optional[str]]) -> List[List[CategoryNode]]:
+    """Carga los subárboles de varias rutas de categoría con una sola lectura"""
+    return await db.run_sync(load_category_trees, paths)
+
+
+class DataLoaders:
+    """
+    DataLoaders de una petición GraphQL.
+
+    Se crean en el contexto de cada petición: las claves pedidas en el
+    mismo ciclo del event loop se resuelven con una sola consulta y los
+    resultados se cachean hasta que termina la petición. Todos usan la
+    sesión de la petición.
+    """
+
+    def __init__(self, db: RequestSession):
+        self.data_points = DataLoader(load_fn=partial(load_data_points, db))
+        self.data_points_by_brand = DataLoader(load_fn=partial(load_data_points_by_brand, db))
+        self.categories = DataLoader(load_fn=partial(load_categories, db))
+
+
+async def get_context(session: AsyncSession = Depends(get_async_db)) -> dict:
+    """
+    Contexto de cada petición GraphQL (se combina con `request` y `response`).
+
+    La sesión se obtiene con `get_async_db`, así que FastAPI la cierra (y
+    devuelve la conexión al pool) al terminar la petición.
+    """
+    db = RequestSession(session)
+    return {"db": db, "loaders": DataLoaders(db)}
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from graphql import GraphQLError
+from strawberry.fastapi import GraphQLRouter
+from strawberry.types import ExecutionResult
+from strawberry.types.unset import UNSET
+
+from ...core.auth import get_current_user_from_request
+from ...core.response_cache import CacheKey, response_cache
+from ...core.serialization import dumps
+from .cost import QUERY_COST, charge_user
+
+# Configuración de las consultas persistidas (APQ)
+PERSISTED_QUERIES_MAX_ENTRIES = int(os.getenv("GRAPHQL_PERSISTED_QUERIES_MAX_ENTRIES", "1024"))
+PERSISTED_QUERIES_FILE = os.getenv("GRAPHQL_PERSISTED_QUERIES_FILE")
+PERSISTED_QUERIES_ONLY = os.getenv("GRAPHQL_PERSISTED_QUERIES_ONLY", "false").lower() == "true"
+
+
+NOT_ALLOWED_MESSAGE = "Solo se permiten consultas persistidas registradas"
+
+# Clave del contexto que marca una respuesta con errores (no se cachea)
+UNCACHEABLE = "uncacheable"
+# Cabecera con el coste de la operación, para cobrarlo al servirla desde la caché
+COST_HEADER = "X-GraphQL-Cost"
+
+
+def query_hash(query: str) -> str:
+    """SHA-256 en hexadecimal del texto de la consulta"""
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def _persisted_error(message: str, code: str) -> ExecutionResult:
+    return ExecutionResult(
+        data=None,
+        errors=[GraphQLError(message, extensions={"code": code})],
+    )
+
+
+class PersistedQueryStore:
+    """
+    Almacén de consultas persistidas hash -> texto de la consulta.
+
+    Las consultas registradas en `allow_list` (cargadas de un fichero) no
+    caducan; las registradas por los clientes se expulsan por LRU. En modo
+    `only_allow_list` solo se aceptan los hashes de la lista.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PERSISTED_QUERIES_MAX_ENTRIES,
+        allow_list: Optional[Dict[str, str]] = None,
+        only_allow_list: bool = PERSISTED_QUERIES_ONLY,
+    ):
+        self.max_entries = max_entries
+        self.allow_list = dict(allow_list or {})
+        self.only_allow_list = only_allow_list
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = PERSISTED_QUERIES_FILE, **kwargs) -> "PersistedQueryStore":
+        """
+        Crea el almacén cargando la lista de consultas permitidas.
+
+        El fichero es un JSON con un objeto hash -> consulta o una lista de
+        consultas (el hash se calcula al cargarlas).
+        """
+        allow_list: Dict[str, str] = {}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                data = {query_hash(query): query for query in data}
+            for sha256, query in data.items():
+                if query_hash(query) != sha256:
+                    raise ValueError(f"El hash {sha256} no corresponde a su consulta en {path}")
+                allow_list[sha256] = query
+            print(f"✅ {len(allow_list)} consultas GraphQL persistidas cargadas de {path}")
+        return cls(allow_list=allow_list, **kwargs)
+
+    def get(self, sha256: str) -> Optional[str]:
+        query = self.allow_list.get(sha256)
+        if query is not None or self.only_allow_list:
+            return query
+        query = self._entries.get(sha256)
+        if query is not None:
+            self._entries.move_to_end(sha256)
+        return query
+
+    def register(self, sha256: str, query: str):
+        if sha256 in self.allow_list:
+            return
+        self._entries[sha256] = query
+        self._entries.move_to_end(sha256)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def is_allowed(self, query: str) -> bool:
+        return not self.only_allow_list or query_hash(query) in self.allow_list
+
+
+class PersistedQueryRouter(GraphQLRouter):
+    """
+    Router GraphQL con soporte de consultas persistidas automáticas (APQ).
+
+    Sigue el protocolo de Apollo: el cliente envía
+    `extensions.persistedQuery.sha256Hash` sin la consulta; si el hash no
+    está registrado se responde `PersistedQueryNotFound` y el cliente
+    reenvía la consulta completa junto con el hash para registrarla.
+
+    Las respuestas sin errores de peticiones autenticadas se guardan en la
+    caché de respuestas, con la consulta (o su hash), las variables y la
+    operación como clave. Una respuesta servida desde la caché cuesta al
+    usuario lo mismo que ejecutarla (ver `cost.charge_user`); solo las
+    revalidaciones que terminan en 304 no se cobran.
+    """
+
+    def __init__(self, schema, *args, store: Optional[PersistedQueryStore] = None, **kwargs):
+        super().__init__(schema, *args, **kwargs)
+        self.persisted_queries = store if store is not None else PersistedQueryStore.from_file()
+
+    def should_render_graphql_ide(self, request) -> bool:
+        # Un GET con solo el hash es una consulta persistida, no una petición del IDE
+        if "persistedQuery" in (request.query_params.get("extensions") or ""):
+            return False
+        return super().should_render_graphql_ide(request)
+
+    def encode_json(self, data) -> bytes:
+        return dumps(data)
+
+    async def run(self, request, context=UNSET, root_value=UNSET):
+        if request.scope["type"] != "http":
+            return await super().run(request, context=context, root_value=root_value)
+
+        user = await self._user(request)
+        cache_key = await self._cache_key(request) if user is not None else None
+        cached = await response_cache.lookup(request, cache_key)
+        if cached is not None:
+            return self._charge_cached(cached, user.get("sub") or "anonymous")
+
+        response = await super().run(request, context=context, root_value=root_value)
+        if cache_key is None or response.status_code != 200 or context.get(UNCACHEABLE):
+            return response
+        headers = {COST_HEADER: str(context.get(QUERY_COST, 0))}
+        return await response_cache.store(cache_key, response.body, headers, db=context["db"])
+
+    def _charge_cached(self, cached: Response, subject: str) -> Response:
+        """Cobra al usuario el coste de la respuesta cacheada, o la rechaza si no le queda"""
+        if cached.status_code == 304:
+            return cached
+        _, error = charge_user(subject, int(cached.headers.get(COST_HEADER, "0")))
+        if error is None:
+            return cached
+        return Response(
+            self.encode_json({"data": None, "errors": [{"message": error}]}),
+            media_type="application/json"
+        )
+
+    @staticmethod
+    async def _user(request: Request) -> Optional[dict]:
+        """Usuario del token de la petición, o None si no hay token válido"""
+        try:
+            return await get_current_user_from_request(request)
+        except Exception:
+            return None
+
+    async def execute_single(self, *args, request_data, **kwargs) -> ExecutionResult:
+        result = self._resolve_persisted_query(request_data)
+        if result is None:
+            result = await super().execute_single(*args, request_data=request_data, **kwargs)
+        if result.errors:
+            kwargs["context"][UNCACHEABLE] = True
+        return result
+
+    async def _cache_key(self, request: Request) -> Optional[CacheKey]:
+        """
+        Clave de caché de una petición GraphQL, o None si no se puede cachear.
+
+        Solo se llama para usuarios autenticados (la respuesta guardada se
+        devuelve sin ejecutar los resolvers, que son los que comprueban el
+        token) y solo se cachean operaciones sueltas.
+        """
+        try:
+            if request.method == "GET":
+                params = request.query_params
+                data = {
+                    "query": params.get("query"),
+                    "variables": json.loads(params.get("variables") or "null"),
+                    "operationName": params.get("operationName"),
+                    "extensions": json.loads(params.get("extensions") or "null"),
+                }
+            else:
+                data = json.loads(await request.body())
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        extensions = data.get("extensions")
+        persisted = extensions.get("persistedQuery") if isinstance(extensions, dict) else None
+        if isinstance(data.get("query"), str):
+            document = query_hash(data["query"])
+        elif isinstance(persisted, dict) and isinstance(persisted.get("sha256Hash"), str):
+            document = persisted["sha256Hash"]
+        else:
+            return None
+
+        return response_cache.key("graphql", {
+            "document": document,
+            "variables": data.get("variables"),
+            "operation_name": data.get("operationName"),
+        })
+
+    def _resolve_persisted_query(self, request_data) -> Optional[ExecutionResult]:
+        """Sustituye el hash por el texto de la consulta o devuelve el error"""
+        persisted = (request_data.extensions or {}).get("persistedQuery")
+        store = self.persisted_queries
+
+        if not isinstance(persisted, dict):
+            if request_data.query and not store.is_allowed(request_data.query):
+                return _persisted_error(NOT_ALLOWED_MESSAGE, "PERSISTED_QUERY_NOT_ALLOWED")
+            return None
+
+        sha256 = persisted.get("sha256Hash")
+        if persisted.get("version", 1) != 1 or not isinstance(sha256, str):
+            return _persisted_error("Versión de consulta persistida no soportada", "PERSISTED_QUERY_NOT_SUPPORTED")
+
+        if request_data.query:
+            if query_hash(request_data.query) != sha256:
+                return _persisted_error("provided sha does not match query", "INTERNAL_SERVER_ERROR")
+            if not store.is_allowed(request_data.query):
+                return _persisted_error(NOT_ALLOWED_MESSAGE, "PERSISTED_QUERY_NOT_ALLOWED")
+            store.register(sha256, request_data.query)
+            return None
+
+        query = store.get(sha256)
+        if query is None:
+            return _persisted_error("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+        request_data.query = query
+        return None
@@ -0,0 +1,64 @@
+from typing import Iterable, Iterator, List, Set
+
+from strawberry.types.nodes import SelectedField
+from strawberry.utils.str_converters import to_camel_case
+
+from ...core.models import ChallengeData
+
+# Columnas que siempre se leen (identidad de la fila y posición del cursor)
+REQUIRED_COLUMNS = ("row_id", "id_tie_fecha_valor")
+
+# Nombre GraphQL (camelCase) -> columna de `challenge_graphql_nlp_api`
+COLUMNS_BY_FIELD = {
+    to_camel_case(column.name): column.name
+    for column in ChallengeData.__table__.columns
+}
+
+
+def _fields(selections: Iterable) -> Iterator[SelectedField]:
+    """Campos seleccionados, resolviendo fragmentos anidados"""
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:
+            # FragmentSpread / InlineFragment
+            yield from _fields(selection.selections)
+
+
+def _field_names(selections: Iterable) -> Set[str]:
+    """Nombres de los campos seleccionados, resolviendo fragmentos"""
+    return {field.name for field in _fields(selections)}
+
+
+def selected_columns(info, path: Iterable[str] = ()) -> List:
+    """
+    Columnas de `ChallengeData` pedidas en la selección del resolver.
+
+    Args:
+        info: Info de Strawberry del resolver
+        path: Campos anidados hasta llegar al tipo con las columnas
+            (p. ej. `("edges", "node")` en una conexión)
+
+    Returns:
+        List: Columnas a incluir en el SELECT (siempre con `REQUIRED_COLUMNS`)
+    """
+    selections = info.selected_fields[0].selections
+    for name in path:
+        selections = [
+            child
+            for field in _fields(selections)
+            if field.name == name
+            for child in field.selections
+        ]
+
+    names = list(REQUIRED_COLUMNS)
+    for field_name in _field_names(selections):
+        column = COLUMNS_BY_FIELD.get(field_name)
+        if column and column not in names:
+            names.append(column)
+    return [getattr(ChallengeData, name) for name in names]
+
+
+def rows_to_objects(rows, object_type) -> List:
+    """Convierte filas proyectadas en objetos ligeros del tipo GraphQL"""
+    return [object_type(**row._mapping) for row in rows]
@@ -1,12 +1,51 @@
+import base64
+import os
 import strawberry
-from typing import List, Optional
+from strawberry.extensions import ParserCache, ValidationCache
+from strawberry.scalars import JSON
+from strawberry.types import Info
+from typing import Annotated, List, Optional
 from datetime import datetime
-from sqlalchemy.orm import Session
-from fastapi import Depends
 
-from ...core.database import get_db
 from ...core.models import ChallengeData
-from ...core.auth import get_current_user
+from ...core.auth import get_current_user_from_request
+from ...core.categories import CategoryMatch as CoreCategoryMatch
+from ...core.queries import (
+    PageCursor,
+    count_rows,
+    data_points_query,
+    decode_page_cursor,
+    encode_page_cursor,
+    estimate_rows,
+)
+from ...core.aggregation import metric_label
+from ...core.rollups import aggregate, aggregation_from_request, dimension_filters
+from ...core.snapshot import active_snapshot
+from .projection import rows_to_objects, selected_columns
+from .cost import QueryCostLimiter
+from .loaders import RequestSession, column_names, first_data_point_of_date
+
+CategoryMatch = strawberry.enum(CoreCategoryMatch, name="CategoryMatch")
+
+# Tamaño de página por defecto y máximo de las conexiones
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+CURSOR_PREFIX = "DataPoint:"
+
+def encode_cursor(node: "DataPoint") -> str:
+    """Cursor opaco con la posición keyset de la fila: `DataPoint:<id_tie_fecha_valor>:<row_id>`"""
+    position = encode_page_cursor({"id_tie_fecha_valor": node.id_tie_fecha_valor, "row_id": node.row_id})
+    return base64.b64encode(f"{CURSOR_PREFIX}{position}".encode()).decode()
+
+def decode_cursor(cursor: str) -> PageCursor:
+    try:
+        value = base64.b64decode(cursor.encode()).decode()
+        if not value.startswith(CURSOR_PREFIX):
+            raise ValueError(cursor)
+        return decode_page_cursor(value[len(CURSOR_PREFIX):])
+    except ValueError:
+        raise Exception(f"Cursor inválido: {cursor}")
 
 @strawberry.type
 class Category:
@@ -16,6 +55,7 @@ class Category:
 
 @strawberry.type
 class DataPoint:
+    row_id: Optional[int] = None
     id_tie_fecha_valor: Optional[int] = None
     id_cli_cliente: Optional[int] = None
     #id_ga_vista: Optional[int] = None
@@ -40,91 +80,244 @@ class DataPoint:
     desc_categoria_producto: Optional[str] = None
     desc_categoria_prod_principal: Optional[str] = None
 
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str] = None
+
+@strawberry.type
+class DataPointEdge:
+    cursor: str
+    node: DataPoint
+
+@strawberry.type
+class DataPointConnection:
+    edges: List[DataPointEdge]
+    page_info: PageInfo
+    filters: strawberry.Private[dict]
+
+    @strawberry.field
+    async def total_count(self, info: Info) -> int:
+        """Número exacto de filas con los filtros; solo se calcula si se pide"""
+        db: RequestSession = info.context["db"]
+        try:
+            snapshot = active_snapshot()
+            if snapshot is not None:
+                return snapshot.count(snapshot.points_mask(**self.filters))
+            return await db.run_sync(count_rows, data_points_query(
+                **self.filters, columns=[ChallengeData.row_id]
+            ))
+        except Exception as e:
+            raise Exception(str(e))
+
+    @strawberry.field
+    async def estimated_count(self, info: Info) -> int:
+        """Estimación barata del número de filas (estadísticas de PostgreSQL)"""
+        db: RequestSession = info.context["db"]
+        try:
+            snapshot = active_snapshot()
+            if snapshot is not None:
+                # En memoria contar es exacto y barato
+                return snapshot.count(snapshot.points_mask(**self.filters))
+            return await db.run_sync(estimate_rows, data_points_query(**self.filters))
+        except Exception as e:
+            raise Exception(str(e))
+
+@strawberry.type
+class AggregateResult:
+    source: str
+    group_by: List[str]
+    metrics: List[str]
+    rows: List[JSON]
+
 @strawberry.type
 class Query:
     @strawberry.field
-    async def categories(self, info) -> List[Category]:
+    async def categories(self, info: Info, path: Optional[str] = None) -> List[Category]:
         # Verificar autenticación
-        #await get_current_user(info.context["request"])
+        #await get_current_user_from_request(info.context["request"])
         
-        db: Session = next(get_db())
         try:
-            # Obtener todos los productos para construir el árbol de categorías
-            products = db.query(ChallengeData).all()
-            
-            # Construir el árbol de categorías
-            category_map = {}
-            root = Category(path="", name="root", children=[])
-            category_map[""] = root
-            
-            for product in products:
-                for path in product.category_paths:
-                    parts = path.split('/')
-                    current_path = ""
-                    
-                    for part in parts:
-                        parent_path = current_path
-                        current_path = f"{current_path}/{part}" if current_path else part
-                        
-                        if current_path not in category_map:
-                            category = Category(path=current_path, name=part, children=[])
-                            category_map[current_path] = category
-                            category_map[parent_path].children.append(category)
-            
-            return root.children
+            # La jerarquía se materializa en la carga; aquí solo se lee
+            return await info.context["loaders"].categories.load(path)
         except Exception as e:
             raise Exception(str(e))
 
     @strawberry.field
     async def get_data_points(
         self,
-        info,
+        info: Info,
         category: Optional[str] = None,
         start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None
+        end_date: Optional[datetime] = None,
+        category_match: CategoryMatch = CategoryMatch.DESCENDANTS
     ) -> List[DataPoint]:
         # Verificar autenticación
-        await get_current_user(info.context["request"])
+        await get_current_user_from_request(info.context["request"])
         
-        db: Session = next(get_db())
+        db: RequestSession = info.context["db"]
         try:
-            query = db.query(ChallengeData)
-            
-            if category:
-                query = query.filter(
-                    ChallengeData.desc_categoria_producto.like(f"%{category}%")
-                )
-            
-            if start_date:
-                query = query.filter(ChallengeData.id_tie_fecha_valor >= start_date)
-            
-            if end_date:
-                query = query.filter(ChallengeData.id_tie_fecha_valor <= end_date)
+            snapshot = active_snapshot()
+            if snapshot is not None:
+                mask = snapshot.points_mask(category, start_date, end_date, category_match=category_match)
+                rows = snapshot.rows(mask, column_names(selected_columns(info)))
+                return [DataPoint(**row) for row in rows]
+
+            # Solo se leen las columnas pedidas en la consulta GraphQL
+            stmt = data_points_query(
+                category, start_date, end_date,
+                category_match=category_match,
+                columns=selected_columns(info)
+            )
+            return rows_to_objects(await db.execute(stmt), DataPoint)
+        except Exception as e:
+            raise Exception(str(e))
+
+    @strawberry.field
+    async def data_points_connection(
+        self,
+        info: Info,
+        first: int = DEFAULT_PAGE_SIZE,
+        after: Optional[str] = None,
+        category: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        category_match: CategoryMatch = CategoryMatch.DESCENDANTS
+    ) -> DataPointConnection:
+        # Verificar autenticación
+        await get_current_user_from_request(info.context["request"])
+        
+        if first < 1 or first > MAX_PAGE_SIZE:
+            raise Exception(f"`first` debe estar entre 1 y {MAX_PAGE_SIZE}")
+        
+        filters = {
+            "category": category,
+            "start_date": start_date,
+            "end_date": end_date,
+            "category_match": category_match,
+        }
+        db: RequestSession = info.context["db"]
+        try:
+            # Keyset sobre (id_tie_fecha_valor, row_id); se pide una fila de más para saber si hay otra página
+            after_position = decode_cursor(after) if after else None
+            columns = selected_columns(info, ("edges", "node"))
+            snapshot = active_snapshot()
+            if snapshot is not None:
+                mask = snapshot.points_mask(**filters, after=after_position)
+                nodes = [DataPoint(**row) for row in snapshot.rows(mask, column_names(columns), first + 1)]
+            else:
+                stmt = data_points_query(**filters, after=after_position, limit=first + 1, columns=columns)
+                nodes = rows_to_objects(await db.execute(stmt), DataPoint)
+            has_next_page = len(nodes) > first
+            nodes = nodes[:first]
             
-            return query.all()
+            edges = [
+                DataPointEdge(cursor=encode_cursor(node), node=node)
+                for node in nodes
+            ]
+            return DataPointConnection(
+                edges=edges,
+                page_info=PageInfo(
+                    has_next_page=has_next_page,
+                    end_cursor=edges[-1].cursor if edges else None
+                ),
+                filters=filters
+            )
         except Exception as e:
             raise Exception(str(e))
 
     @strawberry.field
     async def get_data_point(
         self,
-        info,
-        id_tie_fecha_valor: int
+        info: Info,
+        row_id: Optional[int] = None,
+        id_tie_fecha_valor: Annotated[Optional[int], strawberry.argument(
+            deprecation_reason="Varias filas comparten id_tie_fecha_valor: usa rowId"
+        )] = None
     ) -> Optional[DataPoint]:
         # Verificar autenticación
-        await get_current_user(info.context["request"])
+        await get_current_user_from_request(info.context["request"])
         
-        db: Session = next(get_db())
         try:
-            data_point = db.query(ChallengeData).filter(
-                ChallengeData.id_tie_fecha_valor == id_tie_fecha_valor
-            ).first()
+            if (row_id is None) == (id_tie_fecha_valor is None):
+                raise Exception("Indica rowId (o el argumento obsoleto idTieFechaValor)")
+
+            columns = selected_columns(info)
+            if row_id is None:
+                # Comportamiento anterior: la primera fila de esa fecha
+                row = await first_data_point_of_date(info.context["db"], id_tie_fecha_valor, columns)
+            else:
+                # Las búsquedas por id de la misma petición se agrupan en un `WHERE row_id IN (...)`
+                row = await info.context["loaders"].data_points.load((row_id, column_names(columns)))
             
-            if not data_point:
+            if not row:
                 raise Exception("Punto de datos no encontrado")
             
-            return data_point
+            return DataPoint(**row)
+        except Exception as e:
+            raise Exception(str(e))
+
+    @strawberry.field
+    async def get_data_points_by_brand(
+        self,
+        info: Info,
+        brand: str
+    ) -> List[DataPoint]:
+        # Verificar autenticación
+        await get_current_user_from_request(info.context["request"])
+        
+        try:
+            rows = await info.context["loaders"].data_points_by_brand.load(
+                (brand, column_names(selected_columns(info)))
+            )
+            return [DataPoint(**row) for row in rows]
         except Exception as e:
             raise Exception(str(e))
 
-schema = strawberry.Schema(query=Query) 
\ No newline at end of file
+    @strawberry.field
+    async def aggregate(
+        self,
+        info: Info,
+        group_by: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        brand: Optional[str] = None,
+        main_category: Optional[str] = None,
+        source: Optional[int] = None,
+        start_date: Optional[int] = None,
+        end_date: Optional[int] = None,
+        order: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> AggregateResult:
+        # Verificar autenticación
+        await get_current_user_from_request(info.context["request"])
+        
+        db: RequestSession = info.context["db"]
+        try:
+            # Se responde desde los rollups de la carga si alguno cubre la agregación
+            aggregation = aggregation_from_request(group_by or [], metrics or [], order, limit)
+            filters = dimension_filters(brand, main_category, source, start_date, end_date)
+            snapshot = active_snapshot()
+            if snapshot is not None:
+                rows, table = snapshot.aggregate(aggregation, filters), "memory"
+            else:
+                rows, table = await db.run_sync(aggregate, aggregation, filters)
+            return AggregateResult(
+                source=table,
+                group_by=aggregation["group_by"],
+                metrics=[metric_label(m) for m in aggregation["metrics"]],
+                rows=rows
+            )
+        except Exception as e:
+            raise Exception(str(e))
+
+# Tamaño de las cachés LRU de documentos parseados y validados
+DOCUMENT_CACHE_SIZE = int(os.getenv("GRAPHQL_DOCUMENT_CACHE_SIZE", "256"))
+
+schema = strawberry.Schema(
+    query=Query,
+    extensions=[
+        lambda: ParserCache(maxsize=DOCUMENT_CACHE_SIZE),
+        lambda: ValidationCache(maxsize=DOCUMENT_CACHE_SIZE),
+        QueryCostLimiter,
+    ],
+)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import random
+from typing import Dict, List, Optional, Tuple, Type
+
+# Configuración del cliente LLM
+LLM_MODEL = os.getenv("NLP_LLM_MODEL", "gpt-4.1-nano")
+LLM_TEMPERATURE = float(os.getenv("NLP_LLM_TEMPERATURE", "0.3"))
+LLM_TIMEOUT = float(os.getenv("NLP_LLM_TIMEOUT", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("NLP_LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("NLP_LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("NLP_LLM_QUEUE_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("NLP_LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("NLP_LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("NLP_LLM_RETRY_MAX_DELAY", "8"))
+
+
+class LLMOverloadedError(Exception):
+    """No hay capacidad para atender la llamada al LLM (cola llena o espera agotada)"""
+
+
+class LLMBackend:
+    """
+    Backend de completado de chat.
+
+    Las subclases implementan `complete` e indican en `retryable_exceptions`
+    qué errores son transitorios.
+    """
+    retryable_exceptions: Tuple[Type[BaseException], ...] = ()
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Backend con el cliente asíncrono de OpenAI.
+
+    `base_url` permite apuntarlo a cualquier servidor compatible, por
+    ejemplo un servidor de completados falso en local.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model: str = LLM_MODEL,
+        temperature: float = LLM_TEMPERATURE,
+        timeout: float = LLM_TIMEOUT,
+    ):
+        import openai
+
+        # Los reintentos los gestiona LLMClient, no el SDK
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+            timeout=timeout,
+            max_retries=0,
+        )
+        self.model = model
+        self.temperature = temperature
+        self.retryable_exceptions = (
+            openai.APIConnectionError,
+            openai.APITimeoutError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+        )
+        return response.choices[0].message.content or ""
+
+
+class LLMClient:
+    """
+    Cliente no bloqueante sobre un `LLMBackend`.
+
+    Limita las llamadas concurrentes con un semáforo, rechaza nuevas
+    llamadas cuando la cola de espera está llena (backpressure), aplica un
+    timeout por llamada y reintenta los errores transitorios con backoff
+    exponencial y jitter.
+    """
+
+    def __init__(
+        self,
+        backend: LLMBackend,
+        timeout: float = LLM_TIMEOUT,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+        retry_max_delay: float = LLM_RETRY_MAX_DELAY,
+    ):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Envía los mensajes al backend y devuelve el texto de la respuesta.
+
+        Raises:
+            LLMOverloadedError: Si no hay capacidad para atender la llamada
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if self._waiting >= self.max_queue:
+            raise LLMOverloadedError("Demasiadas consultas al LLM en espera")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise LLMOverloadedError("Tiempo de espera agotado para llamar al LLM")
+        finally:
+            self._waiting -= 1
+
+        try:
+            return await self._complete_with_retries(messages)
+        finally:
+            self._semaphore.release()
+
+    async def _complete_with_retries(self, messages: List[Dict[str, str]]) -> str:
+        retryable = (asyncio.TimeoutError,) + tuple(self.backend.retryable_exceptions)
+        attempt = 0
+        while True:
+            try:
+                return await asyncio.wait_for(self.backend.complete(messages), self.timeout)
+            except retryable:
+                if attempt >= self.max_retries:
+                    raise
+                # Backoff exponencial con "full jitter"
+                delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt))
+                await asyncio.sleep(random.uniform(0, delay))
+                attempt += 1
+
+
+def create_llm_client() -> LLMClient:
+    """Crea el cliente LLM según `NLP_LLM_BACKEND` (por defecto `openai`)"""
+    backend_name = os.getenv("NLP_LLM_BACKEND", "openai")
+    if backend_name == "openai":
+        return LLMClient(OpenAIBackend())
+    raise ValueError(f"Backend LLM desconocido: {backend_name}")
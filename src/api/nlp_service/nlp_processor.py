@@ -1,13 +1,41 @@
+import asyncio
 import os
-from typing import Dict, List, Optional
-from openai import OpenAI
+import re
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ...core.models import ChallengeData
+from ...core.database import AsyncSessionLocal
+from ...core.aggregation import InvalidFilterError, filter_clauses, parse_aggregation
+from ...core.rollups import aggregate
+from ...core.serialization import DATA_POINT_COLUMNS, data_point_rows
+from .llm_client import LLMClient, LLMOverloadedError, create_llm_client
+from .translation_cache import TranslationCache, normalize_query
+from .rule_parser import RuleBasedParser
+
+# Confianza que se asigna a las traducciones hechas por el LLM
+LLM_CONFIDENCE = 0.9
+# Consultas por llamada al LLM y consultas a la base de datos en paralelo en un lote
+BATCH_LLM_MAX_QUERIES = int(os.getenv("NLP_BATCH_LLM_MAX_QUERIES", "20"))
+BATCH_DB_CONCURRENCY = int(os.getenv("NLP_BATCH_DB_CONCURRENCY", "4"))
+
+_BATCH_SECTION = re.compile(
+    r"^#{2,}[ \t]*(\d+)\.?[ \t]*$(.*?)(?=^#{2,}[ \t]*\d+\.?[ \t]*$|\Z)",
+    re.MULTILINE | re.DOTALL
+)
+
 
 class NLPProcessor:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        translation_cache: Optional[TranslationCache] = None,
+        rule_parser: Optional[RuleBasedParser] = None
+    ):
+        self.llm_client = llm_client or create_llm_client()
+        self.translation_cache = translation_cache or TranslationCache()
+        self.rule_parser = rule_parser or RuleBasedParser()
         self.system_prompt = """
         Eres un asistente especializado en análisis de datos de comercio electrónico.
         Tu tarea es convertir consultas en lenguaje natural a consultas SQL o filtros específicos.
@@ -29,9 +57,17 @@ class NLPProcessor:
         - desc_ga_cod_producto: Código del producto
         - desc_categoria_producto: Categoría del producto
         - desc_categoria_prod_principal: Categoría principal del producto
+        
+        Devuelve los filtros como `columna operador valor` (=, !=, >, <, >=, <=).
+        Si la consulta pide totales, promedios, conteos o rankings, añade además
+        una agregación con este formato (una línea por elemento):
+        AGRUPAR POR: columna1, columna2
+        METRICA: sum(columna) | avg(columna) | min(columna) | max(columna) | count(*) | count_distinct(columna)
+        ORDEN: asc | desc
+        LIMITE: número
         """
 
-    async def process_query(self, query: str, db: Session) -> Dict:
+    async def process_query(self, query: str, db: AsyncSession) -> Dict:
         """
         Procesa una consulta en lenguaje natural y devuelve los resultados.
         
@@ -41,54 +77,19 @@ class NLPProcessor:
         
         Returns:
             Dict con los resultados y metadatos
+        
+        Raises:
+            LLMOverloadedError: Si el LLM no admite más llamadas
+            InvalidFilterError: Si un filtro no es del tipo de su columna
         """
         try:
-            # Obtener respuesta de OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": f"Convierte esta consulta a filtros SQL: {query}"}
-                ],
-                temperature=0.3
-            )
+            filters, aggregation, confidence = await self._translate(query, db)
             
-            # Extraer filtros de la respuesta
-            filters = self._parse_filters(response.choices[0].message.content)
-            
-            # Aplicar filtros a la consulta
-            query = db.query(ChallengeData)
-            filter_clauses = []
-            for field, condition in filters.items():
-                column = getattr(ChallengeData, field)
-                op = condition["op"]
-                val = condition["value"]
-
-                if op == "=":
-                    filter_clauses.append(column == val)
-                elif op == "!=":
-                    filter_clauses.append(column != val)
-                elif op == ">":
-                    filter_clauses.append(column > val)
-                elif op == "<":
-                    filter_clauses.append(column < val)
-                elif op == ">=":
-                    filter_clauses.append(column >= val)
-                elif op == "<=":
-                    filter_clauses.append(column <= val)
-
-            query = query.filter(and_(*filter_clauses))
-            
-            # Ejecutar consulta
-            results = query.all()
-            
-            return {
-                "result": "Consulta procesada exitosamente",
-                "confidence": 0.9,
-                "data_points": results,
-                "filters_applied": filters
-            }
+            # Las consultas se construyen con la API síncrona y se ejecutan con asyncpg
+            return await db.run_sync(self._execute, filters, aggregation, confidence)
             
+        except (LLMOverloadedError, InvalidFilterError):
+            raise
         except Exception as e:
             return {
                 "result": f"Error al procesar la consulta: {str(e)}",
@@ -97,6 +98,265 @@ class NLPProcessor:
                 "filters_applied": {}
             }
 
+    async def _translate(self, query: str, db: AsyncSession) -> Tuple[Dict, Optional[Dict], float]:
+        """
+        Traduce la consulta a filtros y, si procede, a una agregación.
+        
+        Primero prueba el parser local de reglas; si su confianza es baja
+        se consulta la caché de traducciones y, en último lugar, el LLM.
+        
+        Args:
+            query: Consulta en lenguaje natural
+            db: Sesión de la base de datos (para el vocabulario del parser)
+        
+        Returns:
+            Tuple[Dict, Optional[Dict], float]: Filtros en el formato de
+            `_parse_filters`, agregación (o None) y confianza
+        """
+        await self._ensure_vocabulary(db)
+        translation = await self._translate_locally(query)
+        if translation is not None:
+            return translation
+
+        # Obtener respuesta del LLM sin bloquear el event loop
+        return await self._translate_with_llm(query)
+
+    async def translate_filters(self, query: str, db: AsyncSession) -> Dict:
+        """
+        Traduce la consulta y devuelve solo sus filtros (se ignora la agregación).
+        
+        Args:
+            query: Consulta en lenguaje natural
+            db: Sesión de la base de datos (para el vocabulario del parser)
+        
+        Returns:
+            Dict: Filtros en el formato de `_parse_filters`
+        """
+        filters, _, _ = await self._translate(query, db)
+        return filters
+
+    async def _ensure_vocabulary(self, db: AsyncSession):
+        """Carga (o recarga) el vocabulario del parser de reglas si hace falta"""
+        if self.rule_parser.needs_vocabulary():
+            try:
+                await db.run_sync(self.rule_parser.load_vocabulary)
+            except Exception as e:
+                print(f"⚠️ No se pudo cargar el vocabulario del parser de reglas: {e}")
+
+    async def _translate_locally(self, query: str) -> Optional[Tuple[Dict, Optional[Dict], float]]:
+        """Traduce con el parser de reglas o la caché; None si hace falta el LLM"""
+        filters, aggregation, confidence = self.rule_parser.parse(query)
+        if confidence >= self.rule_parser.min_confidence:
+            return filters, aggregation, confidence
+
+        cached = await self.translation_cache.get(query)
+        if cached is not None:
+            return cached["filters"], cached["aggregation"], LLM_CONFIDENCE
+        return None
+
+    async def _store_llm_translation(self, query: str, content: str) -> Tuple[Dict, Optional[Dict], float]:
+        """Extrae filtros y agregación de la respuesta del LLM y los cachea"""
+        filters = self._parse_filters(content)
+        aggregation = parse_aggregation(content)
+        if filters or aggregation:
+            await self.translation_cache.set(
+                query, {"filters": filters, "aggregation": aggregation}
+            )
+        return filters, aggregation, LLM_CONFIDENCE
+
+    async def process_batch(self, queries: List[str], db: AsyncSession) -> List[Dict]:
+        """
+        Procesa varias consultas en lenguaje natural de una vez.
+        
+        Las consultas idénticas (tras normalizar) se procesan una sola vez.
+        Las que no resuelven el parser de reglas ni la caché se traducen
+        juntas en una sola llamada al LLM (o en pocas, de hasta
+        `BATCH_LLM_MAX_QUERIES` consultas, en paralelo). Después las
+        consultas a la base de datos se ejecutan en paralelo, cada una con
+        su propia conexión del pool.
+        
+        Args:
+            queries: Consultas en lenguaje natural
+            db: Sesión de la base de datos (para el vocabulario del parser)
+        
+        Returns:
+            List[Dict]: Un resultado por consulta, en el mismo orden; los
+            errores se informan por elemento en `error`
+        """
+        unique: Dict[str, str] = {}
+        for query in queries:
+            unique.setdefault(normalize_query(query), query)
+
+        await self._ensure_vocabulary(db)
+        translations: Dict[str, object] = {}
+        pending: List[str] = []
+        for key, query in unique.items():
+            try:
+                translation = await self._translate_locally(query)
+            except Exception as e:
+                translation = e
+            if translation is None:
+                pending.append(key)
+            else:
+                translations[key] = translation
+
+        chunks = [
+            pending[i:i + BATCH_LLM_MAX_QUERIES]
+            for i in range(0, len(pending), BATCH_LLM_MAX_QUERIES)
+        ]
+        chunk_results = await asyncio.gather(
+            *(self._translate_batch_with_llm([unique[k] for k in chunk]) for chunk in chunks),
+            return_exceptions=True
+        )
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for index, key in enumerate(chunk):
+                if isinstance(chunk_result, BaseException):
+                    translations[key] = chunk_result
+                else:
+                    translations[key] = chunk_result[index]
+
+        semaphore = asyncio.Semaphore(BATCH_DB_CONCURRENCY)
+
+        async def execute(key: str) -> Dict:
+            translation = translations[key]
+            if isinstance(translation, BaseException):
+                return self._error_result(translation)
+            async with semaphore:
+                try:
+                    return await self._execute_in_new_session(*translation)
+                except Exception as e:
+                    return self._error_result(e)
+
+        keys = list(unique)
+        results = dict(zip(keys, await asyncio.gather(*(execute(k) for k in keys))))
+        return [
+            dict(results[normalize_query(query)], query=query)
+            for query in queries
+        ]
+
+    async def _translate_batch_with_llm(self, queries: List[str]) -> List[object]:
+        """
+        Traduce varias consultas con una sola llamada al LLM.
+        
+        Se piden las respuestas en secciones `### n`; las consultas cuya
+        sección falte se traducen individualmente.
+        
+        Returns:
+            List[object]: Traducción o excepción por consulta, en el mismo orden
+        """
+        if len(queries) == 1:
+            return [await self._translate_with_llm(queries[0])]
+
+        numbered = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, start=1))
+        content = await self.llm_client.complete([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": (
+                "Convierte cada una de estas consultas a filtros SQL. Responde a cada "
+                "una en una sección que empiece con una línea `### n`, donde n es su "
+                f"número:\n{numbered}"
+            )}
+        ])
+
+        sections = {}
+        for match in _BATCH_SECTION.finditer(content):
+            sections[int(match.group(1))] = match.group(2)
+
+        async def translate(number: int, query: str):
+            try:
+                if number in sections:
+                    return await self._store_llm_translation(query, sections[number])
+                return await self._translate_with_llm(query)
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                return e
+
+        return list(await asyncio.gather(
+            *(translate(i, query) for i, query in enumerate(queries, start=1)),
+            return_exceptions=True
+        ))
+
+    async def _translate_with_llm(self, query: str) -> Tuple[Dict, Optional[Dict], float]:
+        """Traduce una única consulta con el LLM"""
+        content = await self.llm_client.complete([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": f"Convierte esta consulta a filtros SQL: {query}"}
+        ])
+        return await self._store_llm_translation(query, content)
+
+    def _execute(self, db: Session, filters: Dict, aggregation: Optional[Dict], confidence: float) -> Dict:
+        """Ejecuta la consulta traducida y arma la respuesta"""
+        if aggregation:
+            return {
+                "result": "Consulta agregada procesada exitosamente",
+                "confidence": confidence,
+                "data_points": [],
+                "filters_applied": filters,
+                "aggregation": aggregation,
+                "aggregates": self._query_aggregates(db, filters, aggregation)
+            }
+
+        return {
+            "result": "Consulta procesada exitosamente",
+            "confidence": confidence,
+            "data_points": self._query_data_points(db, filters),
+            "filters_applied": filters
+        }
+
+    async def _execute_in_new_session(self, filters: Dict, aggregation: Optional[Dict], confidence: float) -> Dict:
+        """Como `_execute`, con una sesión propia para poder ejecutar en paralelo"""
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(self._execute, filters, aggregation, confidence)
+
+    @staticmethod
+    def _error_result(error: BaseException) -> Dict:
+        return {
+            "result": f"Error al procesar la consulta: {str(error)}",
+            "confidence": 0.0,
+            "data_points": [],
+            "filters_applied": {},
+            "error": str(error)
+        }
+
+    def _filter_clauses(self, filters: Dict) -> List:
+        """
+        Convierte los filtros extraídos en condiciones SQL.
+
+        Raises:
+            InvalidFilterError: Si algún valor no es del tipo de su columna
+        """
+        return filter_clauses(filters)
+
+    def _query_data_points(self, db: Session, filters: Dict) -> List[Dict]:
+        """
+        Aplica los filtros extraídos y ejecuta la consulta.
+        
+        Args:
+            db: Sesión de la base de datos
+            filters: Filtros devueltos por `_parse_filters`
+        
+        Returns:
+            List[Dict]: Filas que cumplen los filtros, con los campos de `DataPoint`
+        """
+        stmt = select(*DATA_POINT_COLUMNS).where(and_(*self._filter_clauses(filters)))
+        return data_point_rows(db.execute(stmt))
+
+    def _query_aggregates(self, db: Session, filters: Dict, aggregation: Dict) -> List[Dict]:
+        """
+        Ejecuta la agregación con una única consulta GROUP BY, sobre una
+        tabla de rollup si alguna la cubre o sobre la tabla de datos si no.
+        
+        Args:
+            db: Sesión de la base de datos
+            filters: Filtros devueltos por `_parse_filters`
+            aggregation: Agregación validada (ver `aggregation.validate_aggregation`)
+        
+        Returns:
+            List[Dict]: Una fila por grupo con las columnas de agrupación y las métricas
+        """
+        rows, _ = aggregate(db, aggregation, filters)
+        return rows
+
     def _parse_filters(self, response: str) -> Dict:
         """
         Extrae pares campo=valor (y variantes) desde la respuesta de OpenAI.
@@ -159,4 +419,8 @@ SELECT
   COUNT(DISTINCT desc_ga_cod_producto) AS desc_ga_cod_producto,
   COUNT(DISTINCT desc_categoria_producto) AS desc_categoria_producto,
   COUNT(DISTINCT desc_categoria_prod_principal) AS desc_categoria_prod_principal
-FROM public.challenge_graphql_nlp_api;'''
\ No newline at end of file
+FROM public.challenge_graphql_nlp_api;'''
+
+
+# Procesador compartido por las rutas de NLP y las de datos
+nlp_processor = NLPProcessor()
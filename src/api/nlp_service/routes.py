@@ -1,58 +1,52 @@
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ...core.database import get_db
-from ...core.models import ChallengeData
+from ...core.database import get_async_db
 from ...core.auth import get_current_user
-from .nlp_processor import NLPProcessor
+from ...core.serialization import DataPoint, JSONResponse
+from .nlp_processor import nlp_processor
+from .llm_client import LLMOverloadedError
 
 router = APIRouter()
-nlp_processor = NLPProcessor()
 
 class NLPQuery(BaseModel):
     query: str
     context: Optional[dict] = None
 
-class DataPoint(BaseModel):
-    id_tie_fecha_valor: Optional[int] = None
-    id_cli_cliente: Optional[int] = None
-    #id_ga_vista: Optional[int] = None
-    #id_ga_tipo_dispositivo: Optional[int] = None
-    id_ga_fuente_medio: Optional[int] = None
-    #desc_ga_sku_producto: Optional[str] = None
-    desc_ga_categoria_producto: Optional[float] = None
-    fc_agregado_carrito_cant: Optional[int] = None
-    fc_ingreso_producto_monto: Optional[float] = None
-    #fc_retirado_carrito_cant: Optional[float] = None
-    fc_detalle_producto_cant: Optional[int] = None
-    fc_producto_cant: Optional[int] = None
-    #desc_ga_nombre_producto: Optional[float] = None
-    #fc_visualizaciones_pag_cant: Optional[float] = None
-    flag_pipol: Optional[int] = None
-    #sasasa: Optional[str] = None
-    id_ga_producto: Optional[int] = None
-    desc_ga_nombre_producto_1: Optional[str] = None
-    desc_ga_sku_producto_1: Optional[str] = None
-    desc_ga_marca_producto: Optional[str] = None
-    desc_ga_cod_producto: Optional[float] = None
-    desc_categoria_producto: Optional[str] = None
-    desc_categoria_prod_principal: Optional[str] = None
-
-    class Config:
-        orm_mode = True
+class NLPBatchQuery(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=100)
+    context: Optional[dict] = None
 
 class NLPResponse(BaseModel):
     result: str
     confidence: float
     data_points: List[DataPoint]
     filters_applied: dict
+    aggregation: Optional[dict] = None
+    aggregates: Optional[List[dict]] = None
+
+class NLPBatchItem(NLPResponse):
+    query: str
+    error: Optional[str] = None
+
+class NLPBatchResponse(BaseModel):
+    results: List[NLPBatchItem]
+
+def _shape(model, result: dict) -> dict:
+    """
+    Campos de `model` en su orden (los que faltan a None).
+
+    Los valores salen de filas de la base de datos con los tipos de
+    `DataPoint`, así que se serializan sin volver a validarlos.
+    """
+    return {field: result.get(field) for field in model.model_fields}
 
 @router.post("/query", response_model=NLPResponse)
 async def process_nlp_query(
     query: NLPQuery,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -67,6 +61,38 @@ async def process_nlp_query(
         NLPResponse: Resultados de la consulta
     """
     try:
-        return await nlp_processor.process_query(query.query, db)
+        result = await nlp_processor.process_query(query.query, db)
+        return JSONResponse(_shape(NLPResponse, result))
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/query/batch", response_model=NLPBatchResponse)
+async def process_nlp_batch(
+    batch: NLPBatchQuery,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Procesa varias consultas en lenguaje natural en una sola petición.
+    
+    Las consultas repetidas se procesan una vez, las que necesitan el LLM
+    se traducen juntas y las consultas a la base de datos se ejecutan en
+    paralelo.
+    
+    Args:
+        batch: Consultas en lenguaje natural
+        db: Sesión de la base de datos
+        current_user: Usuario autenticado
+    
+    Returns:
+        NLPBatchResponse: Un resultado por consulta, en el mismo orden
+    """
+    try:
+        results = await nlp_processor.process_batch(batch.queries, db)
+        return JSONResponse({"results": [_shape(NLPBatchItem, item) for item in results]})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,368 @@
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ...core.aggregation import validate_aggregation
+from ...core.models import ChallengeData
+from .translation_cache import normalize_query
+
+# Confianza mínima para no escalar la consulta al LLM
+RULES_MIN_CONFIDENCE = float(os.getenv("NLP_RULES_MIN_CONFIDENCE", "0.85"))
+# Cada cuánto se recargan los valores distintos de marca y categoría
+VOCABULARY_TTL = float(os.getenv("NLP_VOCABULARY_TTL", "600"))
+
+# Sinónimos (normalizados) de las columnas numéricas
+COLUMN_SYNONYMS: Dict[str, List[str]] = {
+    "fc_agregado_carrito_cant": [
+        "agregados al carrito", "agregado al carrito", "anadidos al carrito",
+        "anadido al carrito", "agregados a carrito", "carritos", "carrito",
+    ],
+    "fc_ingreso_producto_monto": [
+        "ingresos", "ingreso", "facturacion", "ventas", "monto", "importe", "revenue",
+    ],
+    "fc_detalle_producto_cant": [
+        "vistas de detalle", "detalles de producto", "detalles", "detalle",
+        "visualizaciones", "vistas",
+    ],
+    "fc_producto_cant": [
+        "unidades vendidas", "unidades", "cantidad de productos", "productos vendidos",
+    ],
+    "id_cli_cliente": ["id de cliente", "cliente"],
+    "id_ga_fuente_medio": ["fuente medio", "fuente", "medio"],
+    "id_ga_producto": ["id de producto", "id producto"],
+    "id_tie_fecha_valor": ["id de fecha", "fecha"],
+    "flag_pipol": ["flag pipol", "pipol"],
+}
+
+# Frases de comparación en español (normalizadas) y su operador
+COMPARISON_PHRASES: Dict[str, str] = {
+    "mas de": ">",
+    "mayor que": ">",
+    "mayor a": ">",
+    "mayores que": ">",
+    "mayores a": ">",
+    "superior a": ">",
+    "por encima de": ">",
+    ">": ">",
+    "menos de": "<",
+    "menor que": "<",
+    "menor a": "<",
+    "menores que": "<",
+    "menores a": "<",
+    "inferior a": "<",
+    "por debajo de": "<",
+    "<": "<",
+    "al menos": ">=",
+    "como minimo": ">=",
+    "minimo": ">=",
+    "mayor o igual a": ">=",
+    "mayor o igual que": ">=",
+    ">=": ">=",
+    "como maximo": "<=",
+    "a lo sumo": "<=",
+    "maximo": "<=",
+    "menor o igual a": "<=",
+    "menor o igual que": "<=",
+    "<=": "<=",
+    "igual a": "=",
+    "exactamente": "=",
+    "=": "=",
+    "distinto de": "!=",
+    "diferente de": "!=",
+}
+
+# Columnas de texto cuyos valores se buscan literalmente en la consulta
+VALUE_COLUMNS: Dict[str, List[str]] = {
+    "desc_ga_marca_producto": ["de la marca", "de marca", "marca"],
+    "desc_categoria_prod_principal": [
+        "de la categoria principal", "categoria principal",
+        "de la categoria", "de categoria", "categoria",
+    ],
+}
+
+# Funciones de agregación en español (normalizadas)
+AGGREGATE_PHRASES: Dict[str, str] = {
+    "total": "sum",
+    "totales": "sum",
+    "suma": "sum",
+    "promedio": "avg",
+    "media": "avg",
+    "medio": "avg",
+}
+
+# Conteos: "cuántos clientes" -> count_distinct(id_cli_cliente)
+COUNT_PHRASES = ["cuantos", "cuantas", "numero de", "conteo de"]
+COUNT_TARGETS: Dict[str, Optional[str]] = {
+    "clientes": "id_cli_cliente",
+    "productos": "id_ga_producto",
+    "marcas": "desc_ga_marca_producto",
+    "registros": None,
+    "filas": None,
+    "visitas": None,
+}
+
+# Columnas por las que se puede agrupar ("por marca", "top 5 marcas")
+GROUP_BY_SYNONYMS: Dict[str, str] = {
+    "marca": "desc_ga_marca_producto",
+    "marcas": "desc_ga_marca_producto",
+    "categoria principal": "desc_categoria_prod_principal",
+    "categorias principales": "desc_categoria_prod_principal",
+    "categoria": "desc_categoria_prod_principal",
+    "categorias": "desc_categoria_prod_principal",
+    "fecha": "id_tie_fecha_valor",
+    "fechas": "id_tie_fecha_valor",
+    "dia": "id_tie_fecha_valor",
+    "fuente medio": "id_ga_fuente_medio",
+    "fuente": "id_ga_fuente_medio",
+    "fuentes": "id_ga_fuente_medio",
+    "cliente": "id_cli_cliente",
+    "clientes": "id_cli_cliente",
+    "producto": "desc_ga_nombre_producto_1",
+    "productos": "desc_ga_nombre_producto_1",
+    "sku": "desc_ga_sku_producto_1",
+}
+
+# Palabras que no aportan filtros y no penalizan la confianza
+_STOP_WORDS = {
+    "a", "al", "con", "cual", "cuales", "cuyo", "cuya", "dame", "de", "del",
+    "donde", "el", "en", "es", "esta", "estan", "filas", "hay", "la", "las",
+    "lista", "listar", "lo", "los", "me", "muestra", "muestrame", "obtener",
+    "obten", "por", "favor", "producto", "productos", "que", "quiero",
+    "registros", "datos", "se", "sea", "sean", "son", "tengan", "tenga",
+    "tienen", "tiene", "todas", "todos", "un", "una", "unos", "unas", "ver", "y",
+}
+
+_NUMBER = r"(?P<num>\d+(?:[.,]\d+)?)"
+_LINK = r"(?:(?:en|de|del|el|la|los|las|al|unidades|veces)\s+)*"
+_VERB = r"(?:(?:es|sea|sean|son|con|de|que|un|una|tenga|tengan)\s+)*"
+
+
+def _alternation(phrases) -> str:
+    return "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+
+
+def _to_number(value: str):
+    value = value.replace(",", ".")
+    return float(value) if "." in value else int(value)
+
+
+class RuleBasedParser:
+    """
+    Traductor determinista de consultas sencillas a filtros.
+
+    Reconoce sinónimos de columnas, comparaciones en español con umbrales
+    numéricos, valores de marca/categoría presentes en la tabla y
+    agregaciones sencillas (totales, promedios, conteos, "por marca",
+    "top N"). Devuelve los filtros con el mismo formato que
+    `NLPProcessor._parse_filters`, la agregación con el formato de
+    `aggregation.validate_aggregation` y una confianza igual a la fracción
+    de palabras de la consulta que ha entendido; por debajo de
+    `min_confidence` la consulta debe ir al LLM.
+    """
+
+    def __init__(
+        self,
+        min_confidence: float = RULES_MIN_CONFIDENCE,
+        vocabulary_ttl: float = VOCABULARY_TTL,
+    ):
+        self.min_confidence = min_confidence
+        self.vocabulary_ttl = vocabulary_ttl
+        self._vocabulary: Dict[str, Dict[str, str]] = {}
+        self._value_patterns: Dict[str, re.Pattern] = {}
+        self._loaded_at = 0.0
+
+        synonyms = {
+            synonym: column
+            for column, values in COLUMN_SYNONYMS.items()
+            for synonym in values
+        }
+        self._synonyms = synonyms
+        columns = f"(?P<col>{_alternation(synonyms)})"
+        comparison = f"(?P<cmp>{_alternation(COMPARISON_PHRASES)})"
+        self._comparison_patterns = [
+            # "con más de 5 en carrito"
+            re.compile(rf"(?<!\w){comparison}\s+{_NUMBER}\s+{_LINK}{columns}(?!\w)"),
+            # "ingresos mayores que 100", "carrito >= 3"
+            re.compile(rf"(?<!\w){columns}\s+{_VERB}{comparison}\s+{_NUMBER}(?!\w)"),
+            # "5 o más en carrito"
+            re.compile(
+                rf"(?<!\w){_NUMBER}\s+o\s+(?P<suffix>mas|menos)\s+{_LINK}{columns}(?!\w)"
+            ),
+        ]
+
+        aggregate = f"(?P<func>{_alternation(AGGREGATE_PHRASES)})"
+        dimension = f"(?P<dim>{_alternation(GROUP_BY_SYNONYMS)})"
+        self._metric_patterns = [
+            # "total de ingresos", "promedio de carrito"
+            re.compile(rf"(?<!\w){aggregate}\s+(?:de\s+)?(?:(?:los|las|el|la)\s+)?{columns}(?!\w)"),
+            # "ingreso total", "ventas promedio"
+            re.compile(rf"(?<!\w){columns}\s+{aggregate}(?!\w)"),
+        ]
+        self._count_pattern = re.compile(
+            rf"(?<!\w)(?P<func>{_alternation(COUNT_PHRASES)})\s+"
+            rf"(?P<target>{_alternation(COUNT_TARGETS)})(?!\w)"
+        )
+        self._group_pattern = re.compile(
+            rf"(?<!\w)(?:agrupad[oa]s?\s+)?por\s+{dimension}"
+            rf"(?:\s+y\s+(?P<dim2>{_alternation(GROUP_BY_SYNONYMS)}))?(?!\w)"
+        )
+        self._top_pattern = re.compile(
+            rf"(?<!\w)(?:top|(?:los|las)(?=\s+\d+\s+(?:primer|mejor|mayor|princip|peor|menor|ultim)))"
+            rf"\s+(?P<n>\d+)(?:\s+(?P<rank>primer[oa]s|mejores|mayores|principales|peores|menores|ultim[oa]s))?"
+            rf"(?:\s+{dimension})?(?!\w)"
+        )
+        # "top 5 marcas por ingresos": la métrica por la que se ordena
+        self._rank_metric_pattern = re.compile(rf"(?<!\w)por\s+{_LINK}{columns}(?!\w)")
+
+    def needs_vocabulary(self) -> bool:
+        return not self._vocabulary or time.time() - self._loaded_at >= self.vocabulary_ttl
+
+    def load_vocabulary(self, db: Session):
+        """Carga los valores distintos de las columnas de texto buscables"""
+        vocabulary = {}
+        for column in VALUE_COLUMNS:
+            attribute = getattr(ChallengeData, column)
+            values = db.execute(
+                select(attribute).where(attribute.isnot(None)).distinct()
+            ).scalars()
+            vocabulary[column] = {
+                normalize_query(value): value for value in values if normalize_query(value)
+            }
+        self.set_vocabulary(vocabulary)
+
+    def set_vocabulary(self, vocabulary: Dict[str, Dict[str, str]]):
+        """Fija el vocabulario `columna -> {valor normalizado: valor}`"""
+        self._vocabulary = vocabulary
+        self._value_patterns = {
+            column: re.compile(rf"(?<!\w)(?P<value>{_alternation(values)})(?!\w)")
+            for column, values in vocabulary.items()
+            if values
+        }
+        self._loaded_at = time.time()
+
+    def parse(self, query: str) -> Tuple[Dict, Optional[Dict], float]:
+        """
+        Traduce la consulta a filtros y, si la hay, a una agregación.
+
+        Returns:
+            Tuple[Dict, Optional[Dict], float]: Filtros, agregación y confianza entre 0 y 1
+        """
+        text = normalize_query(query)
+        consumed = [False] * len(text)
+        filters: Dict[str, Dict] = {}
+
+        def free(start: int, end: int) -> bool:
+            return not any(consumed[start:end])
+
+        def consume(start: int, end: int):
+            for i in range(start, end):
+                consumed[i] = True
+
+        for column, pattern in self._value_patterns.items():
+            for match in pattern.finditer(text):
+                if column in filters or not free(match.start(), match.end()):
+                    continue
+                filters[column] = {
+                    "op": "=",
+                    "value": self._vocabulary[column][match.group("value")],
+                }
+                consume(match.start(), match.end())
+                keyword = self._keyword_before(text, match.start(), VALUE_COLUMNS[column])
+                if keyword is not None:
+                    consume(*keyword)
+
+        for pattern in self._comparison_patterns:
+            for match in pattern.finditer(text):
+                column = self._synonyms[match.group("col")]
+                if column in filters or not free(match.start(), match.end()):
+                    continue
+                if "suffix" in match.groupdict() and match.group("suffix"):
+                    op = ">=" if match.group("suffix") == "mas" else "<="
+                else:
+                    op = COMPARISON_PHRASES[match.group("cmp")]
+                filters[column] = {"op": op, "value": _to_number(match.group("num"))}
+                consume(match.start(), match.end())
+
+        group_by: List[str] = []
+        metrics: List[Dict] = []
+        aggregation: Dict = {}
+
+        def add_group(dimension: Optional[str]):
+            if dimension and GROUP_BY_SYNONYMS[dimension] not in group_by:
+                group_by.append(GROUP_BY_SYNONYMS[dimension])
+
+        for match in self._top_pattern.finditer(text):
+            if not free(match.start(), match.end()):
+                continue
+            aggregation["limit"] = int(match.group("n"))
+            rank = match.group("rank") or ""
+            aggregation["order"] = "asc" if rank.startswith(("peor", "menor", "ultim")) else "desc"
+            add_group(match.group("dim"))
+            consume(match.start(), match.end())
+
+        for match in self._group_pattern.finditer(text):
+            if not free(match.start(), match.end()):
+                continue
+            add_group(match.group("dim"))
+            add_group(match.group("dim2"))
+            consume(match.start(), match.end())
+
+        for pattern in self._metric_patterns:
+            for match in pattern.finditer(text):
+                if not free(match.start(), match.end()):
+                    continue
+                metrics.append({
+                    "func": AGGREGATE_PHRASES[match.group("func")],
+                    "column": self._synonyms[match.group("col")],
+                })
+                consume(match.start(), match.end())
+
+        for match in self._count_pattern.finditer(text):
+            if not free(match.start(), match.end()):
+                continue
+            target = COUNT_TARGETS[match.group("target")]
+            metrics.append({"func": "count_distinct" if target else "count", "column": target})
+            consume(match.start(), match.end())
+
+        if group_by and not metrics:
+            for match in self._rank_metric_pattern.finditer(text):
+                if free(match.start(), match.end()):
+                    metrics.append({"func": "sum", "column": self._synonyms[match.group("col")]})
+                    consume(match.start(), match.end())
+                    break
+
+        parsed_aggregation = None
+        if group_by or metrics or aggregation:
+            aggregation.update({"group_by": group_by, "metrics": metrics})
+            parsed_aggregation = validate_aggregation(aggregation)
+
+        confidence = self._confidence(text, consumed, filters or parsed_aggregation)
+        return filters, parsed_aggregation, confidence
+
+    @staticmethod
+    def _keyword_before(text: str, position: int, keywords: List[str]) -> Optional[Tuple[int, int]]:
+        prefix = text[:position].rstrip()
+        for keyword in sorted(keywords, key=len, reverse=True):
+            if prefix.endswith(keyword):
+                start = len(prefix) - len(keyword)
+                if start == 0 or not text[start - 1].isalnum():
+                    return start, len(prefix)
+        return None
+
+    @staticmethod
+    def _confidence(text: str, consumed: List[bool], understood_anything) -> float:
+        if not understood_anything:
+            return 0.0
+        total = understood = 0
+        for match in re.finditer(r"\S+", text):
+            word = match.group().strip(".,")
+            if not word or word in _STOP_WORDS:
+                continue
+            total += 1
+            if all(consumed[match.start():match.end()]):
+                understood += 1
+        return round(understood / total, 2) if total else 1.0
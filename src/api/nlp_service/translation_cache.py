@@ -0,0 +1,235 @@
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Configuración de la caché de traducciones
+CACHE_MAX_ENTRIES = int(os.getenv("NLP_CACHE_MAX_ENTRIES", "2048"))
+CACHE_TTL = float(os.getenv("NLP_CACHE_TTL", "3600"))
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("NLP_CACHE_SIMILARITY_THRESHOLD", "0.9"))
+# Candidatos (los que más trigramas comparten) que se puntúan por consulta
+CACHE_SIMILARITY_CANDIDATES = int(os.getenv("NLP_CACHE_SIMILARITY_CANDIDATES", "32"))
+CACHE_REDIS_URL = os.getenv("NLP_CACHE_REDIS_URL")
+
+_NON_WORD = re.compile(r"[^\w\s<>=.,]")
+_SPACES = re.compile(r"\s+")
+# Números, comparadores y negaciones cambian el significado de la consulta:
+# dos consultas que difieren en ellos nunca se consideran paráfrasis
+_SIGNIFICANT = re.compile(r"\d+(?:[.,]\d+)?|[<>=]+|\bno\b|\bsin\b|\bdistinto\b")
+# Palabras que se pueden añadir o quitar sin cambiar la traducción
+_FILLER_WORDS = {
+    "a", "al", "cual", "cuales", "dame", "de", "del", "el", "en", "es", "esta",
+    "estan", "hay", "la", "las", "lista", "listar", "lo", "los", "me", "muestra",
+    "muestrame", "obtener", "obten", "por", "favor", "que", "quiero", "se", "son",
+    "todas", "todos", "un", "una", "unos", "unas", "ver", "y",
+}
+# Similitud mínima entre dos palabras distintas para tratarlas como una errata
+_TYPO_SIMILARITY = 0.6
+
+
+def normalize_query(query: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con espacios colapsados"""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("!=", " distinto de ")
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip(" .,")
+
+
+def _trigrams(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    if not norm:
+        return 0.0
+    return sum(count * b.get(gram, 0) for gram, count in a.items()) / norm
+
+
+def _same_content(a: str, b: str) -> bool:
+    """
+    Comprueba que dos consultas solo difieren en palabras de relleno o erratas.
+
+    Evita que "marca nike" y "marca puma" se consideren paráfrasis aunque
+    compartan casi todos los trigramas.
+    """
+    if _SIGNIFICANT.findall(a) != _SIGNIFICANT.findall(b):
+        return False
+    words_a = set(a.split()) - _FILLER_WORDS
+    words_b = set(b.split()) - _FILLER_WORDS
+    only_a, only_b = words_a - words_b, words_b - words_a
+
+    def has_typo_match(word: str, others: set) -> bool:
+        return any(_cosine(_trigrams(word), _trigrams(o)) >= _TYPO_SIMILARITY for o in others)
+
+    return (
+        all(has_typo_match(word, only_b) for word in only_a)
+        and all(has_typo_match(word, only_a) for word in only_b)
+    )
+
+
+class _SimilarityIndex:
+    """
+    Índice local de trigramas de caracteres para encontrar paráfrasis.
+
+    Cada consulta se representa como un vector de trigramas; la similitud
+    es el coseno entre vectores. Un índice invertido trigrama -> consultas
+    limita la comparación a los `max_candidates` que más trigramas comparten
+    con la consulta, y solo se aceptan candidatos con los mismos números,
+    comparadores y palabras de contenido (salvo erratas).
+    """
+
+    def __init__(self, max_candidates: int = CACHE_SIMILARITY_CANDIDATES):
+        self.max_candidates = max_candidates
+        self._vectors: Dict[str, Tuple[Counter, float]] = {}
+        self._postings: Dict[str, set] = {}
+
+    def add(self, key: str):
+        if key in self._vectors:
+            return
+        vector = _trigrams(key)
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        self._vectors[key] = (vector, norm)
+        for gram in vector:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str):
+        entry = self._vectors.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry[0]:
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def most_similar(self, key: str) -> Tuple[Optional[str], float]:
+        vector = _trigrams(key)
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if not norm:
+            return None, 0.0
+
+        # Con muchas entradas casi todas comparten algún trigrama frecuente:
+        # solo se puntúan las que más comparten, que son las únicas que
+        # pueden acercarse al umbral de similitud
+        shared = Counter()
+        for gram in vector:
+            shared.update(self._postings.get(gram, ()))
+
+        best_key, best_score = None, 0.0
+        for candidate, _ in shared.most_common(self.max_candidates):
+            if not _same_content(key, candidate):
+                continue
+            other, other_norm = self._vectors[candidate]
+            dot = sum(count * other.get(gram, 0) for gram, count in vector.items())
+            score = dot / (norm * other_norm)
+            if score > best_score:
+                best_key, best_score = candidate, score
+        return best_key, best_score
+
+
+class TranslationCache:
+    """
+    Caché de traducciones consulta en lenguaje natural -> filtros y agregación.
+
+    Primero busca por el texto normalizado y, si no hay coincidencia, por
+    similitud de trigramas por encima de `similarity_threshold`. Las
+    entradas caducan por TTL y se expulsan por LRU. Si se configura un
+    backend compartido (Redis), los aciertos exactos se comparten entre
+    workers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL,
+        similarity_threshold: float = CACHE_SIMILARITY_THRESHOLD,
+        similarity_candidates: int = CACHE_SIMILARITY_CANDIDATES,
+        redis_url: Optional[str] = CACHE_REDIS_URL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.similarity_candidates = similarity_candidates
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._index = _SimilarityIndex(similarity_candidates)
+        self._shared = None
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self._shared = redis.from_url(redis_url)
+            except ImportError:
+                print("⚠️ NLP_CACHE_REDIS_URL definido pero el paquete redis no está instalado")
+
+    async def get(self, query: str) -> Optional[dict]:
+        """Devuelve la traducción cacheada para la consulta o None"""
+        key = normalize_query(query)
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        if self._shared is not None:
+            try:
+                raw = await self._shared.get(self._shared_key(key))
+            except Exception as e:
+                print(f"⚠️ Error leyendo la caché compartida: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._set_local(key, value)
+                return value
+
+        similar_key, score = self._index.most_similar(key)
+        if similar_key is not None and score >= self.similarity_threshold:
+            return self._get_local(similar_key)
+        return None
+
+    async def set(self, query: str, value: dict):
+        """Guarda la traducción de la consulta"""
+        key = normalize_query(query)
+        self._set_local(key, value)
+        if self._shared is not None:
+            try:
+                await self._shared.set(
+                    self._shared_key(key), json.dumps(value), ex=int(self.ttl)
+                )
+            except Exception as e:
+                print(f"⚠️ Error escribiendo la caché compartida: {e}")
+
+    def clear(self):
+        self._entries.clear()
+        self._index = _SimilarityIndex(self.similarity_candidates)
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: dict):
+        self._entries[key] = (value, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        self._index.add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+
+    def _evict(self, key: str):
+        self._entries.pop(key, None)
+        self._index.remove(key)
+
+    @staticmethod
+    def _shared_key(key: str) -> str:
+        return f"nlp:translation:v2:{key}"
@@ -0,0 +1,215 @@
+import operator
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.sql import Select
+
+from .models import ChallengeData
+
+# Funciones de agregación soportadas
+AGGREGATE_FUNCTIONS = {
+    "sum": func.sum,
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+    "count": func.count,
+    "count_distinct": lambda column: func.count(column.distinct()),
+}
+
+# Operadores de filtro soportados (`{"columna": {"op": "=", "value": ...}}`)
+FILTER_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "between": lambda column, value: column.between(*value),
+}
+
+# Funciones que solo tienen sentido sobre columnas numéricas
+NUMERIC_FUNCTIONS = {"sum", "avg"}
+
+# Número máximo de grupos que se devuelven
+MAX_AGGREGATE_ROWS = 1000
+
+COLUMNS = ChallengeData.__table__.columns
+
+_GROUP_BY = re.compile(r"AGRUPAR\s+POR\s*:[ \t]*([\w \t,]+)", re.IGNORECASE)
+_METRIC = re.compile(r"(count_distinct|sum|avg|min|max|count)\s*\(\s*(\*|\w+)\s*\)", re.IGNORECASE)
+_ORDER = re.compile(r"ORDEN\s*:\s*(asc|desc)", re.IGNORECASE)
+_LIMIT = re.compile(r"L[IÍ]MITE\s*:\s*(\d+)", re.IGNORECASE)
+
+
+def parse_aggregation(response: str) -> Optional[Dict]:
+    """
+    Extrae la intención de agregación de la respuesta del LLM.
+
+    Ejemplo:
+    "AGRUPAR POR: desc_ga_marca_producto
+     METRICA: sum(fc_ingreso_producto_monto)
+     ORDEN: desc
+     LIMITE: 10"
+
+    Returns:
+        Optional[Dict]: Especificación de agregación o None si no hay
+    """
+    group_by = []
+    match = _GROUP_BY.search(response)
+    if match:
+        group_by = [c.strip() for c in match.group(1).split(",") if c.strip()]
+
+    metrics = [
+        {"func": name.lower(), "column": None if column == "*" else column}
+        for name, column in _METRIC.findall(response)
+    ]
+
+    if not group_by and not metrics:
+        return None
+
+    aggregation = {"group_by": group_by, "metrics": metrics}
+    order = _ORDER.search(response)
+    if order:
+        aggregation["order"] = order.group(1).lower()
+    limit = _LIMIT.search(response)
+    if limit:
+        aggregation["limit"] = int(limit.group(1))
+    return validate_aggregation(aggregation)
+
+
+def parse_metric(value: str) -> Optional[Dict]:
+    """Convierte `sum(columna)`, `count(*)`... en una métrica sin validar"""
+    match = _METRIC.fullmatch(value.strip())
+    if not match:
+        return None
+    name, column = match.groups()
+    return {"func": name.lower(), "column": None if column == "*" else column}
+
+
+def validate_aggregation(aggregation: Dict) -> Optional[Dict]:
+    """
+    Descarta columnas y funciones desconocidas.
+
+    Si no queda ninguna métrica se cuenta el número de filas.
+    """
+    group_by = [c for c in aggregation.get("group_by", []) if c in COLUMNS]
+    metrics = []
+    for metric in aggregation.get("metrics", []):
+        name, column = metric.get("func"), metric.get("column")
+        if name not in AGGREGATE_FUNCTIONS:
+            continue
+        if column is not None and column not in COLUMNS:
+            continue
+        if column is None and name != "count":
+            continue
+        if name in NUMERIC_FUNCTIONS and COLUMNS[column].type.python_type not in (int, float):
+            continue
+        metrics.append({"func": name, "column": column})
+
+    if not group_by and not metrics:
+        return None
+    if not metrics:
+        metrics = [{"func": "count", "column": None}]
+
+    validated = {"group_by": group_by, "metrics": metrics}
+    if aggregation.get("order") in ("asc", "desc"):
+        validated["order"] = aggregation["order"]
+    if aggregation.get("limit"):
+        validated["limit"] = min(int(aggregation["limit"]), MAX_AGGREGATE_ROWS)
+    return validated
+
+
+def metric_label(metric: Dict) -> str:
+    """Nombre de la columna de resultado, p. ej. `sum_fc_ingreso_producto_monto`"""
+    return f"{metric['func']}_{metric['column'] or 'filas'}"
+
+
+class InvalidFilterError(ValueError):
+    """Valor de filtro que no se puede convertir al tipo de su columna"""
+
+
+def _coerce_value(column, value):
+    """
+    Convierte el valor de un filtro al tipo Python de la columna.
+
+    Los filtros del LLM y de la caché de traducciones llegan como texto;
+    asyncpg no convierte los parámetros (`integer >= varchar` falla en
+    PostgreSQL), así que se convierten aquí.
+
+    Raises:
+        InvalidFilterError: Si el valor no es del tipo de la columna
+    """
+    python_type = column.type.python_type
+    if value is None or (isinstance(value, python_type) and not isinstance(value, bool)):
+        return value
+    try:
+        if python_type is int:
+            number = float(value)
+            if not number.is_integer():
+                raise ValueError(value)
+            return int(number)
+        return python_type(value)
+    except (TypeError, ValueError):
+        raise InvalidFilterError(f"Valor no válido para {column.key}: {value!r}")
+
+
+def filter_clauses(filters: Dict, columns=COLUMNS) -> List:
+    """
+    Convierte los filtros en condiciones SQL sobre `columns`.
+
+    Por defecto son las columnas de `challenge_graphql_nlp_api`; las tablas
+    de rollup pasan las suyas. Se ignoran los operadores desconocidos.
+
+    Raises:
+        InvalidFilterError: Si algún valor no es del tipo de su columna
+    """
+    clauses = []
+    for field, condition in filters.items():
+        compare = FILTER_OPERATORS.get(condition["op"])
+        if compare is None:
+            continue
+        column = columns[field]
+        value = condition["value"]
+        if condition["op"] == "between":
+            value = [_coerce_value(column, item) for item in value]
+        else:
+            value = _coerce_value(column, value)
+        clauses.append(compare(column, value))
+    return clauses
+
+
+def order_and_limit(stmt: Select, group_columns: List, metric_columns: List, aggregation: Dict) -> Select:
+    """
+    Ordena por la primera métrica (descendente por defecto si hay límite,
+    para responder a "top N") o por las columnas de agrupación.
+    """
+    order = aggregation.get("order") or ("desc" if aggregation.get("limit") else None)
+    if order and metric_columns:
+        first = metric_columns[0]
+        stmt = stmt.order_by(first.desc() if order == "desc" else first.asc())
+    elif group_columns:
+        stmt = stmt.order_by(*group_columns)
+
+    return stmt.limit(aggregation.get("limit") or MAX_AGGREGATE_ROWS)
+
+
+def build_aggregate_query(filter_clauses: List, aggregation: Dict) -> Select:
+    """Compila la agregación en una única consulta SQL con GROUP BY"""
+    group_columns = [COLUMNS[c] for c in aggregation["group_by"]]
+    metric_columns = []
+    for metric in aggregation["metrics"]:
+        column = COLUMNS[metric["column"]] if metric["column"] else None
+        if column is None:
+            expression = func.count()
+        else:
+            expression = AGGREGATE_FUNCTIONS[metric["func"]](column)
+        metric_columns.append(expression.label(metric_label(metric)))
+
+    stmt = select(*group_columns, *metric_columns).select_from(ChallengeData)
+    if filter_clauses:
+        stmt = stmt.where(and_(*filter_clauses))
+    if group_columns:
+        stmt = stmt.group_by(*group_columns)
+
+    return order_and_limit(stmt, group_columns, metric_columns, aggregation)
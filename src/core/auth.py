@@ -1,12 +1,15 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from fastapi.security.utils import get_authorization_scheme_param
+from jose import JWTError
 from typing import Optional
 import os
 from dotenv import load_dotenv
 import ssl
 import certifi
 
+from .token_verifier import TokenVerifier
+
 load_dotenv()
 
 # Configuración de Keycloak
@@ -15,10 +18,24 @@ KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "")
 KEYCLOAK_CLIENT_ID = os.getenv("KEYCLOAK_CLIENT_ID", "")
 KEYCLOAK_CLIENT_SECRET = os.getenv("KEYCLOAK_CLIENT_SECRET", "")
 KEYCLOAK_ALGORITHMS = ["RS256"]
+KEYCLOAK_JWKS_URL = os.getenv(
+    "KEYCLOAK_JWKS_URL",
+    f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs"
+)
+# Fichero con un JWKS o una clave PEM; si se define no se consulta Keycloak
+KEYCLOAK_JWKS_FILE = os.getenv("KEYCLOAK_JWKS_FILE")
 
 # Configuración de SSL
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 
+# Verificador compartido: las claves del realm se descargan una sola vez
+token_verifier = TokenVerifier(
+    jwks_url=KEYCLOAK_JWKS_URL,
+    key_file=KEYCLOAK_JWKS_FILE,
+    algorithms=tuple(KEYCLOAK_ALGORITHMS),
+    http_verify=ssl_context,
+)
+
 # Configuración de OAuth2
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/token"
@@ -44,22 +61,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     )
     
     try:
-        # Obtener la clave pública de Keycloak
-        from keycloak import KeycloakOpenID
-        keycloak_openid = KeycloakOpenID(
-            server_url=KEYCLOAK_URL,
-            client_id=KEYCLOAK_CLIENT_ID,
-            realm_name=KEYCLOAK_REALM,
-            client_secret_key=KEYCLOAK_CLIENT_SECRET,
-            verify=True,
-            custom_headers={"User-Agent": "challenge-api"}
-        )
-        
-        # Verificar el token
-        token_info = keycloak_openid.decode_token(
-            token,
-            keycloak_openid.public_key()
-        )
+        # Verificar el token con las claves cacheadas del realm
+        token_info = await token_verifier.verify(token)
 
         if token_info.get("aud") != "account" or token_info.get("azp") != KEYCLOAK_CLIENT_ID:
             raise HTTPException(
@@ -71,10 +74,41 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
             raise credentials_exception
 
         return token_info
+    except HTTPException:
+        raise
     except JWTError:
         raise credentials_exception
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        ) 
\ No newline at end of file
+        ) 
+
+def get_bearer_token(request: Request) -> Optional[str]:
+    """Extrae el token de la cabecera `Authorization: Bearer <token>`"""
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token
+
+async def get_current_user_from_request(request: Request) -> dict:
+    """
+    Verifica el token de una petición que no pasa por las dependencias de FastAPI.
+    
+    Args:
+        request: Petición HTTP (p. ej. `info.context["request"]` en GraphQL)
+    
+    Returns:
+        dict: Información del usuario
+    
+    Raises:
+        HTTPException: Si falta el token o es inválido
+    """
+    token = get_bearer_token(request)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token)
@@ -0,0 +1,270 @@
+import os
+from collections import OrderedDict
+from enum import Enum
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Table, delete, func, insert, or_, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .dataset_version import dataset_versions, read_version_query
+from .models import (
+    Base,
+    CategoryNode,
+    ChallengeCategory,
+    ChallengeData,
+    ChallengeProductCategory,
+)
+
+# Árboles de categorías memorizados (pares versión de los datos, ruta)
+CATEGORY_TREE_CACHE_SIZE = int(os.getenv("CATEGORY_TREE_CACHE_SIZE", "256"))
+
+CATEGORY_TABLES = [ChallengeCategory.__table__, ChallengeProductCategory.__table__]
+DATA_TABLE = ChallengeData.__table__
+
+
+class CategoryMatch(str, Enum):
+    """Modo de filtrado por categoría"""
+    EXACT = "exact"
+    DESCENDANTS = "descendants"
+
+
+def split_category_paths(value: Optional[str]) -> List[str]:
+    """Separa `desc_categoria_producto` en sus rutas de categoría"""
+    if not value:
+        return []
+    return [path.strip() for path in value.split(",") if path.strip()]
+
+
+def rebuild_category_tables(connection: Connection, source: Table = DATA_TABLE) -> Tuple[int, int]:
+    """
+    Materializa la jerarquía de categorías a partir de la tabla de datos.
+
+    Recorre una sola vez la tabla de datos, crea un nodo por cada prefijo
+    de ruta (con su padre y profundidad) y enlaza cada fila con las
+    categorías hoja de sus rutas. Se ejecuta dentro de la transacción de la
+    carga (`load_csv`), así que los lectores ven la jerarquía anterior con
+    los datos anteriores hasta el commit.
+
+    Args:
+        connection: Conexión con la transacción de la carga
+        source: Tabla de la que se leen las filas (la de staging en una
+            carga `replace`, antes del intercambio)
+
+    Returns:
+        Tuple[int, int]: Número de categorías y de enlaces creados
+    """
+    Base.metadata.create_all(bind=connection, tables=CATEGORY_TABLES)
+    # Índices añadidos después de crear las tablas en instalaciones existentes
+    for table in CATEGORY_TABLES:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+    categories: Dict[str, dict] = {}
+    leaf_ids_by_value: Dict[str, List[int]] = {}
+    links: Set[Tuple[int, int]] = set()
+
+    rows = connection.execute(
+        select(
+            source.c.row_id,
+            source.c.desc_categoria_producto
+        ).where(source.c.desc_categoria_producto.isnot(None))
+    )
+
+    for row_id, value in rows:
+        leaf_ids = leaf_ids_by_value.get(value)
+        if leaf_ids is None:
+            leaf_ids = []
+            for path in split_category_paths(value):
+                current_path = ""
+                parent_id = None
+                for depth, part in enumerate(path.split("/")):
+                    current_path = f"{current_path}/{part}" if current_path else part
+                    category = categories.get(current_path)
+                    if category is None:
+                        category = {
+                            "id": len(categories) + 1,
+                            "path": current_path,
+                            "name": part,
+                            "parent_id": parent_id,
+                            "depth": depth,
+                        }
+                        categories[current_path] = category
+                    parent_id = category["id"]
+                leaf_ids.append(parent_id)
+            leaf_ids_by_value[value] = leaf_ids
+
+        for category_id in leaf_ids:
+            links.add((row_id, category_id))
+
+    connection.execute(delete(ChallengeProductCategory))
+    connection.execute(delete(ChallengeCategory))
+    if categories:
+        connection.execute(insert(ChallengeCategory), list(categories.values()))
+    if links:
+        connection.execute(
+            insert(ChallengeProductCategory),
+            [{"row_id": r, "category_id": c} for r, c in links]
+        )
+
+    for table in CATEGORY_TABLES:
+        connection.exec_driver_sql(f"ANALYZE {table.name}")
+
+    return len(categories), len(links)
+
+
+def category_subtree_condition(path: str):
+    """Condición SQL para una categoría y todos sus descendientes"""
+    return or_(
+        ChallengeCategory.path == path,
+        ChallengeCategory.path.startswith(f"{path}/", autoescape=True)
+    )
+
+
+def category_filter(path: str, match: CategoryMatch = CategoryMatch.DESCENDANTS):
+    """
+    Condición sobre `ChallengeData` para filtrar por categoría.
+
+    Resuelve la categoría en `challenge_categories` (índice por ruta) y
+    las filas a través de `challenge_product_categories`, en lugar de
+    buscar la subcadena en `desc_categoria_producto`.
+
+    Args:
+        path: Ruta de la categoría (ej: "ropa/hombre")
+        match: `exact` solo la propia categoría; `descendants` incluye sus subcategorías
+
+    Returns:
+        Condición SQL aplicable con `where`
+    """
+    path = path.strip().strip("/")
+    if match == CategoryMatch.EXACT:
+        condition = ChallengeCategory.path == path
+    else:
+        condition = category_subtree_condition(path)
+
+    category_ids = select(ChallengeCategory.id).where(condition)
+    row_ids = select(ChallengeProductCategory.row_id).where(
+        ChallengeProductCategory.category_id.in_(category_ids)
+    )
+    return ChallengeData.row_id.in_(row_ids)
+
+
+def build_category_tree(paths: Sequence[str]) -> CategoryNode:
+    """
+    Construye el árbol de categorías a partir de sus rutas.
+
+    Args:
+        paths: Rutas de categoría ordenadas
+
+    Returns:
+        CategoryNode: Nodo raíz con todo el árbol
+    """
+    root = CategoryNode("root", "")
+    for path in paths:
+        root.insert_path(path)
+    return root
+
+
+class CategoryTreeCache:
+    """
+    Árboles de categorías ya leídos, por versión publicada de los datos y ruta.
+
+    La jerarquía solo cambia con una carga, que publica una versión nueva en
+    el mismo commit: con la versión vigente en la clave, un acierto no lee
+    la base de datos. Los árboles se comparten entre peticiones, así que no
+    deben modificarse.
+    """
+
+    def __init__(self, max_entries: int = CATEGORY_TREE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str], List[CategoryNode]]" = OrderedDict()
+
+    def get(self, version: Optional[int], path: str) -> Optional[List[CategoryNode]]:
+        if version is None:
+            return None
+        trees = self._entries.get((version, path))
+        if trees is not None:
+            self._entries.move_to_end((version, path))
+        return trees
+
+    def set(self, version: Optional[int], path: str, trees: List[CategoryNode]):
+        if version is None or self.max_entries <= 0:
+            return
+        self._entries[(version, path)] = trees
+        self._entries.move_to_end((version, path))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+category_trees = CategoryTreeCache()
+
+
+def _read_category_tree(db: Session, path: str) -> Tuple[Optional[int], List[CategoryNode]]:
+    """
+    Lee de la base de datos el árbol de `path` y la versión publicada.
+
+    Con ruta solo se leen la categoría y sus descendientes (índice por
+    prefijo de `path`). La versión se lee en la misma sentencia que las
+    rutas, así que el árbol se guarda bajo la versión de la que es.
+    """
+    paths = select(
+        func.array_agg(aggregate_order_by(ChallengeCategory.path, ChallengeCategory.path))
+    )
+    if path:
+        paths = paths.where(category_subtree_condition(path))
+    version, all_paths = db.execute(
+        select(read_version_query().scalar_subquery(), paths.scalar_subquery())
+    ).one()
+
+    root = build_category_tree(all_paths or ())
+    if path:
+        node = root.find_node(path)
+        return version, [node] if node else []
+    return version, root.children
+
+
+def load_category_tree(db: Session, path: Optional[str] = None) -> List[CategoryNode]:
+    """
+    Lee la jerarquía materializada y la devuelve como árbol.
+
+    Args:
+        db: Sesión de la base de datos
+        path: Si se indica, solo se devuelve el subárbol de esa ruta
+
+    Returns:
+        List[CategoryNode]: Nodos raíz (o la raíz del subárbol pedido)
+    """
+    return load_category_trees(db, [path])[0]
+
+
+def load_category_trees(db: Session, paths: List[Optional[str]]) -> List[List[CategoryNode]]:
+    """
+    Versión por lotes de `load_category_tree`.
+
+    Los árboles se buscan primero en `category_trees` con la versión
+    vigente; solo las rutas que no están se leen de la base de datos.
+
+    Args:
+        db: Sesión de la base de datos
+        paths: Rutas pedidas (None o vacía para los nodos raíz)
+
+    Returns:
+        List[List[CategoryNode]]: Nodos de cada ruta, en el mismo orden
+    """
+    version = dataset_versions.current()
+    found: Dict[str, List[CategoryNode]] = {}
+    trees = []
+    for path in paths:
+        path = (path or "").strip().strip("/")
+        if path not in found:
+            cached = category_trees.get(version, path)
+            if cached is None:
+                read_version, cached = _read_category_tree(db, path)
+                category_trees.set(read_version, path, cached)
+            found[path] = cached
+        trees.append(found[path])
+    return trees
@@ -0,0 +1,383 @@
+import hashlib
+import io
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import Float, Index, Integer, MetaData, Table, insert, inspect, select, text, update
+from sqlalchemy.engine import Engine, Row
+
+from .categories import rebuild_category_tables
+from .dataset_version import publish_dataset_version
+from .models import ChallengeData, ChallengeProductCategory, DatasetVersion, LoadManifest
+from .rollups import rebuild_rollup_tables, rollups_built
+
+logger = logging.getLogger(__name__)
+
+# Filas por lote al leer el CSV y enviarlo con COPY
+CSV_LOAD_CHUNK_SIZE = int(os.getenv("CSV_LOAD_CHUNK_SIZE", "50000"))
+# replace: tabla nueva e intercambio atómico; append/upsert: carga incremental por fecha
+CSV_LOAD_MODE = os.getenv("CSV_LOAD_MODE", "replace")
+LOAD_MODES = ("replace", "append", "upsert")
+
+DATA_TABLE = ChallengeData.__table__
+ROW_ID = DATA_TABLE.c.row_id
+# Columnas que vienen del CSV (`row_id` lo asigna PostgreSQL)
+DATA_COLUMNS = [column.name for column in DATA_TABLE.columns if column is not ROW_ID]
+# Las cargas incrementales sustituyen o añaden días completos
+DATE_COLUMN = DATA_TABLE.c.id_tie_fecha_valor.name
+STAGING_TABLE = f"{DATA_TABLE.name}_staging"
+STAGING_INDEX_PREFIX = "stg_"
+
+# Clave del advisory lock que serializa las cargas entre workers
+LOAD_LOCK_KEY = 7305001
+
+
+def _column_kinds() -> Dict[str, str]:
+    """Tipo de cada columna del modelo: `int`, `float` o `str`"""
+    kinds = {}
+    for column in DATA_TABLE.columns:
+        if isinstance(column.type, Integer):
+            kinds[column.name] = "int"
+        elif isinstance(column.type, Float):
+            kinds[column.name] = "float"
+        else:
+            kinds[column.name] = "str"
+    return kinds
+
+
+COLUMN_KINDS = _column_kinds()
+
+
+def coerce_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adapta un lote del CSV a las columnas y tipos de `ChallengeData`.
+
+    Las columnas que no están en el modelo se descartan, las que faltan
+    quedan a NULL y los valores que no encajan con el tipo (texto en una
+    columna numérica, decimales en una entera) se convierten en NULL.
+
+    Args:
+        chunk: Lote leído del CSV (todas las columnas como texto)
+
+    Returns:
+        pd.DataFrame: Lote con las columnas del modelo en su orden
+    """
+    coerced = {}
+    for name in DATA_COLUMNS:
+        if name not in chunk:
+            coerced[name] = pd.Series(pd.NA, index=chunk.index, dtype="object")
+            continue
+
+        kind = COLUMN_KINDS[name]
+        values = chunk[name]
+        if kind == "str":
+            coerced[name] = values.astype("string")
+            continue
+
+        numbers = pd.to_numeric(values, errors="coerce")
+        if kind == "int":
+            numbers = numbers.where(numbers % 1 == 0).astype("Int64")
+        coerced[name] = numbers
+    return pd.DataFrame(coerced, columns=DATA_COLUMNS)
+
+
+def copy_csv(
+    connection,
+    csv_path: str,
+    table_name: str = DATA_TABLE.name,
+    chunk_size: int = CSV_LOAD_CHUNK_SIZE,
+) -> int:
+    """
+    Envía el CSV a una tabla con `COPY FROM STDIN` por lotes.
+
+    Solo se mantiene en memoria un lote cada vez. No hace commit.
+
+    Args:
+        connection: Conexión psycopg2 (p. ej. `engine.raw_connection()`)
+        csv_path: Ruta del CSV
+        table_name: Tabla destino (con las columnas de `ChallengeData`)
+        chunk_size: Filas por lote
+
+    Returns:
+        int: Número de filas cargadas
+    """
+    columns = ", ".join(DATA_COLUMNS)
+    copy_sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    total_rows = 0
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=str):
+            buffer = io.StringIO()
+            coerce_chunk(chunk).to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+
+            total_rows += len(chunk)
+            elapsed = time.perf_counter() - started
+            logger.info("   %d filas (%.0f filas/s)", total_rows, total_rows / elapsed)
+
+    elapsed = time.perf_counter() - started
+    rate = total_rows / elapsed if elapsed else 0.0
+    logger.info("✅ %d filas cargadas en %.1fs (%.0f filas/s)", total_rows, elapsed, rate)
+    return total_rows
+
+
+def file_fingerprint(path: str) -> Dict:
+    """Hash SHA-256 (leído por bloques), tamaño y fecha de modificación del fichero"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    stat = os.stat(path)
+    return {"file_hash": digest.hexdigest(), "file_size": stat.st_size, "file_mtime": stat.st_mtime}
+
+
+def _last_manifest(connection, file_name: str) -> Optional[Row]:
+    return connection.execute(
+        select(LoadManifest)
+        .where(LoadManifest.file_name == file_name)
+        .order_by(LoadManifest.id.desc())
+        .limit(1)
+    ).first()
+
+
+def _is_unchanged(connection, csv_path: str) -> Tuple[bool, Optional[Dict]]:
+    """
+    Compara el fichero con la última carga registrada.
+
+    Si tamaño y fecha coinciden no se calcula el hash; si no, se calcula y
+    se compara con el registrado. Si solo cambió la fecha se actualiza el
+    manifiesto para no volver a calcular el hash en el próximo arranque.
+
+    Returns:
+        Tuple[bool, Optional[Dict]]: Si no ha cambiado y la huella calculada (si se calculó)
+    """
+    last = _last_manifest(connection, os.path.basename(csv_path))
+    if last is None:
+        return False, None
+    stat = os.stat(csv_path)
+    if last.file_size == stat.st_size and last.file_mtime == stat.st_mtime:
+        return True, None
+    fingerprint = file_fingerprint(csv_path)
+    if last.file_hash != fingerprint["file_hash"]:
+        return False, fingerprint
+    connection.execute(
+        update(LoadManifest)
+        .where(LoadManifest.id == last.id)
+        .values(file_size=fingerprint["file_size"], file_mtime=fingerprint["file_mtime"])
+    )
+    return True, fingerprint
+
+
+def _swap_staging_table(connection):
+    """
+    Sustituye la tabla de datos por la de staging en la misma transacción.
+
+    Los lectores ven la tabla anterior o la nueva completa, nunca una
+    tabla a medio cargar o inexistente. Los índices de staging se
+    renombran con el nombre definitivo para que la próxima carga pueda
+    volver a crearlos.
+    """
+    old_table = f"{DATA_TABLE.name}_old"
+    connection.exec_driver_sql(f"ALTER TABLE IF EXISTS {DATA_TABLE.name} RENAME TO {old_table}")
+    connection.exec_driver_sql(f"ALTER TABLE {STAGING_TABLE} RENAME TO {DATA_TABLE.name}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {old_table}")
+
+    indexes = connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+        {"table": DATA_TABLE.name}
+    ).scalars().all()
+    for index in indexes:
+        if index.startswith(STAGING_INDEX_PREFIX):
+            final_name = index[len(STAGING_INDEX_PREFIX):]
+        elif STAGING_TABLE in index:
+            # Clave primaria: <tabla>_pkey
+            final_name = index.replace(STAGING_TABLE, DATA_TABLE.name)
+        else:
+            continue
+        connection.exec_driver_sql(f"ALTER INDEX {index} RENAME TO {final_name}")
+
+    # La secuencia de `row_id` (BIGSERIAL) se creó con el nombre de staging
+    sequence = connection.execute(
+        text("SELECT pg_get_serial_sequence(:table, :column)"),
+        {"table": DATA_TABLE.name, "column": ROW_ID.name}
+    ).scalar()
+    if sequence and STAGING_TABLE in sequence:
+        final_name = sequence.split(".")[-1].replace(STAGING_TABLE, DATA_TABLE.name)
+        connection.exec_driver_sql(f"ALTER SEQUENCE {sequence} RENAME TO {final_name}")
+
+
+def _load_replace(connection, csv_path: str, chunk_size: int) -> Tuple[int, Table]:
+    """
+    Carga el CSV en una tabla de staging (que después se intercambia por la actual).
+
+    La tabla se crea a partir del modelo (tipos y clave sustituta `row_id`,
+    que numera las filas en el orden del fichero); los
+    índices secundarios se crean después del COPY, que es más rápido que
+    mantenerlos fila a fila.
+
+    Returns:
+        Tuple[int, Table]: Filas cargadas y tabla de staging
+    """
+    staging = DATA_TABLE.to_metadata(MetaData(), name=STAGING_TABLE)
+    staging.indexes.clear()
+    staging.drop(connection, checkfirst=True)
+    staging.create(connection)
+    rows = copy_csv(connection.connection.driver_connection, csv_path, STAGING_TABLE, chunk_size)
+
+    # Los nombres de índice son únicos en el esquema: se crean con prefijo
+    # y recuperan el nombre del modelo en el intercambio
+    for index in DATA_TABLE.indexes:
+        Index(
+            f"{STAGING_INDEX_PREFIX}{index.name}",
+            *[staging.c[column.name] for column in index.columns],
+            unique=index.unique,
+            **index.dialect_kwargs
+        ).create(connection)
+    return rows, staging
+
+
+def _load_incremental(connection, csv_path: str, chunk_size: int, mode: str) -> int:
+    """
+    Añade (`append`) o sustituye (`upsert`) los días del CSV.
+
+    Las filas no tienen una clave natural única, así que la unidad de la
+    carga incremental es la fecha (`id_tie_fecha_valor`): `append` solo
+    inserta las fechas que aún no están en la tabla (recargar un fichero
+    diario no duplica filas) y `upsert` borra y vuelve a insertar las
+    fechas que trae el fichero. El CSV se copia antes a una tabla temporal.
+    """
+    temp_table = f"tmp_{DATA_TABLE.name}"
+    connection.exec_driver_sql(
+        f"CREATE TEMP TABLE {temp_table} (LIKE {DATA_TABLE.name}) ON COMMIT DROP"
+    )
+    connection.exec_driver_sql(f"ALTER TABLE {temp_table} DROP COLUMN {ROW_ID.name}")
+    rows = copy_csv(connection.connection.driver_connection, csv_path, temp_table, chunk_size)
+
+    if mode == "upsert":
+        connection.exec_driver_sql(f"""
+            DELETE FROM {DATA_TABLE.name}
+            WHERE {DATE_COLUMN} IN (SELECT DISTINCT {DATE_COLUMN} FROM {temp_table})
+        """)
+        new_rows = ""
+    else:
+        new_rows = f"""
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {DATA_TABLE.name} d WHERE d.{DATE_COLUMN} = t.{DATE_COLUMN}
+            )
+        """
+
+    # `row_id` sigue el orden del fichero
+    columns = ", ".join(DATA_COLUMNS)
+    connection.exec_driver_sql(f"""
+        INSERT INTO {DATA_TABLE.name} ({columns})
+        SELECT {columns} FROM {temp_table} t
+        {new_rows}
+    """)
+    return rows
+
+
+def _table_is_current(connection) -> bool:
+    """Si la tabla de datos existe y tiene todas las columnas del modelo"""
+    inspector = inspect(connection)
+    if not inspector.has_table(DATA_TABLE.name):
+        return False
+    existing = {column["name"] for column in inspector.get_columns(DATA_TABLE.name)}
+    return all(column.name in existing for column in DATA_TABLE.columns)
+
+
+def _derived_tables_built(connection) -> bool:
+    """Si existen las tablas de categorías y de rollups"""
+    if not inspect(connection).has_table(ChallengeProductCategory.__tablename__):
+        return False
+    return rollups_built(connection)
+
+
+def load_csv(
+    engine: Engine,
+    csv_path: str,
+    mode: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    force: bool = False,
+) -> Optional[int]:
+    """
+    Carga el CSV en la tabla de datos si ha cambiado desde la última carga.
+
+    Un advisory lock de PostgreSQL evita que varios workers carguen a la
+    vez: el resto espera y, al entrar, ve en el manifiesto que la carga ya
+    está hecha. Los datos, la jerarquía de categorías, los rollups y, al
+    final, el registro del manifiesto y la versión publicada de los datos
+    se escriben en la misma transacción:
+    si algún paso falla no queda nada a medias y el siguiente arranque
+    repite la carga. En `replace` las tablas derivadas se calculan desde
+    la de staging y el intercambio es lo último, así que los lectores
+    pasan de golpe de los datos anteriores (con sus categorías y rollups)
+    a los nuevos.
+
+    Args:
+        engine: Motor de SQLAlchemy (psycopg2)
+        csv_path: Ruta del CSV
+        mode: `replace` (tabla nueva con intercambio atómico), `append` o
+            `upsert` (por fecha); por defecto `CSV_LOAD_MODE`
+        chunk_size: Filas por lote (por defecto `CSV_LOAD_CHUNK_SIZE`)
+        force: Cargar aunque el fichero no haya cambiado
+
+    Returns:
+        Optional[int]: Filas cargadas, o None si no había cambios
+    """
+    mode = mode or CSV_LOAD_MODE
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Modo de carga desconocido: {mode}")
+    chunk_size = chunk_size or CSV_LOAD_CHUNK_SIZE
+
+    LoadManifest.__table__.create(engine, checkfirst=True)
+    DatasetVersion.__table__.create(engine, checkfirst=True)
+    with engine.connect() as lock_connection:
+        lock_connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOAD_LOCK_KEY})
+        try:
+            with engine.begin() as connection:
+                # Una tabla de una versión anterior del modelo se vuelve a cargar entera
+                table_current = _table_is_current(connection)
+                unchanged, fingerprint = _is_unchanged(connection, csv_path)
+                if unchanged and table_current and _derived_tables_built(connection) and not force:
+                    logger.info("⏭️ %s no ha cambiado desde la última carga", os.path.basename(csv_path))
+                    # Por si la versión no llegó a publicarse (cargas de versiones anteriores)
+                    publish_dataset_version(connection)
+                    return None
+                fingerprint = fingerprint or file_fingerprint(csv_path)
+
+                replace = mode == "replace" or not table_current
+                if replace:
+                    rows, source = _load_replace(connection, csv_path, chunk_size)
+                else:
+                    rows = _load_incremental(connection, csv_path, chunk_size, mode)
+                    source = DATA_TABLE
+
+                # Estadísticas actualizadas para que el planificador use los índices
+                connection.exec_driver_sql(f"ANALYZE {source.name}")
+
+                total_categories, total_links = rebuild_category_tables(connection, source)
+                logger.info("✅ %d categorías y %d enlaces producto-categoría", total_categories, total_links)
+                for table_name, groups in rebuild_rollup_tables(connection, source).items():
+                    logger.info("✅ %s: %d grupos", table_name, groups)
+
+                if replace:
+                    _swap_staging_table(connection)
+
+                connection.execute(insert(LoadManifest).values(
+                    file_name=os.path.basename(csv_path),
+                    mode=mode,
+                    rows=rows,
+                    loaded_at=datetime.utcnow(),
+                    **fingerprint
+                ))
+                # La versión nueva se publica en el mismo commit (invalida las cachés de respuestas)
+                publish_dataset_version(connection)
+                return rows
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOAD_LOCK_KEY})
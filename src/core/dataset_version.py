@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import Select
+
+from .models import DatasetVersion, LoadManifest
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre comprobaciones de una versión publicada por otro proceso
+DATASET_VERSION_CHECK_INTERVAL = float(os.getenv("DATASET_VERSION_CHECK_INTERVAL", "30"))
+
+# `challenge_dataset_version` tiene una sola fila
+VERSION_ROW_ID = 1
+
+
+def publish_dataset_version(connection: Connection) -> Optional[int]:
+    """
+    Publica como versión vigente la última carga de `challenge_load_manifest`.
+
+    Se llama dentro de la transacción de la carga (`load_csv`), después de
+    registrar el manifiesto: la versión cambia en el mismo commit que los
+    datos, las categorías y los rollups, así que quien lee la versión nueva
+    lee también los datos nuevos y viceversa.
+
+    Args:
+        connection: Conexión con la transacción de la carga
+
+    Returns:
+        Optional[int]: Versión publicada (None si aún no hay cargas)
+    """
+    version = connection.execute(select(func.max(LoadManifest.id))).scalar()
+    if version is None:
+        return None
+    published = connection.execute(read_version_query()).scalar()
+    if published != version:
+        values = {"version": version, "published_at": datetime.utcnow()}
+        connection.execute(
+            insert(DatasetVersion)
+            .values(id=VERSION_ROW_ID, **values)
+            .on_conflict_do_update(index_elements=[DatasetVersion.id], set_=values)
+        )
+    return version
+
+
+def read_version_query() -> Select:
+    """Consulta de la versión publicada (una fila o ninguna)"""
+    return select(DatasetVersion.version).where(DatasetVersion.id == VERSION_ROW_ID)
+
+
+def read_dataset_version(engine: Engine) -> Optional[int]:
+    """Versión publicada en la base de datos, o None si no hay ninguna"""
+    with engine.connect() as connection:
+        return connection.execute(read_version_query()).scalar()
+
+
+class DatasetVersionTracker:
+    """
+    Versión de los datos conocida por este proceso.
+
+    Se consulta en cada petición sin ir a la base de datos: la carga del
+    propio proceso la fija con `set` y, como puede publicarla otro proceso,
+    cada `check_interval` segundos se relee en un hilo. Quien depende de la
+    versión (la copia en memoria) se suscribe con `subscribe` en lugar de
+    comprobarla por su cuenta.
+    """
+
+    def __init__(self, check_interval: float = DATASET_VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._version: Optional[int] = None
+        self._engine: Optional[Engine] = None
+        self._last_check = 0.0
+        self._checking = threading.Lock()
+        self._subscribers: List[Callable[[Optional[int]], None]] = []
+
+    def subscribe(self, callback: Callable[[Optional[int]], None]):
+        """
+        Llama a `callback(version)` cada vez que cambia la versión.
+
+        Se llama en el hilo que detecta el cambio (puede ser el del event
+        loop), así que no debe bloquear.
+        """
+        self._subscribers.append(callback)
+
+    def refresh(self, engine: Engine) -> Optional[int]:
+        """Lee la versión publicada y la guarda"""
+        self.set(read_dataset_version(engine), engine)
+        return self._version
+
+    def set(self, version: Optional[int], engine: Optional[Engine] = None):
+        """Fija la versión; con `engine`, se seguirá comprobando en esa base de datos"""
+        if engine is not None:
+            self._engine = engine
+        changed = version != self._version
+        self._version = version
+        self._last_check = time.monotonic()
+        if changed:
+            for callback in self._subscribers:
+                callback(version)
+
+    def _check(self):
+        with self._checking:
+            try:
+                self.refresh(self._engine)
+            except Exception:
+                logger.warning("⚠️ No se pudo comprobar la versión de los datos", exc_info=True)
+
+    def current(self) -> Optional[int]:
+        """Versión vigente; si toca, lanza en segundo plano la comprobación"""
+        if (
+            self._engine is not None
+            and time.monotonic() - self._last_check > self.check_interval
+            and not self._checking.locked()
+        ):
+            self._last_check = time.monotonic()
+            threading.Thread(target=self._check, daemon=True).start()
+        return self._version
+
+
+dataset_versions = DatasetVersionTracker()
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, Integer
+from sqlalchemy.sql import Select
+
+from .database import AsyncSessionLocal, async_engine
+
+# Filas por lote (grupo de filas en Parquet, record batch en Arrow)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "50000"))
+# Trozos de COPY pendientes de enviar al cliente (limita la memoria del CSV)
+EXPORT_COPY_QUEUE_SIZE = int(os.getenv("EXPORT_COPY_QUEUE_SIZE", "64"))
+
+# Formato -> (media type, extensión, compresiones admitidas)
+EXPORT_FORMATS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "csv": ("text/csv", "csv", ("gzip",)),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", ("lz4", "zstd")),
+    "parquet": ("application/vnd.apache.parquet", "parquet", ("snappy", "zstd", "gzip")),
+}
+
+
+def validate_export(format: str, compression: Optional[str]):
+    """
+    Comprueba el formato y la compresión pedidos.
+
+    Raises:
+        ValueError: Si el formato o la compresión no se admiten, o si falta
+            pyarrow para Arrow/Parquet
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato desconocido: {format} (admitidos: {', '.join(EXPORT_FORMATS)})")
+    compressions = EXPORT_FORMATS[format][2]
+    if compression is not None and compression not in compressions:
+        raise ValueError(
+            f"Compresión no soportada para {format}: {compression} (admitidas: {', '.join(compressions)})"
+        )
+    if format != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError(f"El formato {format} necesita el paquete pyarrow")
+
+
+def export_filename(format: str, compression: Optional[str]) -> str:
+    extension = EXPORT_FORMATS[format][1]
+    if format == "csv" and compression == "gzip":
+        extension += ".gz"
+    return f"challenge_data.{extension}"
+
+
+def export_media_type(format: str, compression: Optional[str]) -> str:
+    if format == "csv" and compression == "gzip":
+        return "application/gzip"
+    return EXPORT_FORMATS[format][0]
+
+
+async def stream_csv(stmt: Select, compression: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Genera el resultado de la consulta como CSV con `COPY (...) TO STDOUT`.
+
+    PostgreSQL escribe el CSV y asyncpg entrega los trozos a una cola
+    acotada: si el cliente lee despacio, COPY espera, así que la memoria no
+    depende del número de filas. Con `compression="gzip"` se comprime al
+    vuelo.
+    """
+    compiled = stmt.compile(dialect=async_engine.dialect, compile_kwargs={"render_postcompile": True})
+    args = [compiled.params[name] for name in compiled.positiontup]
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_COPY_QUEUE_SIZE)
+    done = object()
+
+    async with AsyncSessionLocal() as db:
+        connection = await (await db.connection()).get_raw_connection()
+
+        async def write(chunk):
+            await queue.put(bytes(chunk))
+
+        async def copy():
+            try:
+                await connection.driver_connection.copy_from_query(
+                    compiled.string, *args, output=write, format="csv", header=True
+                )
+                await queue.put(done)
+            except BaseException as e:
+                await queue.put(e)
+                raise
+
+        compressor = zlib.compressobj(wbits=31) if compression == "gzip" else None
+        task = asyncio.create_task(copy())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is done:
+                    break
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield compressor.compress(chunk) if compressor else chunk
+            if compressor:
+                yield compressor.flush()
+        finally:
+            if not task.done():
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+def _arrow_schema(columns: Sequence):
+    """Esquema Arrow de las columnas de `ChallengeData` (todas admiten nulos)"""
+    import pyarrow as pa
+
+    def arrow_type(column):
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        if isinstance(column.type, Float):
+            return pa.float64()
+        return pa.string()
+
+    return pa.schema([pa.field(column.key, arrow_type(column)) for column in columns])
+
+
+class _ChunkSink:
+    """
+    Fichero en memoria que se vacía tras cada lote.
+
+    Los escritores de Arrow y Parquet escriben aquí; lo acumulado desde el
+    último `drain` se envía al cliente y se descarta.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_columnar(
+    stmt: Select,
+    columns: Sequence,
+    format: str,
+    compression: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Genera el resultado de la consulta como Arrow IPC (stream) o Parquet.
+
+    Las filas se leen con un cursor de servidor en lotes de
+    `EXPORT_BATCH_SIZE`; cada lote se convierte en un record batch (o un
+    grupo de filas de Parquet) y se envía antes de leer el siguiente.
+
+    Args:
+        stmt: Consulta con `columns` como lista de SELECT
+        columns: Columnas de `ChallengeData` seleccionadas
+        format: `arrow` o `parquet`
+        compression: Códec de los buffers (Arrow) o de las páginas (Parquet)
+    """
+    import pyarrow as pa
+
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    if format == "arrow":
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = pa.ipc.new_stream(sink, schema, options=options)
+    else:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression=compression or "none")
+
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            try:
+                async for rows in result.partitions():
+                    values = list(zip(*rows))
+                    batch = pa.RecordBatch.from_arrays(
+                        [pa.array(column_values, type=field.type) for column_values, field in zip(values, schema)],
+                        schema=schema
+                    )
+                    if format == "arrow":
+                        writer.write_batch(batch)
+                    else:
+                        writer.write_batch(batch, row_group_size=EXPORT_BATCH_SIZE)
+                    yield sink.drain()
+            finally:
+                # Cierra el cursor de servidor aunque el cliente se desconecte
+                await result.close()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -1,10 +1,12 @@
 import os
-import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
 
 from .models import Base, ChallengeData
 from .database import engine
+from .csv_loader import load_csv
+from .dataset_version import dataset_versions
+from .snapshot import DATA_ENGINE, snapshots
 
 def init_db():
     """
@@ -19,16 +21,16 @@ def init_db():
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"No se encontró el archivo CSV en {csv_path}")
 
-    # Leer CSV con pandas
-    df = pd.read_csv(csv_path)
-    
-    # Insertar datos en la base de datos
-    df.to_sql(
-        "challenge_graphql_nlp_api",
-        engine,
-        if_exists="replace",
-        index=False
-    )
+    # Cargar el CSV por lotes con COPY, solo si ha cambiado desde la última
+    # carga; categorías y rollups se recalculan en la misma transacción
+    load_csv(engine, csv_path)
+
+    # Versión publicada por la carga (invalida las cachés de respuestas)
+    dataset_versions.refresh(engine)
+
+    # Copia en memoria para los servicios de datos y GraphQL
+    if DATA_ENGINE == "memory":
+        snapshots.refresh(engine)
 
 if __name__ == "__main__":
     init_db() 
\ No newline at end of file
@@ -1,40 +1,78 @@
-from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, Table
+from sqlalchemy import BigInteger, Column, Integer, Float, String, Text, DateTime, ForeignKey, Table, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from typing import Optional, List
+from typing import Dict, Optional, List
 import re
 
 Base = declarative_base()
 
 class CategoryNode:
+    """
+    Nodo del árbol de categorías.
+
+    Los hijos se guardan en un dict por nombre y todos los nodos de un árbol
+    comparten un índice `ruta -> nodo`, de modo que insertar una ruta cuesta
+    O(profundidad) y buscar un nodo por ruta O(1).
+    """
+    __slots__ = ("name", "path", "_children", "_index")
+
     def __init__(self, name: str, path: str):
         self.name = name
         self.path = path
-        self.children: List['CategoryNode'] = []
+        self._children: Dict[str, 'CategoryNode'] = {}
+        self._index: Dict[str, 'CategoryNode'] = {path: self}
+
+    @property
+    def children(self) -> List['CategoryNode']:
+        return list(self._children.values())
 
     def add_child(self, child: 'CategoryNode'):
-        self.children.append(child)
+        self._children[child.name] = child
+        # El hijo (y su subárbol) pasan a usar el índice de este árbol
+        self._index.update(child._index)
+        for node in child._index.values():
+            node._index = self._index
+
+    def insert_path(self, path: str) -> 'CategoryNode':
+        """Crea (si no existen) los nodos de la ruta y devuelve el último"""
+        node = self
+        for part in path.split('/'):
+            child = node._children.get(part)
+            if child is None:
+                child_path = f"{node.path}/{part}" if node.path else part
+                child = CategoryNode(part, child_path)
+                child._index = self._index
+                node._children[part] = child
+                self._index[child_path] = child
+            node = child
+        return node
 
     def find_node(self, path: str) -> Optional['CategoryNode']:
-        if self.path == path:
-            return self
-        for child in self.children:
-            result = child.find_node(path)
-            if result:
-                return result
+        node = self._index.get(path)
+        if node is None:
+            return None
+        # El índice es del árbol completo: solo se devuelven nodos de este subárbol
+        if not self.path or node.path == self.path or node.path.startswith(f"{self.path}/"):
+            return node
         return None
 
     def get_all_paths(self) -> List[str]:
-        paths = [self.path]
-        for child in self.children:
-            paths.extend(child.get_all_paths())
+        paths = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            paths.append(node.path)
+            stack.extend(reversed(list(node._children.values())))
         return paths
 
 class ChallengeData(Base):
     __tablename__ = "challenge_graphql_nlp_api"
 
-    id_tie_fecha_valor = Column(Integer, primary_key=True)
-    id_cli_cliente = Column(Integer, nullable=True)
+    # Clave sustituta (BIGSERIAL): el CSV no trae ningún identificador único de fila
+    row_id = Column(BigInteger, primary_key=True)
+    # Id de la fecha: varias filas pueden compartirla
+    id_tie_fecha_valor = Column(Integer, nullable=False)
+    id_cli_cliente = Column(Integer, nullable=True, index=True)
     #id_ga_vista = Column(Integer, nullable=True)
     #id_ga_tipo_dispositivo = Column(Integer, nullable=True)
     id_ga_fuente_medio = Column(Integer, nullable=True)
@@ -52,10 +90,15 @@ class ChallengeData(Base):
     id_ga_producto = Column(Integer, nullable=True)
     desc_ga_nombre_producto_1 = Column(String, nullable=True)
     desc_ga_sku_producto_1 = Column(String, nullable=True)
-    desc_ga_marca_producto = Column(String, nullable=True)
+    desc_ga_marca_producto = Column(String, nullable=True, index=True)
     desc_ga_cod_producto = Column(Float, nullable=True)
     desc_categoria_producto = Column(String, nullable=True)
-    desc_categoria_prod_principal = Column(String, nullable=True)
+    desc_categoria_prod_principal = Column(String, nullable=True, index=True)
+
+    __table_args__ = (
+        # Filtros por rango de fechas y orden (fecha, fila) de la paginación
+        Index("ix_challenge_graphql_nlp_api_fecha_row", "id_tie_fecha_valor", "row_id"),
+    )
 
     @property
     def category_paths(self) -> List[str]:
@@ -68,25 +111,80 @@ class ChallengeData(Base):
     def category_tree(self) -> CategoryNode:
         """Construye y devuelve el árbol de categorías"""
         root = CategoryNode("root", "")
-        
         for path in self.category_paths:
-            current_node = root
-            parts = path.split('/')
-            current_path = ""
-            
-            for part in parts:
-                current_path = f"{current_path}/{part}" if current_path else part
-                existing_node = current_node.find_node(current_path)
-                
-                if not existing_node:
-                    new_node = CategoryNode(part, current_path)
-                    current_node.add_child(new_node)
-                    current_node = new_node
-                else:
-                    current_node = existing_node
-        
+            root.insert_path(path)
         return root
 
-    def is_in_category(self, category_path: str) -> bool:
+    def is_in_category(self, category_path: str, include_descendants: bool = True) -> bool:
         """Verifica si el producto pertenece a una categoría específica"""
-        return any(path.startswith(category_path) for path in self.category_paths) 
\ No newline at end of file
+        category_path = category_path.strip().strip('/')
+        for path in self.category_paths:
+            if path == category_path:
+                return True
+            if include_descendants and path.startswith(f"{category_path}/"):
+                return True
+        return False 
+
+class ChallengeCategory(Base):
+    """Nodo de la jerarquía de categorías materializada en la carga"""
+    __tablename__ = "challenge_categories"
+
+    id = Column(Integer, primary_key=True)
+    path = Column(String, nullable=False, unique=True)
+    name = Column(String, nullable=False)
+    parent_id = Column(Integer, ForeignKey("challenge_categories.id"), nullable=True, index=True)
+    depth = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # Permite buscar subárboles con `path LIKE 'prefijo/%'` usando el índice
+        Index(
+            "ix_challenge_categories_path_pattern",
+            "path",
+            postgresql_ops={"path": "text_pattern_ops"}
+        ),
+    )
+
+class ChallengeProductCategory(Base):
+    """Relación entre cada fila de datos y las categorías hoja de sus rutas"""
+    __tablename__ = "challenge_product_categories"
+
+    row_id = Column(BigInteger, primary_key=True)
+    category_id = Column(Integer, ForeignKey("challenge_categories.id"), primary_key=True)
+
+    __table_args__ = (
+        # Resuelve `category_id IN (...)` -> ids de fila solo con el índice
+        Index(
+            "ix_challenge_product_categories_category_row",
+            "category_id",
+            "row_id"
+        ),
+    )
+
+
+class LoadManifest(Base):
+    """Registro de cada carga del CSV, para no repetir cargas de ficheros sin cambios"""
+    __tablename__ = "challenge_load_manifest"
+
+    id = Column(Integer, primary_key=True)
+    file_name = Column(String, nullable=False, index=True)
+    file_hash = Column(String(64), nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    file_mtime = Column(Float, nullable=False)
+    mode = Column(String, nullable=False)
+    rows = Column(Integer, nullable=False)
+    loaded_at = Column(DateTime, nullable=False)
+
+
+class DatasetVersion(Base):
+    """
+    Versión de los datos publicada por la última carga completa.
+
+    Una sola fila: el id de `challenge_load_manifest` cuya carga ya tiene
+    también categorías y rollups recalculados. Las cachés de respuestas se
+    invalidan cuando cambia.
+    """
+    __tablename__ = "challenge_dataset_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    published_at = Column(DateTime, nullable=False)
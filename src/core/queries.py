@@ -0,0 +1,134 @@
+import json
+from datetime import date, datetime
+from typing import List, Optional, Tuple, Union
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from .models import ChallengeData
+from .categories import CategoryMatch, category_filter
+
+
+# Posición keyset de una fila: (id_tie_fecha_valor, row_id). La fecha se
+# repite entre filas; `row_id` deshace los empates
+PageCursor = Tuple[int, int]
+PAGE_ORDER = (ChallengeData.id_tie_fecha_valor, ChallengeData.row_id)
+
+
+def date_id(value: Union[date, int]) -> int:
+    """
+    Fecha en la codificación de `id_tie_fecha_valor` (entero `AAAAMMDD`).
+
+    Los filtros de fecha de la API reciben `datetime`; la columna guarda el
+    id de la fecha, así que se comparan con este entero (los enteros se
+    toman como ids ya codificados).
+    """
+    if isinstance(value, date):
+        return value.year * 10000 + value.month * 100 + value.day
+    return int(value)
+
+
+def encode_page_cursor(row) -> str:
+    """Cursor `<id_tie_fecha_valor>:<row_id>` de una fila (dict con ambas columnas)"""
+    return f"{row['id_tie_fecha_valor']}:{row['row_id']}"
+
+
+def decode_page_cursor(value: str) -> PageCursor:
+    """
+    Lee un cursor de `encode_page_cursor`.
+
+    Raises:
+        ValueError: Si el cursor no tiene el formato `<id_tie_fecha_valor>:<row_id>`
+    """
+    try:
+        date_id, row_id = value.split(":")
+        return int(date_id), int(row_id)
+    except ValueError:
+        raise ValueError(f"Cursor inválido: {value}")
+
+
+def data_points_query(
+    category: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    after: Optional[PageCursor] = None,
+    limit: Optional[int] = None,
+    category_match: CategoryMatch = CategoryMatch.DESCENDANTS,
+    columns: Optional[List] = None,
+) -> Select:
+    """
+    Construye la consulta de puntos de datos con filtros opcionales.
+
+    Si se pide paginación (`after` o `limit`) se ordena por
+    `(id_tie_fecha_valor, row_id)` y se aplica un cursor keyset, de modo que
+    cada página es un rango sobre ese índice y no un OFFSET; `row_id` evita
+    saltarse filas de la misma fecha en el límite de una página.
+
+    Args:
+        category: Ruta de categoría para filtrar
+        start_date: Fecha de inicio (se compara con `date_id`)
+        end_date: Fecha de fin (incluida)
+        after: Posición `(id_tie_fecha_valor, row_id)` de la última fila de la página anterior
+        limit: Número máximo de filas
+        category_match: Solo la categoría exacta o también sus descendientes
+        columns: Columnas a seleccionar; por defecto la entidad `ChallengeData` completa
+
+    Returns:
+        Select: Consulta lista para ejecutar
+    """
+    stmt = select(*columns) if columns else select(ChallengeData)
+
+    if category:
+        stmt = stmt.where(category_filter(category, category_match))
+
+    if start_date:
+        stmt = stmt.where(ChallengeData.id_tie_fecha_valor >= date_id(start_date))
+
+    if end_date:
+        stmt = stmt.where(ChallengeData.id_tie_fecha_valor <= date_id(end_date))
+
+    if after is not None:
+        stmt = stmt.where(tuple_(ChallengeData.id_tie_fecha_valor, ChallengeData.row_id) > tuple_(*after))
+
+    if after is not None or limit is not None:
+        stmt = stmt.order_by(*PAGE_ORDER)
+
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return stmt
+
+
+def count_rows(db: Session, stmt: Select) -> int:
+    """Cuenta exactamente las filas que devolvería la consulta"""
+    stmt = stmt.limit(None).order_by(None)
+    return db.execute(select(func.count()).select_from(stmt.subquery())).scalar_one()
+
+
+def estimate_rows(db: Session, stmt: Optional[Select] = None) -> int:
+    """
+    Estima sin recorrer la tabla cuántas filas devolvería la consulta.
+
+    Sin consulta (o sin filtros) usa `pg_class.reltuples`, que mantienen
+    ANALYZE y autovacuum; con filtros usa la estimación del planificador.
+    """
+    if stmt is None or stmt.whereclause is None:
+        reltuples = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": ChallengeData.__tablename__}
+        ).scalar()
+        return max(int(reltuples or 0), 0)
+
+    compiled = stmt.limit(None).order_by(None).compile(dialect=db.get_bind().dialect)
+    params = compiled.params
+    if compiled.positional:
+        # asyncpg usa parámetros posicionales ($1, $2...)
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = db.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled.string}", params
+    ).scalar()
+    if isinstance(plan, str):
+        # asyncpg no decodifica el JSON
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Mapping, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+from .dataset_version import dataset_versions, read_version_query
+from .snapshot import active_snapshot
+
+# Configuración de la caché de respuestas
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 2**20)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(4 * 2**20)))
+# Segundos que el cliente puede reutilizar una respuesta sin revalidarla
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "0"))
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
+# Caducidad en Redis: las entradas de versiones antiguas no se vuelven a leer
+RESPONSE_CACHE_SHARED_TTL = int(os.getenv("RESPONSE_CACHE_SHARED_TTL", "86400"))
+
+CACHE_CONTROL = f"private, max-age={RESPONSE_CACHE_MAX_AGE}, must-revalidate"
+JSON_MEDIA_TYPE = "application/json"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    headers: Dict[str, str]
+
+
+class CacheKey(NamedTuple):
+    digest: str
+    # Versión de los datos con la que se calculó la clave
+    published: int
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprueba `If-None-Match` (comparación débil, como indica el RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+class ResponseCache:
+    """
+    Caché de respuestas JSON por endpoint, parámetros y versión de los datos.
+
+    Una respuesta solo depende de sus parámetros y de la versión de los
+    datos con los que se responde (la publicada por la carga o, con
+    `DATA_ENGINE=memory`, la de la copia en memoria, que se lee junto con
+    sus filas), así que la clave incluye la versión y la ETag se deriva de
+    la clave: un `If-None-Match` que coincide se responde con 304
+    sin leer la caché ni la base de datos. Las entradas se guardan en un LRU
+    limitado en bytes que se vacía al cambiar de versión; si se configura un
+    backend compartido (Redis), las respuestas se comparten entre workers.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES,
+        redis_url: Optional[str] = RESPONSE_CACHE_REDIS_URL,
+        shared_ttl: int = RESPONSE_CACHE_SHARED_TTL,
+    ):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.shared_ttl = shared_ttl
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[str] = None
+        self._shared = None
+        if enabled and redis_url:
+            try:
+                import redis.asyncio as redis
+                self._shared = redis.from_url(redis_url)
+            except ImportError:
+                print("⚠️ RESPONSE_CACHE_REDIS_URL definido pero el paquete redis no está instalado")
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    @staticmethod
+    def data_version() -> Optional[int]:
+        """
+        Versión de los datos con la que se responde ahora: la de la copia
+        en memoria si está activa y, si no, la publicada.
+        """
+        snapshot = active_snapshot()
+        if snapshot is not None:
+            return snapshot.version
+        return dataset_versions.current()
+
+    def version(self, published: int) -> str:
+        """
+        Registra la versión de los datos de la clave.
+
+        Al cambiar se vacía la caché local: las entradas de la versión
+        anterior ya no se pueden pedir.
+        """
+        current = str(published)
+        if current != self._version:
+            self.clear()
+            self._version = current
+        return current
+
+    def key(self, endpoint: str, params: Mapping) -> Optional[CacheKey]:
+        """
+        Clave de la respuesta de `endpoint` con los parámetros normalizados.
+
+        Returns:
+            Optional[CacheKey]: Clave, o None si la caché está desactivada o
+            aún no hay versión publicada (la respuesta no se cachea)
+        """
+        if not self.enabled:
+            return None
+        published = self.data_version()
+        if published is None:
+            return None
+        normalized = json.dumps(
+            {"endpoint": endpoint, "params": params, "version": self.version(published)},
+            sort_keys=True, separators=(",", ":"), default=str
+        )
+        return CacheKey(hashlib.sha256(normalized.encode("utf-8")).hexdigest(), published)
+
+    @staticmethod
+    def etag(key: CacheKey) -> str:
+        return f'"{key.digest[:40]}"'
+
+    def _headers(self, key: CacheKey, headers: Optional[Mapping[str, str]] = None) -> Dict[str, str]:
+        return {**(headers or {}), "ETag": self.etag(key), "Cache-Control": CACHE_CONTROL}
+
+    async def lookup(self, request: Request, key: Optional[CacheKey]) -> Optional[Response]:
+        """
+        Respuesta cacheada para la petición: 304 si el cliente ya la tiene,
+        la respuesta guardada si está en caché, o None si hay que calcularla.
+        """
+        if key is None:
+            return None
+        if etag_matches(request.headers.get("If-None-Match"), self.etag(key)):
+            return Response(status_code=304, headers=self._headers(key))
+
+        entry = await self._get(key.digest)
+        if entry is None:
+            return None
+        return Response(entry.body, media_type=JSON_MEDIA_TYPE, headers=self._headers(key, entry.headers))
+
+    async def store(
+        self,
+        key: Optional[CacheKey],
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        *,
+        db,
+    ) -> Response:
+        """
+        Guarda la respuesta calculada y la devuelve con su ETag.
+
+        La clave lleva la versión que este proceso creía vigente al recibir
+        la petición, pero otro proceso puede haber publicado una carga
+        después. Como la carga publica la versión en el mismo commit que
+        los datos, se relee la versión publicada después de calcular la
+        respuesta: si sigue siendo la de la clave, todo lo leído antes es
+        de esa versión. Si no, la respuesta no se guarda (podría ser de la
+        versión nueva) y se adelanta la versión del proceso. Con la copia
+        en memoria activa se comprueba en cambio que la copia siga siendo
+        de la versión de la clave.
+
+        Args:
+            key: Clave de `key` (None si no se cachea)
+            body: Respuesta JSON ya serializada
+            headers: Cabeceras propias de la respuesta
+            db: Sesión con la que se leyeron los datos
+        """
+        if key is None:
+            return Response(body, media_type=JSON_MEDIA_TYPE, headers=headers)
+        snapshot = active_snapshot()
+        if snapshot is not None:
+            if snapshot.version != key.published:
+                return Response(body, media_type=JSON_MEDIA_TYPE, headers=headers)
+        else:
+            published = (await db.execute(read_version_query())).scalar()
+            if published != key.published:
+                dataset_versions.set(published)
+                return Response(body, media_type=JSON_MEDIA_TYPE, headers=headers)
+        await self._set(key.digest, CachedResponse(body, dict(headers or {})))
+        return Response(body, media_type=JSON_MEDIA_TYPE, headers=self._headers(key, headers))
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    async def _get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        if self._shared is not None:
+            try:
+                raw = await self._shared.get(self._shared_key(key))
+            except Exception as e:
+                print(f"⚠️ Error leyendo la caché de respuestas compartida: {e}")
+                raw = None
+            if raw is not None:
+                headers, _, body = raw.partition(b"\n")
+                entry = CachedResponse(body, json.loads(headers))
+                self._set_local(key, entry)
+                return entry
+        return None
+
+    async def _set(self, key: str, entry: CachedResponse):
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        self._set_local(key, entry)
+        if self._shared is not None:
+            try:
+                raw = json.dumps(entry.headers).encode("utf-8") + b"\n" + entry.body
+                await self._shared.set(self._shared_key(key), raw, ex=self.shared_ttl)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo la caché de respuestas compartida: {e}")
+
+    def _set_local(self, key: str, entry: CachedResponse):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous.body)
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while self._bytes > self.max_bytes:
+            _, oldest = self._entries.popitem(last=False)
+            self._bytes -= len(oldest.body)
+
+    @staticmethod
+    def _shared_key(key: str) -> str:
+        return f"response:v1:{key}"
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,297 @@
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Float,
+    MetaData,
+    Table,
+    and_,
+    cast,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from .aggregation import (
+    COLUMNS,
+    build_aggregate_query,
+    filter_clauses,
+    metric_label,
+    order_and_limit,
+    parse_metric,
+    validate_aggregation,
+)
+from .models import ChallengeData
+
+# Medidas que se suman en los rollups
+ROLLUP_MEASURES = [
+    "fc_ingreso_producto_monto",
+    "fc_agregado_carrito_cant",
+    "fc_detalle_producto_cant",
+]
+
+# Dimensiones de cada rollup. Cualquier agrupación (y filtro) sobre un
+# subconjunto de las dimensiones de un rollup se responde re-agregándolo.
+ROLLUP_DIMENSIONS = {
+    "challenge_rollup_brand_category_source": (
+        "desc_ga_marca_producto",
+        "desc_categoria_prod_principal",
+        "id_ga_fuente_medio",
+    ),
+    # `id_tie_fecha_valor` es el id del día (lo comparten todas las filas de
+    # esa fecha; la fila la identifica `row_id`): un grupo por día y combinación
+    "challenge_rollup_daily": (
+        "id_tie_fecha_valor",
+        "desc_ga_marca_producto",
+        "desc_categoria_prod_principal",
+        "id_ga_fuente_medio",
+    ),
+}
+
+# Métricas que se pueden calcular a partir de sumas y conteos parciales
+ROLLUP_FUNCTIONS = {"sum", "avg", "count"}
+
+# Métricas por defecto de los endpoints `aggregate`: el total de cada medida
+DEFAULT_METRICS = [f"sum({measure})" for measure in ROLLUP_MEASURES]
+
+ROW_COUNT = "row_count"
+
+DATA_TABLE = ChallengeData.__table__
+
+# Los rollups no están en `Base.metadata`: solo existen una vez construidos
+rollup_metadata = MetaData()
+
+
+def _rollup_table(name: str, dimensions: Tuple[str, ...]) -> Table:
+    measure_columns = []
+    for measure in ROLLUP_MEASURES:
+        sum_type = Float if COLUMNS[measure].type.python_type is float else BigInteger
+        measure_columns.append(Column(f"sum_{measure}", sum_type))
+        measure_columns.append(Column(f"count_{measure}", BigInteger, nullable=False))
+
+    return Table(
+        name,
+        rollup_metadata,
+        *[Column(d, COLUMNS[d].type, nullable=True) for d in dimensions],
+        Column(ROW_COUNT, BigInteger, nullable=False),
+        *measure_columns,
+    )
+
+
+ROLLUP_TABLES = [
+    _rollup_table(name, dimensions) for name, dimensions in ROLLUP_DIMENSIONS.items()
+]
+
+
+def _rollup_source_query(table: Table, source: Table) -> Select:
+    """GROUP BY sobre la tabla de datos (`source`) con las columnas del rollup"""
+    dimensions = [source.c[c.name] for c in table.columns if c.name in COLUMNS]
+    measures = []
+    for measure in ROLLUP_MEASURES:
+        measures.append(func.sum(source.c[measure]))
+        measures.append(func.count(source.c[measure]))
+    return select(*dimensions, func.count(), *measures).group_by(*dimensions)
+
+
+def rollups_built(connection: Connection) -> bool:
+    """Indica si las tablas de rollup existen en la base de datos"""
+    inspector = inspect(connection)
+    return all(inspector.has_table(table.name) for table in ROLLUP_TABLES)
+
+
+def rebuild_rollup_tables(connection: Connection, source: Table = DATA_TABLE) -> Dict[str, int]:
+    """
+    Recalcula los rollups a partir de la tabla de datos.
+
+    Cada tabla se rellena con un único `INSERT ... SELECT ... GROUP BY`
+    dentro de la transacción de la carga (`load_csv`), por lo que los
+    lectores ven los rollups anteriores con los datos anteriores hasta el
+    commit.
+
+    Args:
+        connection: Conexión con la transacción de la carga
+        source: Tabla de la que se agregan las filas (la de staging en una
+            carga `replace`, antes del intercambio)
+
+    Returns:
+        Dict[str, int]: Número de grupos de cada tabla de rollup
+    """
+    rollup_metadata.create_all(bind=connection)
+
+    groups = {}
+    for table in ROLLUP_TABLES:
+        connection.execute(delete(table))
+        result = connection.execute(
+            insert(table).from_select(
+                [c.name for c in table.columns], _rollup_source_query(table, source)
+            )
+        )
+        groups[table.name] = result.rowcount
+        connection.exec_driver_sql(f"ANALYZE {table.name}")
+
+    return groups
+
+
+def _covers(table: Table, aggregation: Dict, filters: Dict) -> bool:
+    dimensions = ROLLUP_DIMENSIONS[table.name]
+    if not set(aggregation["group_by"]) <= set(dimensions):
+        return False
+    if not set(filters) <= set(dimensions):
+        return False
+    return all(
+        metric["func"] in ROLLUP_FUNCTIONS
+        and (metric["column"] is None or metric["column"] in ROLLUP_MEASURES)
+        and (metric["column"] is not None or metric["func"] == "count")
+        for metric in aggregation["metrics"]
+    )
+
+
+def _rollup_metric(table: Table, metric: Dict):
+    """Re-agrega una métrica a partir de las sumas y conteos del rollup"""
+    column = metric["column"]
+    if column is None:
+        return cast(func.sum(table.c[ROW_COUNT]), BigInteger)
+    if metric["func"] == "count":
+        return cast(func.sum(table.c[f"count_{column}"]), BigInteger)
+
+    total = cast(func.sum(table.c[f"sum_{column}"]), table.c[f"sum_{column}"].type)
+    if metric["func"] == "sum":
+        return total
+    return cast(total, Float) / func.nullif(func.sum(table.c[f"count_{column}"]), 0)
+
+
+def find_rollup(aggregation: Dict, filters: Dict) -> Optional[Table]:
+    """Rollup más pequeño (menos dimensiones) que cubre la agregación, si hay"""
+    candidates = [t for t in ROLLUP_TABLES if _covers(t, aggregation, filters)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda t: len(ROLLUP_DIMENSIONS[t.name]))
+
+
+def build_rollup_query(table: Table, aggregation: Dict, filters: Dict) -> Select:
+    """Como `build_aggregate_query`, pero sobre una tabla de rollup"""
+    group_columns = [table.c[c] for c in aggregation["group_by"]]
+    metric_columns = [
+        _rollup_metric(table, metric).label(metric_label(metric))
+        for metric in aggregation["metrics"]
+    ]
+
+    stmt = select(*group_columns, *metric_columns).select_from(table)
+    clauses = filter_clauses(filters, table.c)
+    if clauses:
+        stmt = stmt.where(and_(*clauses))
+    if group_columns:
+        stmt = stmt.group_by(*group_columns)
+
+    return order_and_limit(stmt, group_columns, metric_columns, aggregation)
+
+
+def aggregation_from_request(
+    group_by: List[str],
+    metrics: List[str],
+    order: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Dict:
+    """
+    Valida la agregación pedida a los endpoints `aggregate`.
+
+    A diferencia de `validate_aggregation`, que descarta en silencio lo que
+    no entiende (útil con el LLM), aquí una columna o métrica desconocida
+    es un error.
+
+    Args:
+        group_by: Columnas de agrupación
+        metrics: Métricas como `sum(columna)`, `avg(columna)` o `count(*)`;
+            por defecto la suma de cada medida de `ROLLUP_MEASURES`
+        order: `asc` o `desc` según la primera métrica
+        limit: Número máximo de grupos
+
+    Returns:
+        Dict: Agregación validada
+
+    Raises:
+        ValueError: Si alguna columna, métrica u orden no es válido
+    """
+    unknown = [column for column in group_by if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Columnas de agrupación desconocidas: {', '.join(unknown)}")
+    if order is not None and order not in ("asc", "desc"):
+        raise ValueError(f"Orden inválido: {order}")
+
+    parsed = []
+    for value in metrics or DEFAULT_METRICS:
+        metric = parse_metric(value)
+        if metric is None:
+            raise ValueError(f"Métrica inválida: {value}")
+        parsed.append(metric)
+
+    aggregation = validate_aggregation(
+        {"group_by": list(dict.fromkeys(group_by)), "metrics": parsed, "order": order, "limit": limit}
+    )
+    invalid = [m for m in parsed if not aggregation or m not in aggregation["metrics"]]
+    if invalid:
+        raise ValueError(f"Métrica no soportada: {metric_label(invalid[0])}")
+    return aggregation
+
+
+def dimension_filters(
+    brand: Optional[str] = None,
+    main_category: Optional[str] = None,
+    source: Optional[int] = None,
+    start_date: Optional[int] = None,
+    end_date: Optional[int] = None,
+) -> Dict:
+    """Filtros de los endpoints `aggregate` sobre las dimensiones de los rollups"""
+    filters = {}
+    if brand is not None:
+        filters["desc_ga_marca_producto"] = {"op": "=", "value": brand}
+    if main_category is not None:
+        filters["desc_categoria_prod_principal"] = {"op": "=", "value": main_category}
+    if source is not None:
+        filters["id_ga_fuente_medio"] = {"op": "=", "value": source}
+    if start_date is not None and end_date is not None:
+        # Un solo filtro por columna: el rango se expresa con dos condiciones
+        filters["id_tie_fecha_valor"] = {"op": "between", "value": (start_date, end_date)}
+    elif start_date is not None:
+        filters["id_tie_fecha_valor"] = {"op": ">=", "value": start_date}
+    elif end_date is not None:
+        filters["id_tie_fecha_valor"] = {"op": "<=", "value": end_date}
+    return filters
+
+
+def aggregate(db: Session, aggregation: Dict, filters: Dict) -> Tuple[List[Dict], str]:
+    """
+    Ejecuta una agregación validada (ver `aggregation.validate_aggregation`).
+
+    Si algún rollup cubre las columnas de agrupación, los filtros y las
+    métricas se consulta el rollup; si no, se agrega en vivo sobre
+    `challenge_graphql_nlp_api`.
+
+    Args:
+        db: Sesión de la base de datos
+        aggregation: Agrupación, métricas, orden y límite
+        filters: Filtros `{"columna": {"op": "=", "value": ...}}`
+
+    Returns:
+        Tuple[List[Dict], str]: Filas resultantes y tabla de la que salen
+        (el nombre del rollup o `live`)
+    """
+    table = find_rollup(aggregation, filters)
+    if table is not None:
+        stmt = build_rollup_query(table, aggregation, filters)
+        source = table.name
+    else:
+        stmt = build_aggregate_query(filter_clauses(filters), aggregation)
+        source = "live"
+    rows = [
+        {str(k): float(v) if isinstance(v, Decimal) else v for k, v in row._mapping.items()}
+        for row in db.execute(stmt)
+    ]
+    return rows, source
@@ -0,0 +1,93 @@
+from decimal import Decimal
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import orjson
+from fastapi.responses import JSONResponse as StarletteJSONResponse
+from pydantic import BaseModel, ConfigDict
+
+from .models import CategoryNode, ChallengeData
+
+
+class DataPoint(BaseModel):
+    """
+    Punto de datos tal como lo devuelve la API.
+
+    Documenta la respuesta en OpenAPI; las filas de la base de datos ya
+    tienen estos tipos, así que no se validan una a una al responder.
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    row_id: Optional[int] = None
+    id_tie_fecha_valor: Optional[int] = None
+    id_cli_cliente: Optional[int] = None
+    #id_ga_vista: Optional[int] = None
+    #id_ga_tipo_dispositivo: Optional[int] = None
+    id_ga_fuente_medio: Optional[int] = None
+    #desc_ga_sku_producto: Optional[str] = None
+    desc_ga_categoria_producto: Optional[float] = None
+    fc_agregado_carrito_cant: Optional[int] = None
+    fc_ingreso_producto_monto: Optional[float] = None
+    #fc_retirado_carrito_cant: Optional[float] = None
+    fc_detalle_producto_cant: Optional[int] = None
+    fc_producto_cant: Optional[int] = None
+    #desc_ga_nombre_producto: Optional[float] = None
+    #fc_visualizaciones_pag_cant: Optional[float] = None
+    flag_pipol: Optional[int] = None
+    #sasasa: Optional[str] = None
+    id_ga_producto: Optional[int] = None
+    desc_ga_nombre_producto_1: Optional[str] = None
+    desc_ga_sku_producto_1: Optional[str] = None
+    desc_ga_marca_producto: Optional[str] = None
+    desc_ga_cod_producto: Optional[float] = None
+    desc_categoria_producto: Optional[str] = None
+    desc_categoria_prod_principal: Optional[str] = None
+
+
+# Campos de `DataPoint` y columnas de `ChallengeData` que se leen para construirlo
+DATA_POINT_FIELDS = tuple(DataPoint.model_fields)
+DATA_POINT_COLUMNS = [getattr(ChallengeData, name) for name in DATA_POINT_FIELDS]
+
+
+def _default(value):
+    """Tipos que orjson no serializa por sí mismo (agregados de PostgreSQL y NumPy)"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"No se puede serializar {type(value).__name__}")
+
+
+def dumps(value) -> bytes:
+    """JSON en bytes con orjson (NaN e infinitos como null, igual que Pydantic)"""
+    return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def data_point_rows(rows: Iterable[Sequence]) -> List[dict]:
+    """
+    Convierte filas de `select(*DATA_POINT_COLUMNS)` en dicts de `DataPoint`.
+
+    Las filas son tuplas con las columnas en el orden de `DATA_POINT_FIELDS`:
+    no se construyen entidades ORM ni se revalidan los tipos.
+    """
+    return [dict(zip(DATA_POINT_FIELDS, row)) for row in rows]
+
+
+def ndjson(rows: Iterable[dict]) -> bytes:
+    """Filas como NDJSON (un objeto JSON por línea)"""
+    return b"".join(dumps(row) + b"\n" for row in rows)
+
+
+def category_dicts(nodes: Iterable[CategoryNode]) -> List[dict]:
+    """Árbol de categorías como dicts `{path, name, children}`"""
+    return [
+        {"path": node.path, "name": node.name, "children": category_dicts(node.children)}
+        for node in nodes
+    ]
+
+
+class JSONResponse(StarletteJSONResponse):
+    """Respuesta JSON serializada con orjson (`dumps`), como `ORJSONResponse`"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
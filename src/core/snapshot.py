@@ -0,0 +1,468 @@
+import logging
+import operator
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from .aggregation import MAX_AGGREGATE_ROWS, metric_label
+from .categories import CategoryMatch, split_category_paths
+from .dataset_version import DatasetVersionTracker, dataset_versions, read_version_query
+from .models import ChallengeData
+from .queries import PAGE_ORDER, PageCursor, date_id
+
+logger = logging.getLogger(__name__)
+
+# Motor de lectura de los servicios de datos y GraphQL: `postgres` o `memory`
+DATA_ENGINE = os.getenv("DATA_ENGINE", "postgres").lower()
+
+COLUMNS = ChallengeData.__table__.columns
+ALL_COLUMNS = tuple(column.name for column in COLUMNS)
+
+# Operadores de filtro vectorizados (mismos nombres que `aggregation.FILTER_OPERATORS`)
+_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "between": lambda values, bounds: (values >= bounds[0]) & (values <= bounds[1]),
+}
+
+
+class SnapshotColumn:
+    """
+    Columna en memoria.
+
+    Las numéricas guardan los valores en un array de NumPy y los nulos en
+    una máscara. Las de texto se codifican con diccionario: `values` son
+    los códigos (`-1` para nulo) y `dictionary` los valores distintos, de
+    modo que un filtro se evalúa sobre el diccionario y se propaga a las
+    filas indexando por código.
+    """
+    __slots__ = ("name", "values", "valid", "dictionary", "python_type", "_ranks", "_sorted")
+
+    def __init__(self, name: str, series: pd.Series):
+        self.name = name
+        self.python_type = COLUMNS[name].type.python_type
+        if self.python_type is str:
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            self.values = codes.astype(np.int32)
+            self.dictionary = np.asarray(uniques, dtype=object)
+            self.valid = self.values >= 0
+        else:
+            self.valid = series.notna().to_numpy()
+            dtype = np.int64 if self.python_type is int else np.float64
+            self.values = series.fillna(0).to_numpy(dtype=dtype)
+            self.dictionary = None
+        self._ranks = None
+        self._sorted = None
+
+    @property
+    def nbytes(self) -> int:
+        size = self.values.nbytes + self.valid.nbytes
+        if self.dictionary is not None:
+            size += sum(len(value) for value in self.dictionary)
+        return size
+
+    def _coerce(self, value):
+        if isinstance(value, (tuple, list)):
+            return tuple(self._coerce(v) for v in value)
+        return value if self.python_type is str else self.python_type(value)
+
+    def compare(self, op: str, value) -> np.ndarray:
+        """Máscara de filas que cumplen `columna op valor` (los nulos nunca)"""
+        compare = _OPERATORS[op]
+        value = self._coerce(value)
+        if self.dictionary is None:
+            return self.valid & compare(self.values, value)
+        matches = np.asarray(compare(self.dictionary, value), dtype=bool)
+        # El código -1 (nulo) indexa el último valor; `valid` lo descarta
+        return self.valid & matches[self.values] if len(matches) else np.zeros_like(self.valid)
+
+    def to_list(self, positions: np.ndarray) -> List:
+        """Valores Python de las filas indicadas (None para los nulos)"""
+        valid = self.valid[positions]
+        if self.dictionary is not None:
+            if not len(self.dictionary):
+                return [None] * len(positions)
+            values = self.dictionary[self.values[positions]].tolist()
+        else:
+            values = self.values[positions].tolist()
+        if valid.all():
+            return values
+        return [v if ok else None for v, ok in zip(values, valid.tolist())]
+
+    def group_codes(self, positions: np.ndarray) -> Tuple[np.ndarray, List]:
+        """Código de grupo de cada fila y valor de cada código (nulo incluido)"""
+        if self.dictionary is not None:
+            codes, uniques = pd.factorize(self.values[positions])
+            keys = [self.dictionary[c] if c >= 0 else None for c in uniques.tolist()]
+            return codes, keys
+        valid = self.valid[positions]
+        inverse, uniques = pd.factorize(self.values[positions][valid])
+        # Los nulos forman un grupo propio, con el último código
+        codes = np.full(len(positions), len(uniques), dtype=np.int64)
+        codes[valid] = inverse
+        return codes, [self.python_type(v) for v in uniques.tolist()] + [None]
+
+    def sort_keys(self, positions: np.ndarray) -> np.ndarray:
+        """Valores comparables entre sí (rango en el diccionario para el texto)"""
+        if self.dictionary is None:
+            return self.values[positions]
+        if not len(self.dictionary):
+            return np.zeros(len(positions), dtype=np.int64)
+        if self._ranks is None:
+            # Se calcula una vez; se publica ya completo porque se comparte entre hilos
+            order = np.argsort(self.dictionary)
+            ranks = np.empty(len(self.dictionary), dtype=np.int64)
+            ranks[order] = np.arange(len(self.dictionary))
+            self._sorted, self._ranks = order, ranks
+        return self._ranks[self.values[positions]]
+
+    def from_sort_key(self, key):
+        if self.dictionary is None:
+            return self.python_type(key)
+        return self.dictionary[self._sorted[int(key)]]
+
+
+class ColumnarSnapshot:
+    """
+    Copia inmutable en memoria de `challenge_graphql_nlp_api`.
+
+    Las filas se ordenan por `(id_tie_fecha_valor, row_id)`, igual que la
+    paginación keyset de PostgreSQL, así que cada página es la continuación
+    de la máscara a partir del cursor. Cada
+    categoría tiene precalculados dos bitmaps (filas de la propia categoría
+    y de todo su subárbol), así que filtrar por categoría es desempaquetar
+    un bitmap.
+    """
+
+    def __init__(
+        self,
+        version: Optional[int],
+        columns: Dict[str, SnapshotColumn],
+        category_bitmaps: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    ):
+        self.version = version
+        self.columns = columns
+        self.category_bitmaps = category_bitmaps
+        self.dates = columns["id_tie_fecha_valor"].values
+        self.row_ids = columns["row_id"].values
+        # Orden por `row_id` para buscar una fila con búsqueda binaria
+        self._row_order = np.argsort(self.row_ids, kind="stable")
+        self._sorted_row_ids = self.row_ids[self._row_order]
+        self.size = len(self.row_ids)
+
+    @classmethod
+    def load(cls, engine: Engine) -> "ColumnarSnapshot":
+        """
+        Lee la tabla de datos y la versión publicada en una sola
+        transacción REPEATABLE READ (la carga publica la versión en la
+        misma transacción que los datos), así que `version` es la versión
+        de `challenge_dataset_version` de la que son las filas.
+        """
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+            version = connection.execute(read_version_query()).scalar()
+            frame = pd.read_sql(
+                select(ChallengeData.__table__).order_by(*PAGE_ORDER),
+                connection
+            )
+
+        columns = {name: SnapshotColumn(name, frame[name]) for name in ALL_COLUMNS}
+        return cls(version, columns, cls._category_bitmaps(columns["desc_categoria_producto"]))
+
+    @staticmethod
+    def _category_bitmaps(column: SnapshotColumn) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Bitmaps de cada categoría a partir de `desc_categoria_producto`.
+
+        Se calculan sobre el diccionario de la columna (cada valor distinto
+        se parte en rutas una sola vez), sin leer la tabla de enlaces,
+        que tiene una fila por cada fila de datos y categoría. El resultado
+        es el mismo que `category_filter`: `exact` son
+        las filas con esa ruta y el subárbol las de esa ruta o cualquier
+        ruta que empiece por ella.
+        """
+        size = len(column.values)
+        order = np.argsort(column.values, kind="stable")
+        sorted_codes = column.values[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(column.dictionary)), side="left")
+        ends = np.searchsorted(sorted_codes, np.arange(len(column.dictionary)), side="right")
+
+        exact_codes: Dict[str, List[int]] = {}
+        subtree_codes: Dict[str, Set[int]] = {}
+        for code, value in enumerate(column.dictionary.tolist()):
+            for path in split_category_paths(value):
+                exact_codes.setdefault(path, []).append(code)
+                prefix = ""
+                for part in path.split("/"):
+                    prefix = f"{prefix}/{part}" if prefix else part
+                    subtree_codes.setdefault(prefix, set()).add(code)
+
+        def bitmap(codes) -> np.ndarray:
+            mask = np.zeros(size, dtype=bool)
+            for code in codes:
+                mask[order[starts[code]:ends[code]]] = True
+            return np.packbits(mask)
+
+        empty = np.packbits(np.zeros(size, dtype=bool))
+        return {
+            path: (bitmap(exact_codes[path]) if path in exact_codes else empty, bitmap(codes))
+            for path, codes in subtree_codes.items()
+        }
+
+    @property
+    def nbytes(self) -> int:
+        columns = sum(column.nbytes for column in self.columns.values())
+        bitmaps = sum(e.nbytes + s.nbytes for e, s in self.category_bitmaps.values())
+        return columns + bitmaps
+
+    def category_mask(self, path: str, match: CategoryMatch = CategoryMatch.DESCENDANTS) -> np.ndarray:
+        """Filas de la categoría (y sus descendientes si `match` lo pide)"""
+        bitmaps = self.category_bitmaps.get(path.strip().strip("/"))
+        if bitmaps is None:
+            return np.zeros(self.size, dtype=bool)
+        bitmap = bitmaps[0] if match == CategoryMatch.EXACT else bitmaps[1]
+        return np.unpackbits(bitmap, count=self.size).astype(bool)
+
+    def points_mask(
+        self,
+        category: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        after: Optional[PageCursor] = None,
+        category_match: CategoryMatch = CategoryMatch.DESCENDANTS,
+    ) -> np.ndarray:
+        """Equivalente en memoria de los filtros de `queries.data_points_query`"""
+        mask = np.ones(self.size, dtype=bool)
+        if category:
+            mask &= self.category_mask(category, category_match)
+        if start_date:
+            mask &= self.dates >= date_id(start_date)
+        if end_date:
+            mask &= self.dates <= date_id(end_date)
+        if after is not None:
+            after_date, after_row = after
+            mask &= (self.dates > after_date) | ((self.dates == after_date) & (self.row_ids > after_row))
+        return mask
+
+    def filters_mask(self, filters: Dict) -> np.ndarray:
+        """Máscara de los filtros `{"columna": {"op": "=", "value": ...}}`"""
+        mask = np.ones(self.size, dtype=bool)
+        for field, condition in filters.items():
+            if condition["op"] in _OPERATORS:
+                mask &= self.columns[field].compare(condition["op"], condition["value"])
+        return mask
+
+    def rows(self, mask: np.ndarray, columns: Sequence[str] = ALL_COLUMNS, limit: Optional[int] = None) -> List[dict]:
+        """Filas de la máscara, en orden de id, con las columnas pedidas"""
+        return self.take(np.flatnonzero(mask)[:limit], columns)
+
+    def batches(
+        self,
+        mask: np.ndarray,
+        batch_size: int,
+        limit: Optional[int] = None,
+        columns: Sequence[str] = ALL_COLUMNS,
+    ) -> Iterator[List[dict]]:
+        """Filas de la máscara en lotes, sin montar todas a la vez"""
+        positions = np.flatnonzero(mask)[:limit]
+        for start in range(0, len(positions), batch_size):
+            yield self.take(positions[start:start + batch_size], columns)
+
+    def take(self, positions: np.ndarray, columns: Sequence[str] = ALL_COLUMNS) -> List[dict]:
+        """Filas de las posiciones indicadas, montadas columna a columna"""
+        values = [self.columns[name].to_list(positions) for name in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def count(self, mask: np.ndarray) -> int:
+        return int(np.count_nonzero(mask))
+
+    def get(self, row_id: int, columns: Sequence[str] = ALL_COLUMNS) -> Optional[dict]:
+        """Fila por `row_id` (búsqueda binaria)"""
+        index = int(np.searchsorted(self._sorted_row_ids, row_id))
+        if index >= self.size or self._sorted_row_ids[index] != row_id:
+            return None
+        positions = self._row_order[index:index + 1]
+        return {name: self.columns[name].to_list(positions)[0] for name in columns}
+
+    def aggregate(self, aggregation: Dict, filters: Dict) -> List[Dict]:
+        """
+        Ejecuta una agregación validada con operaciones vectorizadas.
+
+        Devuelve lo mismo que `build_aggregate_query`: una fila por grupo
+        (los nulos forman su propio grupo), ordenadas por la primera métrica
+        u ordenadas por las columnas de agrupación, y con el mismo límite.
+        """
+        positions = np.flatnonzero(self.filters_mask(filters))
+        group_by = aggregation["group_by"]
+
+        if group_by:
+            # Se combinan los códigos columna a columna y se vuelven a
+            # compactar en cada paso, para que la clave no desborde
+            inverse = np.zeros(len(positions), dtype=np.int64)
+            columns_codes = []
+            for name in group_by:
+                codes, keys = self.columns[name].group_codes(positions)
+                columns_codes.append((codes, keys))
+                inverse, _ = pd.factorize(inverse * len(keys) + codes)
+            # `factorize` numera por orden de aparición: la primera fila de
+            # cada grupo es la que supera a todos los códigos anteriores
+            previous = np.maximum.accumulate(np.concatenate(([-1], inverse[:-1])))
+            first = np.flatnonzero(inverse > previous)
+            group_keys = list(zip(*(
+                [keys[code] for code in codes[first].tolist()] for codes, keys in columns_codes
+            ))) if len(first) else []
+        else:
+            inverse = np.zeros(len(positions), dtype=np.int64)
+            group_keys = [()]
+
+        results = [dict(zip(group_by, key)) for key in group_keys]
+        for metric in aggregation["metrics"]:
+            label = metric_label(metric)
+            for result, value in zip(results, self._metric(metric, positions, inverse, len(group_keys))):
+                result[label] = value
+
+        return self._order_and_limit(results, aggregation)
+
+    def _metric(self, metric: Dict, positions: np.ndarray, inverse: np.ndarray, size: int) -> List:
+        if metric["column"] is None:
+            return np.bincount(inverse, minlength=size).tolist()
+
+        column = self.columns[metric["column"]]
+        valid = column.valid[positions]
+        groups = inverse[valid]
+        counts = np.bincount(groups, minlength=size)
+        name = metric["func"]
+
+        if name == "count":
+            return counts.tolist()
+        if name == "count_distinct":
+            codes, keys = column.group_codes(positions)
+            pairs = np.sort(groups * len(keys) + codes[valid])
+            distinct = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))] if len(pairs) else pairs
+            return np.bincount(distinct // len(keys), minlength=size).tolist()
+
+        if name in ("sum", "avg"):
+            sums = np.bincount(groups, weights=column.values[positions][valid], minlength=size)
+            if name == "avg":
+                values = (sums / np.maximum(counts, 1)).tolist()
+            elif column.python_type is int:
+                values = sums.astype(np.int64).tolist()
+            else:
+                values = sums.tolist()
+        else:
+            keys = column.sort_keys(positions)[valid]
+            if column.dictionary is None and column.python_type is float:
+                keys = keys.astype(np.float64)
+                initial = np.inf if name == "min" else -np.inf
+            else:
+                keys = keys.astype(np.int64)
+                info = np.iinfo(np.int64)
+                initial = info.max if name == "min" else info.min
+            extremes = np.full(size, initial, dtype=keys.dtype)
+            (np.minimum if name == "min" else np.maximum).at(extremes, groups, keys)
+            values = [
+                column.from_sort_key(v) if count else None
+                for v, count in zip(extremes.tolist(), counts.tolist())
+            ]
+
+        # Como en SQL, sin valores no nulos el resultado es NULL
+        return [value if count else None for value, count in zip(values, counts.tolist())]
+
+    @staticmethod
+    def _order_and_limit(results: List[Dict], aggregation: Dict) -> List[Dict]:
+        """Mismo orden y límite que `aggregation.order_and_limit`"""
+        order = aggregation.get("order") or ("desc" if aggregation.get("limit") else None)
+        labels = [metric_label(metric) for metric in aggregation["metrics"]]
+        group_by = aggregation["group_by"]
+
+        if order and labels:
+            first = labels[0]
+            # PostgreSQL pone los NULL al final en ASC y al principio en DESC
+            present = [r for r in results if r[first] is not None]
+            missing = [r for r in results if r[first] is None]
+            present.sort(key=lambda r: r[first], reverse=order == "desc")
+            results = missing + present if order == "desc" else present + missing
+        elif group_by:
+            results.sort(key=lambda r: tuple((r[c] is None, r[c]) for c in group_by))
+
+        return results[:aggregation.get("limit") or MAX_AGGREGATE_ROWS]
+
+
+class SnapshotManager:
+    """
+    Mantiene la copia en memoria vigente.
+
+    La copia nueva se construye aparte y se publica sustituyendo una sola
+    referencia, así que cada petición trabaja con una copia completa (la
+    anterior o la nueva) sin bloqueos. La copia no comprueba la versión
+    por su cuenta: sigue a `DatasetVersionTracker`, que avisa cuando otro
+    proceso (o esta misma carga) publica una versión nueva, y entonces se
+    reconstruye en un hilo.
+    """
+
+    def __init__(self, tracker: DatasetVersionTracker = dataset_versions):
+        self.tracker = tracker
+        self._snapshot: Optional[ColumnarSnapshot] = None
+        self._engine: Optional[Engine] = None
+        self._latest: Optional[int] = None
+        self._refreshing = threading.Lock()
+        tracker.subscribe(self._on_version)
+
+    def refresh(self, engine: Engine) -> ColumnarSnapshot:
+        """Construye una copia nueva y la publica"""
+        self._engine = engine
+        with self._refreshing:
+            return self._load(engine)
+
+    def _load(self, engine: Engine) -> ColumnarSnapshot:
+        start = time.perf_counter()
+        snapshot = ColumnarSnapshot.load(engine)
+        self._snapshot = snapshot
+        logger.info(
+            "✅ Copia en memoria (versión %s): %d filas, %.1f MiB en %.1fs",
+            snapshot.version, snapshot.size, snapshot.nbytes / 2**20, time.perf_counter() - start
+        )
+        return snapshot
+
+    def _on_version(self, version: Optional[int]):
+        self._latest = version
+        snapshot = self._snapshot
+        if snapshot is not None and self._engine is not None and snapshot.version != version:
+            threading.Thread(target=self._catch_up, daemon=True).start()
+
+    def _catch_up(self):
+        """Reconstruye la copia si aún no es de la última versión avisada"""
+        try:
+            with self._refreshing:
+                if self._snapshot.version != self._latest:
+                    self._load(self._engine)
+        except Exception:
+            logger.warning("⚠️ No se pudo actualizar la copia en memoria", exc_info=True)
+
+    def get(self) -> Optional[ColumnarSnapshot]:
+        """Copia vigente; de paso, `tracker` comprueba la versión si le toca"""
+        self.tracker.current()
+        return self._snapshot
+
+
+snapshots = SnapshotManager()
+
+
+def active_snapshot() -> Optional[ColumnarSnapshot]:
+    """
+    Copia en memoria a usar, o None si hay que consultar PostgreSQL
+    (`DATA_ENGINE=postgres` o la copia aún no se ha construido).
+    """
+    if DATA_ENGINE != "memory":
+        return None
+    return snapshots.get()
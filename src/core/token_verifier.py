@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+from jose import JWTError, jwt
+
+# Configuración del verificador
+JWKS_CACHE_TTL = float(os.getenv("JWKS_CACHE_TTL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+JWKS_HTTP_TIMEOUT = float(os.getenv("JWKS_HTTP_TIMEOUT", "5"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+
+class TokenVerifier:
+    """
+    Verifica tokens RS256 localmente con las claves del realm.
+
+    Las claves se obtienen una sola vez del endpoint JWKS (o de un fichero
+    estático) y se cachean por `kid` con TTL. Un `kid` desconocido fuerza
+    un refresco, limitado a uno cada `min_refresh_interval` segundos.
+    Los tokens ya validados se guardan en un LRU hasta su `exp`.
+    """
+
+    def __init__(
+        self,
+        jwks_url: Optional[str] = None,
+        key_file: Optional[str] = None,
+        algorithms: Tuple[str, ...] = ("RS256",),
+        ttl: float = JWKS_CACHE_TTL,
+        min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL,
+        token_cache_size: int = TOKEN_CACHE_SIZE,
+        http_verify=True,
+    ):
+        if not jwks_url and not key_file:
+            raise ValueError("Se necesita jwks_url o key_file")
+        self.jwks_url = jwks_url
+        self.key_file = key_file
+        self.algorithms = list(algorithms)
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.token_cache_size = token_cache_size
+        self.http_verify = http_verify
+
+        self._keys: Dict[Optional[str], object] = {}
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._tokens: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+
+    async def verify(self, token: str) -> dict:
+        """
+        Verifica la firma y la expiración del token y devuelve sus claims.
+
+        Raises:
+            JWTError: Si el token es inválido o no hay clave para su `kid`
+        """
+        cache_key = hashlib.sha256(token.encode()).hexdigest()
+        cached = self._get_cached_token(cache_key)
+        if cached is not None:
+            return cached
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = await self._get_key(kid)
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=self.algorithms,
+            options={"verify_aud": False},
+        )
+        self._store_token(cache_key, claims)
+        return claims
+
+    def clear(self):
+        """Vacía la caché de claves y de tokens validados."""
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._tokens.clear()
+
+    def _get_cached_token(self, cache_key: str) -> Optional[dict]:
+        entry = self._tokens.get(cache_key)
+        if entry is None:
+            return None
+        claims, exp = entry
+        if exp <= time.time():
+            del self._tokens[cache_key]
+            return None
+        self._tokens.move_to_end(cache_key)
+        return claims
+
+    def _store_token(self, cache_key: str, claims: dict):
+        exp = claims.get("exp")
+        if not exp or self.token_cache_size <= 0:
+            return
+        self._tokens[cache_key] = (claims, float(exp))
+        self._tokens.move_to_end(cache_key)
+        while len(self._tokens) > self.token_cache_size:
+            self._tokens.popitem(last=False)
+
+    async def _get_key(self, kid: Optional[str]):
+        now = time.time()
+        if now - self._fetched_at < self.ttl:
+            key = self._lookup(kid)
+            if key is not None:
+                return key
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Otra corrutina pudo refrescar mientras esperábamos el lock
+            key = self._lookup(kid)
+            expired = time.time() - self._fetched_at >= self.ttl
+            if key is not None and not expired:
+                return key
+            if expired or time.time() - self._fetched_at >= self.min_refresh_interval:
+                try:
+                    self._keys = await self._load_keys()
+                except (httpx.HTTPError, OSError):
+                    # Si el IdP no responde seguimos con las claves que ya teníamos
+                    if key is None:
+                        raise
+                    return key
+                self._fetched_at = time.time()
+                key = self._lookup(kid)
+
+        if key is None:
+            raise JWTError(f"No hay clave pública para kid={kid}")
+        return key
+
+    def _lookup(self, kid: Optional[str]):
+        if kid in self._keys:
+            return self._keys[kid]
+        # Una clave PEM estática no tiene kid y sirve para cualquier token
+        return self._keys.get(None)
+
+    async def _load_keys(self) -> Dict[Optional[str], object]:
+        if self.key_file:
+            with open(self.key_file, "r") as f:
+                content = f.read()
+            if content.lstrip().startswith("-----BEGIN"):
+                return {None: content}
+            return self._parse_jwks(json.loads(content))
+
+        async with httpx.AsyncClient(
+            timeout=JWKS_HTTP_TIMEOUT,
+            verify=self.http_verify,
+            headers={"User-Agent": "challenge-api"},
+        ) as client:
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+            return self._parse_jwks(response.json())
+
+    def _parse_jwks(self, jwks: dict) -> Dict[Optional[str], object]:
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if jwk.get("use", "sig") != "sig":
+                continue
+            if jwk.get("alg") and jwk["alg"] not in self.algorithms:
+                continue
+            keys[jwk.get("kid")] = jwk
+        return keys
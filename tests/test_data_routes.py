@@ -0,0 +1,35 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.api.data_service.routes import router
+from src.core.auth import get_current_user
+from src.core.database import get_async_db
+
+
+@pytest.fixture
+def client(data_table, database_url):
+    async_engine = create_async_engine(database_url.set(drivername="postgresql+asyncpg"))
+
+    async def test_db():
+        async with AsyncSession(async_engine) as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/data")
+    app.dependency_overrides[get_async_db] = test_db
+    app.dependency_overrides[get_current_user] = lambda: {"sub": "test"}
+    with TestClient(app) as client:
+        yield client
+
+
+def test_get_data_point_by_row_id(client):
+    response = client.get("/api/data/points/1")
+    assert response.status_code == 200
+    assert response.json()["row_id"] == 1
+
+
+def test_missing_data_point_is_404(client):
+    response = client.get("/api/data/points/999")
+    assert response.status_code == 404
@@ -0,0 +1,46 @@
+import time
+
+from fastapi import Response
+
+from src.api.graphql_service.cost import UserCostLedger, charge_user
+from src.api.graphql_service.persisted import COST_HEADER, PersistedQueryRouter, PersistedQueryStore
+from src.api.graphql_service.schema import schema
+
+
+def test_reading_the_budget_does_not_track_the_user():
+    ledger = UserCostLedger()
+    assert ledger.spent("alice", window=60) == 0
+    assert len(ledger) == 0
+
+
+def test_users_without_cost_in_the_window_are_pruned():
+    ledger = UserCostLedger()
+    ledger.charge("alice", 10, window=0.05)
+    time.sleep(0.1)
+    ledger.charge("bob", 5, window=0.05)
+    assert len(ledger) == 1
+    assert ledger.spent("bob", window=0.05) == 5
+
+
+def test_the_ledger_is_bounded():
+    ledger = UserCostLedger(max_users=2)
+    for subject in ("alice", "bob", "carol"):
+        ledger.charge(subject, 1, window=60)
+    assert len(ledger) == 2
+    assert ledger.spent("alice", window=60) == 0
+
+
+def test_charge_user_rejects_over_budget_without_charging():
+    ledger = UserCostLedger()
+    assert charge_user("alice", 60, max_user_cost=100, window=60, ledger=ledger) == (60, None)
+    spent, error = charge_user("alice", 60, max_user_cost=100, window=60, ledger=ledger)
+    assert spent == 60 and error is not None
+    assert ledger.spent("alice", window=60) == 60
+
+
+def test_cached_responses_are_charged():
+    router = PersistedQueryRouter(schema, store=PersistedQueryStore())
+    cached = Response(b'{"data": {}}', media_type="application/json", headers={COST_HEADER: "60000"})
+    assert router._charge_cached(cached, "cached-user") is cached
+    rejected = router._charge_cached(cached, "cached-user")
+    assert b"coste m" in rejected.body
@@ -0,0 +1,23 @@
+import pytest
+
+from src.api.graphql_service.schema import schema
+
+
+@pytest.mark.anyio
+async def test_get_data_point_by_row_id(graphql_context):
+    result = await schema.execute(
+        "{ getDataPoint(rowId: 2) { rowId idTieFechaValor descGaMarcaProducto } }",
+        context_value=graphql_context
+    )
+    assert result.errors is None
+    assert result.data["getDataPoint"] == {"rowId": 2, "idTieFechaValor": 20240101, "descGaMarcaProducto": "B"}
+
+
+@pytest.mark.anyio
+async def test_deprecated_id_tie_fecha_valor_returns_the_first_point_of_the_date(graphql_context):
+    result = await schema.execute(
+        "{ getDataPoint(idTieFechaValor: 20240101) { rowId descGaMarcaProducto } }",
+        context_value=graphql_context
+    )
+    assert result.errors is None
+    assert result.data["getDataPoint"] == {"rowId": 1, "descGaMarcaProducto": "A"}
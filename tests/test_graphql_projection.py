@@ -0,0 +1,52 @@
+import pytest
+
+from src.api.graphql_service.schema import schema
+
+POINTS = [
+    {"descGaMarcaProducto": "A", "fcProductoCant": 1},
+    {"descGaMarcaProducto": "A", "fcProductoCant": 7},
+    {"descGaMarcaProducto": "B", "fcProductoCant": 3},
+    {"descGaMarcaProducto": "B", "fcProductoCant": 5},
+]
+
+
+@pytest.mark.parametrize("query", [
+    # Fragmento con nombre
+    """
+    { getDataPoints { ...Point } }
+    fragment Point on DataPoint { descGaMarcaProducto fcProductoCant }
+    """,
+    # Fragmento en línea
+    """
+    { getDataPoints { descGaMarcaProducto ... on DataPoint { fcProductoCant } } }
+    """,
+])
+@pytest.mark.anyio
+async def test_fragments_are_resolved(graphql_context, query):
+    result = await schema.execute(query, context_value=graphql_context)
+    assert result.errors is None
+    assert sorted(result.data["getDataPoints"], key=lambda p: tuple(p.values())) == POINTS
+
+
+NODE = {"rowId": 1, "descGaMarcaProducto": "A", "fcProductoCant": 1}
+
+
+@pytest.mark.parametrize("query", [
+    # Fragmento en el nivel de `edges`
+    """
+    { dataPointsConnection(first: 1) { ...Edges } }
+    fragment Edges on DataPointConnection { edges { node { rowId descGaMarcaProducto fcProductoCant } } }
+    """,
+    # Fragmento en línea en el nivel de `node`
+    """
+    { dataPointsConnection(first: 1) { edges { ... on DataPointEdge {
+        node { rowId ...Node }
+    } } } }
+    fragment Node on DataPoint { descGaMarcaProducto fcProductoCant }
+    """,
+])
+@pytest.mark.anyio
+async def test_fragments_are_resolved_along_the_path(graphql_context, query):
+    result = await schema.execute(query, context_value=graphql_context)
+    assert result.errors is None
+    assert result.data["dataPointsConnection"]["edges"] == [{"node": NODE}]
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from src.api.nlp_service import llm_client
+from src.api.nlp_service.llm_client import LLMClient, LLMOverloadedError, OpenAIBackend
+
+COMPLETION = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "fake",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "hola"},
+        "finish_reason": "stop",
+    }],
+}
+
+MESSAGES = [{"role": "user", "content": "ventas de la marca A"}]
+
+
+class FakeCompletionServer:
+    """
+    Servidor compatible con OpenAI que atiende `/v1/chat/completions`.
+
+    `script` indica qué hacer en cada petición: un código de estado HTTP de
+    error o un retardo en segundos antes de responder con `COMPLETION`; sin
+    guion responde al momento.
+    """
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server.requests += 1
+                step = server.script.pop(0) if server.script else 0
+                if isinstance(step, int) and step >= 400:
+                    self._send(step, {"error": {"message": "fallo", "type": "server_error"}})
+                    return
+                time.sleep(step)
+                self._send(200, COMPLETION)
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente canceló la llamada por timeout
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def backend(self) -> OpenAIBackend:
+        return OpenAIBackend(api_key="test", base_url=self.base_url, model="fake")
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def completion_server():
+    servers = []
+
+    def start(*script):
+        servers.append(FakeCompletionServer(script))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def jitter(monkeypatch):
+    """Registra los límites del jitter y no espera"""
+    bounds = []
+
+    def uniform(a, b):
+        bounds.append((a, b))
+        return 0
+
+    monkeypatch.setattr(llm_client.random, "uniform", uniform)
+    return bounds
+
+
+@pytest.mark.anyio
+async def test_transient_errors_are_retried_with_jitter(completion_server, jitter):
+    server = completion_server(500, 503, 500)
+    client = LLMClient(server.backend(), max_retries=3, retry_base_delay=2, retry_max_delay=3)
+
+    assert await client.complete(MESSAGES) == "hola"
+    assert server.requests == 4
+    # Backoff exponencial acotado por retry_max_delay, con "full jitter" desde 0
+    assert jitter == [(0, 2), (0, 3), (0, 3)]
+
+
+@pytest.mark.anyio
+async def test_gives_up_after_max_retries(completion_server, jitter):
+    server = completion_server(500, 500, 500)
+    client = LLMClient(server.backend(), max_retries=1)
+
+    with pytest.raises(openai.InternalServerError):
+        await client.complete(MESSAGES)
+    assert server.requests == 2
+    assert len(jitter) == 1
+
+
+@pytest.mark.anyio
+async def test_client_errors_are_not_retried(completion_server, jitter):
+    server = completion_server(400)
+    client = LLMClient(server.backend(), max_retries=3)
+
+    with pytest.raises(openai.BadRequestError):
+        await client.complete(MESSAGES)
+    assert server.requests == 1
+    assert jitter == []
+
+
+@pytest.mark.anyio
+async def test_each_call_has_its_own_timeout(completion_server, jitter):
+    server = completion_server(1.0, 0)
+    client = LLMClient(server.backend(), timeout=0.2, max_retries=0)
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        await client.complete(MESSAGES)
+    assert time.monotonic() - started < 0.9
+
+    # El timeout cuenta por intento: el siguiente intento responde a tiempo
+    retrying = LLMClient(server.backend(), timeout=0.2, max_retries=1)
+    server.script = [1.0, 0]
+    assert await retrying.complete(MESSAGES) == "hola"
+    assert len(jitter) == 1
+
+
+@pytest.mark.anyio
+async def test_full_queue_raises_overloaded(completion_server):
+    server = completion_server(0.5, 0.5)
+    client = LLMClient(server.backend(), max_concurrency=1, max_queue=1, max_retries=0)
+
+    running = asyncio.ensure_future(client.complete(MESSAGES))
+    await asyncio.sleep(0.1)
+    queued = asyncio.ensure_future(client.complete(MESSAGES))
+    await asyncio.sleep(0.1)
+
+    with pytest.raises(LLMOverloadedError):
+        await client.complete(MESSAGES)
+    assert await asyncio.gather(running, queued) == ["hola", "hola"]
+    assert server.requests == 2
+
+
+@pytest.mark.anyio
+async def test_queue_timeout_raises_overloaded(completion_server):
+    server = completion_server(0.5)
+    client = LLMClient(server.backend(), max_concurrency=1, queue_timeout=0.1, max_retries=0)
+
+    running = asyncio.ensure_future(client.complete(MESSAGES))
+    await asyncio.sleep(0.1)
+    with pytest.raises(LLMOverloadedError):
+        await client.complete(MESSAGES)
+    assert await running == "hola"
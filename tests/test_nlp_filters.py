@@ -0,0 +1,24 @@
+import pytest
+
+from src.api.nlp_service.nlp_processor import nlp_processor
+from src.core.aggregation import InvalidFilterError, filter_clauses
+
+
+def test_filter_values_are_coerced_to_the_column_type():
+    clause, = filter_clauses({"fc_producto_cant": {"op": "between", "value": ["2", "6.0"]}})
+    assert clause.right.clauses[0].value == 2
+    assert clause.right.clauses[1].value == 6
+
+
+@pytest.mark.parametrize("value", ["cinco", "2.5"])
+def test_invalid_filter_values_are_rejected(value):
+    with pytest.raises(InvalidFilterError):
+        filter_clauses({"fc_producto_cant": {"op": ">=", "value": value}})
+
+
+@pytest.mark.anyio
+async def test_numeric_string_filter_runs_on_the_async_session(data_table, async_session):
+    # Los filtros del LLM y de la caché de traducciones llegan como texto
+    filters = {"fc_producto_cant": {"op": ">=", "value": "5"}}
+    result = await async_session.run_sync(nlp_processor._execute, filters, None, 0.9)
+    assert sorted(row["fc_producto_cant"] for row in result["data_points"]) == [5, 7]
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import pytest
+
+from src.core.queries import data_points_query, date_id
+from src.core.serialization import DATA_POINT_COLUMNS, DATA_POINT_FIELDS, data_point_rows
+from src.core.snapshot import ColumnarSnapshot
+
+START = datetime(2024, 1, 2)
+END = datetime(2024, 1, 3, 12, 30)
+
+
+def test_date_id_uses_the_id_tie_fecha_valor_encoding():
+    assert date_id(START) == 20240102
+    assert date_id(END.date()) == 20240103
+    assert date_id(20240105) == 20240105
+
+
+@pytest.mark.anyio
+async def test_postgres_points_filter_by_date(data_table, async_session):
+    stmt = data_points_query(start_date=START, end_date=END, columns=DATA_POINT_COLUMNS)
+    rows = data_point_rows(await async_session.execute(stmt))
+    assert sorted(row["id_tie_fecha_valor"] for row in rows) == [20240102, 20240103]
+
+
+def test_memory_points_filter_by_date(data_table, engine):
+    snapshot = ColumnarSnapshot.load(engine)
+    rows = snapshot.rows(snapshot.points_mask(start_date=START, end_date=END), DATA_POINT_FIELDS)
+    assert [row["id_tie_fecha_valor"] for row in rows] == [20240102, 20240103]
@@ -0,0 +1,54 @@
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, insert
+
+from src.core.dataset_version import VERSION_ROW_ID, DatasetVersionTracker
+from src.core.models import ChallengeData, DatasetVersion
+from src.core.snapshot import SnapshotManager
+
+
+def publish(engine, version: int):
+    with engine.begin() as connection:
+        connection.execute(delete(DatasetVersion))
+        connection.execute(
+            insert(DatasetVersion).values(id=VERSION_ROW_ID, version=version, published_at=datetime.utcnow())
+        )
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.01)
+
+
+def test_snapshot_follows_the_published_version(data_table, engine):
+    publish(engine, 1)
+    tracker = DatasetVersionTracker(check_interval=3600)
+    manager = SnapshotManager(tracker)
+    tracker.refresh(engine)
+    snapshot = manager.refresh(engine)
+    assert snapshot.version == 1
+
+    # Otro proceso carga y publica; el tracker avisa y la copia se reconstruye
+    with engine.begin() as connection:
+        connection.execute(insert(ChallengeData).values(id_tie_fecha_valor=20240104))
+    publish(engine, 2)
+    tracker.refresh(engine)
+    wait_for(lambda: manager.get().version == 2)
+    assert manager.get().size == snapshot.size + 1
+
+
+def test_failed_catch_up_is_logged(data_table, engine, caplog):
+    publish(engine, 1)
+    tracker = DatasetVersionTracker(check_interval=3600)
+    manager = SnapshotManager(tracker)
+    manager.refresh(engine)
+
+    # La reconstrucción corre en un hilo: el fallo solo queda en el log
+    manager._engine = object()
+    tracker.set(2)
+    wait_for(lambda: "No se pudo actualizar la copia en memoria" in caplog.text)
+    assert caplog.records[-1].levelname == "WARNING"
+    assert manager.get().version == 1
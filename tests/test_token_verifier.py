@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError, jwk, jwt
+
+from src.core import token_verifier as token_verifier_module
+from src.core.token_verifier import TokenVerifier
+
+
+def rsa_key_pair():
+    """Clave privada y pública RSA en PEM"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return private, public
+
+
+KEYS = {kid: rsa_key_pair() for kid in ("k1", "k2")}
+
+
+def public_jwk(kid: str) -> dict:
+    return dict(jwk.construct(KEYS[kid][1], "RS256").to_dict(), kid=kid, use="sig")
+
+
+def make_token(kid, exp_in: float = 300, key=None, **claims) -> str:
+    headers = {"kid": kid} if kid else None
+    claims = {"sub": "alice", "exp": int(time.time() + exp_in), **claims}
+    return jwt.encode(claims, key or KEYS[kid][0], algorithm="RS256", headers=headers)
+
+
+class JWKSServer:
+    """Endpoint JWKS local: sirve `kids` y cuenta las peticiones"""
+
+    def __init__(self, kids):
+        self.kids = list(kids)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps({"keys": [public_jwk(kid) for kid in server.kids]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/certs"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeClock:
+    """Sustituye a `time` en el verificador para adelantar el reloj"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def time(self) -> float:
+        return time.time() + self.offset
+
+
+@pytest.fixture
+def jwks_server():
+    server = JWKSServer(["k1"])
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(token_verifier_module, "time", clock)
+    return clock
+
+
+@pytest.mark.anyio
+async def test_unknown_kid_refreshes_the_keys(jwks_server):
+    verifier = TokenVerifier(jwks_url=jwks_server.url, min_refresh_interval=0)
+    assert (await verifier.verify(make_token("k1")))["sub"] == "alice"
+    assert jwks_server.requests == 1
+
+    # El realm rota a una clave nueva: su kid aún no está en la caché
+    jwks_server.kids = ["k1", "k2"]
+    assert (await verifier.verify(make_token("k2")))["sub"] == "alice"
+    assert jwks_server.requests == 2
+
+    # Las dos claves quedan cacheadas
+    await verifier.verify(make_token("k1", sub="bob"))
+    assert jwks_server.requests == 2
+
+
+@pytest.mark.anyio
+async def test_refreshes_for_unknown_kids_are_rate_limited(jwks_server, clock):
+    verifier = TokenVerifier(jwks_url=jwks_server.url, min_refresh_interval=30)
+    await verifier.verify(make_token("k1"))
+    jwks_server.kids = ["k1", "k2"]
+
+    for _ in range(3):
+        with pytest.raises(JWTError):
+            await verifier.verify(make_token("k2"))
+    assert jwks_server.requests == 1
+
+    clock.offset = 31
+    assert (await verifier.verify(make_token("k2")))["sub"] == "alice"
+    assert jwks_server.requests == 2
+
+
+@pytest.mark.anyio
+async def test_validated_tokens_are_cached_until_exp(jwks_server, clock, monkeypatch):
+    verifier = TokenVerifier(jwks_url=jwks_server.url)
+    decoded = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decoded.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(token_verifier_module.jwt, "decode", counting_decode)
+    token = make_token("k1", exp_in=60)
+
+    await verifier.verify(token)
+    await verifier.verify(token)
+    assert len(decoded) == 1
+
+    # Pasado `exp` la entrada del LRU ya no vale y el token se vuelve a verificar
+    clock.offset = 61
+    await verifier.verify(token)
+    assert len(decoded) == 2
+
+
+def test_token_lru_is_bounded():
+    verifier = TokenVerifier(key_file="unused", token_cache_size=2)
+    for i in range(3):
+        verifier._store_token(str(i), {"exp": time.time() + 60})
+    assert list(verifier._tokens) == ["1", "2"]
+
+
+@pytest.mark.anyio
+async def test_static_pem_key_file(tmp_path):
+    key_file = tmp_path / "realm.pem"
+    key_file.write_text(KEYS["k1"][1])
+    verifier = TokenVerifier(key_file=str(key_file))
+
+    assert (await verifier.verify(make_token(None, key=KEYS["k1"][0])))["sub"] == "alice"
+    with pytest.raises(JWTError):
+        await verifier.verify(make_token(None, key=KEYS["k2"][0]))
+
+
+@pytest.mark.anyio
+async def test_static_jwks_file(tmp_path):
+    key_file = tmp_path / "jwks.json"
+    key_file.write_text(json.dumps({"keys": [public_jwk("k1"), public_jwk("k2")]}))
+    verifier = TokenVerifier(key_file=str(key_file))
+
+    assert (await verifier.verify(make_token("k2")))["sub"] == "alice"
+    with pytest.raises(JWTError):
+        await verifier.verify(make_token("k1", exp_in=-10))
@@ -0,0 +1,35 @@
+import pytest
+
+from src.api.nlp_service import translation_cache
+from src.api.nlp_service.translation_cache import TranslationCache
+
+FILTERS = {"filters": {"desc_ga_marca_producto": {"op": "=", "value": "nike"}}}
+
+
+@pytest.mark.anyio
+async def test_paraphrase_is_found_among_many_entries():
+    cache = TranslationCache(similarity_candidates=8, redis_url=None)
+    for i in range(500):
+        await cache.set(f"ventas de la categoria ropa {i}", {"i": i})
+    await cache.set("ventas de la marca nike", FILTERS)
+
+    assert await cache.get("ventas de la marca nikee") == FILTERS
+    assert await cache.get("ventas de la marca puma") is None
+
+
+@pytest.mark.anyio
+async def test_only_the_top_candidates_are_scored(monkeypatch):
+    scored = []
+    same_content = translation_cache._same_content
+
+    def counting_same_content(a, b):
+        scored.append(b)
+        return same_content(a, b)
+
+    monkeypatch.setattr(translation_cache, "_same_content", counting_same_content)
+    cache = TranslationCache(similarity_candidates=8, redis_url=None)
+    for i in range(500):
+        await cache.set(f"ventas de la categoria ropa {i}", {"i": i})
+
+    await cache.get("ventas de la categoria ropa")
+    assert len(scored) == 8